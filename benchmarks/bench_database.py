@@ -0,0 +1,50 @@
+"""
+Write throughput of DatabaseBuilder._store_stations in rows per second.
+
+python benchmarks/bench_database.py [batches] [batch_size]
+"""
+
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import database_builder
+
+
+def stations(batch, batch_size):
+  return [{"stationName": f"Station {batch}-{index}",
+           "stationId": str(batch * batch_size + index).rjust(9, "0"),
+           "lat": "52.000000",
+           "lng": "9.000000",
+           "country": None} for index in range(batch_size)]
+
+
+def rows_per_second(batches, batch_size):
+  with tempfile.TemporaryDirectory() as directory:
+    builder = database_builder.DatabaseBuilder.__new__(database_builder.DatabaseBuilder)
+    builder.sqlite_connection = sqlite3.connect(os.path.join(directory, "stations.db"))
+    all_batches = [stations(batch, batch_size) for batch in range(batches)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+      for batch in all_batches:
+        builder._store_stations(batch)
+    duration = time.perf_counter() - start
+    builder.sqlite_connection.close()
+  return batches * batch_size / duration
+
+
+def benchmarks(batches=20, batch_size=200):
+  """Return {name: rows per second}; higher is better."""
+  return {"db.store_stations": rows_per_second(batches, batch_size)}
+
+
+if __name__ == "__main__":
+  for name, result in benchmarks(*[int(arg) for arg in sys.argv[1:]]).items():
+    print(f"{name:24} {result:10.1f} rows/s")
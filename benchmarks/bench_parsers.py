@@ -0,0 +1,128 @@
+"""
+Throughput of the parser engines, of the collector (fetch + parse) and of the
+parse pipeline (parser processes) in pages per second.
+
+python benchmarks/bench_parsers.py [rounds]
+"""
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import api
+import cache
+import fingerprint
+import parsers
+import ratelimit
+import recording
+from pipeline import ParsePipeline
+
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+
+def load_pages():
+  pages = list()
+  for filename in sorted(os.listdir(FIXTURES)):
+    if filename.endswith(".html"):
+      with open(os.path.join(FIXTURES, filename), encoding="utf-8") as file:
+        pages.append((filename, file.read()))
+  return pages
+
+
+def pages_per_second(engine_name, pages, rounds):
+  """Parse every page rounds-times and return the pages per second."""
+  station = api.Station("recorded", parser=engine_name)
+  station.request_date = "18.10.26"
+  train = api.Train("recorded", parser=engine_name)
+
+  start = time.perf_counter()
+  for _ in range(rounds):
+    for filename, html_document in pages:
+      if filename.startswith("bhftafel_"):
+        station.extract_relevant_data(html_document)
+      else:
+        train.extract_relevant_data(html_document)
+  duration = time.perf_counter() - start
+  return rounds * len(pages) / duration
+
+
+def collector_pages_per_second(engine_name, rounds, repoll=False):
+  """Fetch (replayed fixtures, no cache) and parse boards and their trains.
+
+  repoll: keep the parse memo between rounds (unchanged pages aren't parsed again),
+  otherwise every round parses everything.
+  """
+  response_cache = cache.RESPONSE_CACHE
+  cache.RESPONSE_CACHE = cache.ResponseCache(default_ttl=0, ttls={})
+  limiter = ratelimit.LIMITER
+  ratelimit.LIMITER = ratelimit.RateLimiter(budgets={}, default=(float("inf"), 1))  # replayed: no limit
+  recording.replay(FIXTURES)
+  try:
+    pages = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+      if not repoll:
+        fingerprint.STATION_MEMO.clear()
+        fingerprint.TRAIN_MEMO.clear()
+      for name in ["Isernhagen", "Hannover Hbf"]:
+        station = api.Station(name, parser=engine_name)
+        pages += 1
+        for row in station.data_package:
+          try:
+            api.Train(row.train_url, parser=engine_name).init()
+          except Exception:
+            continue  # only some trains are recorded
+          pages += 1
+    duration = time.perf_counter() - start
+  finally:
+    recording.stop()
+    cache.RESPONSE_CACHE = response_cache
+    ratelimit.LIMITER = limiter
+  return pages / duration
+
+
+class MemoryTrain(api.Train):
+  """Train whose page is already downloaded (url: the page)."""
+
+  def get_data(self, url):
+    return url
+
+
+def pipeline_pages_per_second(parse_workers, pages, rounds):
+  """Parse the train pages in parser processes (no parse memo)."""
+  train_pages = [html_document for filename, html_document in pages if filename.startswith("traininfo_")]
+  pipeline = ParsePipeline(fetch_workers=4, parse_workers=parse_workers, use_memo=False)
+  try:
+    start = time.perf_counter()
+    futures = [pipeline.submit(MemoryTrain(html_document)) for _ in range(rounds) for html_document in train_pages]
+    for future in futures:
+      future.result()
+    duration = time.perf_counter() - start
+  finally:
+    pipeline.close()
+  return len(futures) / duration
+
+
+def benchmarks(rounds=100):
+  """Return {name: pages per second}; higher is better."""
+  results = dict()
+  pages = load_pages()
+  for engine_name in parsers.ENGINES:
+    try:
+      results[f"parse.{engine_name}"] = pages_per_second(engine_name, pages, rounds)
+      results[f"collector.{engine_name}"] = collector_pages_per_second(engine_name, rounds // 4 or 1)
+      results[f"repoll.{engine_name}"] = collector_pages_per_second(engine_name, rounds // 4 or 1, repoll=True)
+    except ImportError as error:
+      print(f"{engine_name} skipped ({error})")
+  # should scale with the cores: compare pipeline.1 and pipeline.<cores>
+  for parse_workers in sorted({1, os.cpu_count() or 1}):
+    results[f"pipeline.{parse_workers}"] = pipeline_pages_per_second(parse_workers, pages, rounds)
+  return results
+
+
+if __name__ == "__main__":
+  for name, result in benchmarks(*[int(arg) for arg in sys.argv[1:]]).items():
+    print(f"{name:24} {result:10.1f} pages/s")
@@ -0,0 +1,83 @@
+"""
+Update throughput of the redis hot state at 10k active trains, in trains per second.
+
+redis.naive: the old pattern (KEYS-scan, whole json get + set, separate round trips)
+redis.hotstate: hotstate.HotState (index set, changed json paths, one pipeline per train)
+
+Runs against fakeredis (in-process), so it counts commands rather than network
+round trips; against a real redis the difference is bigger.
+
+python benchmarks/bench_redis.py [trains]
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import diff
+import hotstate
+from records import Stop, TrainRun
+
+try:
+  import fakeredis
+except ImportError:  # fakeredis is optional
+  fakeredis = None
+
+
+def train_run(index, delay):
+  departure = datetime(2026, 10, 18, 5, 0) + timedelta(seconds=index)
+  route = [Stop(station=f"Station {stop}", planed_arr_time=departure + timedelta(minutes=5 * stop),
+                delayed_arr_time=departure + timedelta(minutes=5 * stop + delay) if stop >= 5 else None)
+           for stop in range(12)]
+  return TrainRun(train_name=f"S {index}", train_date=departure, company="DB Regio AG", route=route)
+
+
+def naive_trains_per_second(trains, updates):
+  client = fakeredis.FakeRedis(decode_responses=True)
+  for index in range(trains):
+    client.json().set(f"train{index}", "$", hotstate.encode_run(train_run(index, 0)))
+  start = time.perf_counter()
+  for index in range(updates):
+    id = f"train{index}"
+    if id in client.keys():
+      old = hotstate.decode_run(client.json().get(id))
+      new = train_run(index, 3)
+      client.json().set(id, "$", hotstate.encode_run(new))
+      client.rpush(f"{id}:events", *[json.dumps(event) for event in diff.encode(diff.diff(old, new))])
+  return updates / (time.perf_counter() - start)
+
+
+def hotstate_trains_per_second(trains, updates):
+  state = hotstate.HotState(fakeredis.FakeRedis(decode_responses=True))
+  snapshots = dict()
+  for index in range(trains):
+    snapshots[f"train{index}"] = train_run(index, 0)
+    state.update(f"train{index}", None, snapshots[f"train{index}"], [])
+  start = time.perf_counter()
+  for index in range(updates):
+    id = f"train{index}"
+    new = train_run(index, 3)
+    state.update(id, snapshots[id], new, diff.diff(snapshots[id], new))
+    snapshots[id] = new
+  return updates / (time.perf_counter() - start)
+
+
+def benchmarks(trains=10000, updates=100):
+  """Return {name: trains per second}; higher is better."""
+  if fakeredis is None:
+    print("redis skipped (needs fakeredis)")
+    return dict()
+  return {
+    "redis.naive": naive_trains_per_second(trains, updates),
+    "redis.hotstate": hotstate_trains_per_second(trains, updates * 5),
+  }
+
+
+if __name__ == "__main__":
+  for name, result in benchmarks(*[int(arg) for arg in sys.argv[1:]]).items():
+    print(f"{name:24} {result:10.1f} trains/s")
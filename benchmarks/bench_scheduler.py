@@ -0,0 +1,67 @@
+"""
+Scheduling throughput in jobs per second, with the pattern of Management.processTrain:
+add every train once, then reschedule it.
+
+schedule.apscheduler: the old way (get_jobs(), then add_job or reschedule_job)
+schedule.heap: scheduler.Scheduler (add with the same id reschedules)
+
+python benchmarks/bench_scheduler.py [jobs]
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from scheduler import Scheduler
+
+
+def job():
+  pass
+
+
+def apscheduler_jobs_per_second(jobs):
+  scheduler = BackgroundScheduler()
+  scheduler.start(paused=True)
+  run_date = datetime.now() + timedelta(hours=1)
+  start = time.perf_counter()
+  for round_ in range(2):  # first round adds, second round reschedules
+    for index in range(jobs):
+      id = f"train{index}"
+      if id in [job.id for job in scheduler.get_jobs()]:
+        scheduler.reschedule_job(job_id=id, trigger="date", run_date=run_date + timedelta(seconds=index))
+      else:
+        scheduler.add_job(job, id=id, trigger="date", run_date=run_date)
+  duration = time.perf_counter() - start
+  scheduler.shutdown(wait=False)
+  return 2 * jobs / duration
+
+
+def heap_jobs_per_second(jobs):
+  scheduler = Scheduler()
+  run_date = datetime.now() + timedelta(hours=1)
+  start = time.perf_counter()
+  for round_ in range(2):
+    for index in range(jobs):
+      scheduler.add(f"train{index}", job, run_at=run_date + timedelta(seconds=index * round_), jitter=5)
+  duration = time.perf_counter() - start
+  scheduler.shutdown()
+  return 2 * jobs / duration
+
+
+def benchmarks(jobs=1000):
+  """Return {name: jobs per second}; higher is better."""
+  return {
+    "schedule.apscheduler": apscheduler_jobs_per_second(jobs),
+    "schedule.heap": heap_jobs_per_second(jobs),
+  }
+
+
+if __name__ == "__main__":
+  for name, result in benchmarks(*[int(arg) for arg in sys.argv[1:]]).items():
+    print(f"{name:24} {result:10.1f} jobs/s")
@@ -0,0 +1,75 @@
+"""
+Run all benchmarks and compare them to the stored baseline.
+
+python benchmarks/run.py                  # fails (exit code 1) on regressions
+python benchmarks/run.py --save-baseline  # store the results as new baseline
+python benchmarks/run.py --tolerance 0.2  # allowed slowdown (default 0.3 = 30 %)
+
+Every benchmark returns a throughput (pages/s, rows/s, jobs/s, trains/s): higher is better.
+The baseline is machine specific, so store one per machine.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+
+import bench_database
+import bench_parsers
+import bench_redis
+import bench_scheduler
+
+BASELINE_FILE = os.path.join(BENCHMARKS_DIRECTORY, "baseline.json")
+SUITES = [bench_parsers, bench_database, bench_scheduler, bench_redis]
+
+
+def run():
+  results = dict()
+  for suite in SUITES:
+    results.update(suite.benchmarks())
+  return results
+
+
+def compare(results, baseline, tolerance):
+  """Return the names of the benchmarks that are slower than the baseline allows."""
+  regressions = list()
+  for name, result in results.items():
+    if name in baseline and result < baseline[name] * (1 - tolerance):
+      regressions.append(name)
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--save-baseline", action="store_true")
+  parser.add_argument("--tolerance", type=float, default=0.3)
+  parser.add_argument("--baseline", default=BASELINE_FILE)
+  args = parser.parse_args(argv)
+
+  results = run()
+  baseline = dict()
+  if os.path.isfile(args.baseline):
+    with open(args.baseline) as file:
+      baseline = json.load(file)
+
+  for name, result in results.items():
+    reference = f"{baseline[name]:10.1f}" if name in baseline else " " * 10
+    print(f"{name:24} {result:10.1f}   baseline {reference}")
+
+  if args.save_baseline:
+    with open(args.baseline, "w") as file:
+      json.dump(results, file, indent=2)
+    print(f"baseline saved to {args.baseline}")
+    return 0
+
+  regressions = compare(results, baseline, args.tolerance)
+  for name in regressions:
+    print(f"REGRESSION: {name} {results[name]:.1f} < {baseline[name]:.1f} - {args.tolerance:.0%}")
+  return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -7,40 +7,180 @@ rt=0 | rt=1  (in the url) -> 0 means no delay info; 1 is the opposite
 rtMode=0 | rtMode=1
 """
 
+import math
 import re
 from datetime import datetime, timedelta
 
-import requests
-from bs4 import BeautifulSoup
+import archive
+import cache
+import fingerprint
+import http_client
+import metrics
+import profiling
+from parsers import get_engine
+from records import BoardEntry, Stop, TrainRun
+
+
+def fetch(method, url, payload=None):
+  """Request a page and archive it (if an archive is configured); raises on error statuses (e.g. 429, 503)."""
+  response = http_client.request(method, url, data=payload)
+  response.raise_for_status()  # an error page is neither cached nor archived
+  archive.store(url, response.text)
+  return response.text
 
 
 class Station:
   """API for https://reiseauskunft.bahn.de/bin/bhftafel.exe/
   
   It doesn't matter if the name is an id or a station name.
+  parser: "html.parser" (default) or "lxml", see parsers.py
+
+  Nothing is fetched on construction: the board is requested and parsed on the
+  first access of data_package and then cached. refresh() polls again.
+  If the board didn't change since the last poll, the last data package is
+  reused (see fingerprint.py) - treat data packages as read-only.
   """
 
-  def __init__(self, name, check_version=False):
+  URL = "https://reiseauskunft.bahn.de/bin/bhftafel.exe/dn?ld=43106&protocol=https:&rt=1&"
+  # the part of the page that is parsed (besides the version in the script)
+  FINGERPRINT_SECTION = ('id="sqResult"', 'class="lastParagraph"', "</p>")
+  MEMO = fingerprint.STATION_MEMO
+  VERSION_MARKER = "digitalData.page.pageInfo.version"
+  # rows per board request when paging (maxJourneys), see service_day
+  MIN_JOURNEYS = 20
+  MAX_JOURNEYS = 200
+
+  def __init__(self, name, check_version=False, parser="html.parser"):
     self.check_version = check_version
+    self.parser = get_engine(parser)
     self.bhftafel_version = None
     self.excess_stations = set()  # TODO: use that somewhere
     self.delayed_causes = set()  # TODO: use that somewhere
     self.name = name
-    request_time_date = datetime.now()
-    self.request_date = request_time_date.strftime("%d.%m.%y")
-    self.request_time = request_time_date.strftime("%H:%M")
-    self.init()
+    self.set_request_time(datetime.now())
+    self.max_journeys = None  # None: the default window of bhftafel
+    self.html_document = None
+    self._data_package = None
+
+  @property
+  def data_package(self):
+    """The parsed board; fetched on first access."""
+    if self._data_package is None:
+      self.fetch()
+    return self._data_package
 
   def init(self):
-    self.html_document = self.get_data()
-    self.data_package = self.extract_relevant_data(self.html_document)
+    """Return the data package (fetches only once, see refresh)."""
     return self.data_package
 
+  def refresh(self):
+    """Request the board again (for now) and return the new data package.
+
+    Responses younger than the cache-ttl are reused, see cache.py.
+    """
+    self.set_request_time(datetime.now())
+    return self.fetch()
+
+  def fetch(self):
+    """Fetch and parse the board for the current request time."""
+    self.html_document = self.get_data()
+    self._data_package = self.parse(self.html_document)
+    return self._data_package
+
+  def parse(self, html_document):
+    """extract_relevant_data, skipped if the board didn't change since the last poll."""
+    def parse_page():
+      with metrics.PARSE_DURATION.time(page="station"), profiling.stage("parse"):
+        return self.parse_page(html_document)
+    parsed = self.MEMO.parse(self.name, self.page_fingerprint(html_document), parse_page)
+    return self.use_parsed(html_document, parsed)
+
+  def page_fingerprint(self, html_document):
+    """Hash of the parsed part of the page, the request date and (with check_version) the version."""
+    version_line = None
+    if self.check_version:
+      start = html_document.find(self.VERSION_MARKER)
+      if start != -1:
+        version_line = html_document[start:html_document.find("\n", start)]
+    return fingerprint.fingerprint(
+      fingerprint.section(html_document, *self.FINGERPRINT_SECTION), self.request_date, version_line)
+
+  def parse_page(self, html_document):
+    """extract_relevant_data and its side results; that is what the parse memo keeps."""
+    data_package = self.extract_relevant_data(html_document)
+    return data_package, self.bhftafel_version, frozenset(self.excess_stations), frozenset(self.delayed_causes)
+
+  def use_parsed(self, html_document, parsed):
+    """Take over the result of parse_page (maybe parsed elsewhere); returns the data package."""
+    data_package, version, excess_stations, delayed_causes = parsed
+    if self.check_version:
+      self.bhftafel_version = version
+    self.excess_stations.update(excess_stations)
+    self.delayed_causes.update(delayed_causes)
+    self.html_document = html_document
+    self._data_package = data_package
+    return data_package
+
+  def set_request_time(self, request_time_date):
+    self.request_date = request_time_date.strftime("%d.%m.%y")
+    self.request_time = request_time_date.strftime("%H:%M")
+
+  def service_day(self, start=None, end=None):
+    """All departures from start (default: now) to end (default: the next midnight).
+
+    Pages through the board by moving the request time forward: every window
+    starts at the last planed time of the previous one (rows of that minute
+    are deduplicated), and its size (maxJourneys) is estimated from the row
+    density seen so far, so that the rest of the day needs as few requests
+    as possible. A minute that fills a whole window is requested again with
+    MAX_JOURNEYS. Dates come from extract_relevant_data (also across midnight).
+    Returns the BoardEntries sorted by planed time; self.page_requests counts
+    the board requests.
+    """
+    start = (start or datetime.now()).replace(second=0, microsecond=0)
+    end = end or datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+    entries = dict()
+    self.page_requests = 0
+    self.max_journeys = self.MIN_JOURNEYS
+    window_start = start
+    while window_start < end:
+      self.set_request_time(window_start)
+      rows = [row for row in self.fetch() if row.planed_time >= window_start]
+      self.page_requests += 1
+      for row in rows:
+        if row.planed_time < end:
+          entries.setdefault((row.train_name, row.planed_time), row)
+      if not rows:
+        break
+      last_planed_time = max(row.planed_time for row in rows)
+      if last_planed_time <= window_start:
+        if len(rows) >= self.max_journeys and self.max_journeys < self.MAX_JOURNEYS:
+          # a full window in one minute: the same minute again with the largest window
+          self.max_journeys = self.MAX_JOURNEYS
+          continue
+        # more than MAX_JOURNEYS departures in one minute: go on with the next minute
+        window_start += timedelta(minutes=1)
+        continue
+
+      # rows per minute -> rows needed for the rest of the day (+10 %)
+      minutes = (last_planed_time - window_start).total_seconds() / 60
+      remaining_minutes = (end - last_planed_time).total_seconds() / 60
+      journeys = math.ceil(len(rows) / minutes * remaining_minutes * 1.1)
+      self.max_journeys = max(self.MIN_JOURNEYS, min(self.MAX_JOURNEYS, journeys))
+      window_start = last_planed_time
+    self.max_journeys = None
+    return sorted(entries.values(), key=lambda row: row.planed_time)
+
   def get_data(self):
     """Craft post-body and fetch data.
 
     TODO: also possible to get data with a get request. what is better?
     """
+    payload = self.payload()
+    return cache.RESPONSE_CACHE.get_or_fetch("POST", self.URL, payload, lambda: fetch("POST", self.URL, payload))
+
+  def payload(self):
+    """Post-body for the bhftafel request."""
     payload = {
       "input": self.name,
       "date": self.request_date,
@@ -58,57 +198,45 @@ class Station:
       "GUIREQProduct_9": "on",  # Anruf-Sammeltaxi
       "start": "Suchen"
     }
-
-    url = "https://reiseauskunft.bahn.de/bin/bhftafel.exe/dn?ld=43106&protocol=https:&rt=1&"
-
-    response = requests.post(url, data=payload)
-    return response.text
+    if self.max_journeys is not None:
+      payload["maxJourneys"] = str(self.max_journeys)
+    return payload
   
   def extract_relevant_data(self, html_document):
-
-    parsed_html = BeautifulSoup(html_document, "html.parser")
-    # TODO: for speed look into lxml as a parser and using css-selectors
+    page = self.parser.station_page(html_document)
 
     if self.check_version:
-      meta_page_info = "".join(parsed_html.find("script").stripped_strings)
-      for line in meta_page_info:
+      version = None
+      for line in page["script"].splitlines():
         line = line.strip()
         if line.startswith("digitalData.page.pageInfo.version"):
-          version = line.split("=")[-1].strip(' "')
+          version = line.split("=")[-1].strip(' ";')
       self.bhftafel_version = version
 
     # do we have to dates? i.e. do we have to account for the change 
-    dates_text = "".join(parsed_html.find("div", id="sqResult").h2.strong.stripped_strings)
-    dates = re.findall(r"\d{2}.\d{2}.\d{2}", dates_text)
+    dates = re.findall(r"\d{2}.\d{2}.\d{2}", page["dates_text"])
     two_dates = len(dates) > 0
 
     # create a list of stations that are also present (but that I didn't ask for)
-    other_stations_text = parsed_html.find("p", "lastParagraph").find_all("a")
-    other_stations = ["".join(a.stripped_strings) for a in other_stations_text]
+    other_stations = page["other_stations"]
     self.excess_stations.update(other_stations)
 
-    all_rows = parsed_html.find_all("tr", id=re.compile("^journeyRow_\d+"))
+    all_rows = page["rows"]
     planed_time_before = None
     data_packages = list()
 
     for row in reversed(all_rows):
       # do platform in the beginning because the row might not belong to the requested station #
-      platform_number = None
-      platform_text = row.find("td", "platform")
+      platform_number = row["platformNumber"]
+      platform_text = row["platform"]
       if platform_text is not None:
-        platform_number = platform_text.find("strong")
-        platform_text = "".join(platform_text.stripped_strings)
         if platform_number is not None:
-          platform_number = "".join(platform_number.stripped_strings)
           platform_text = platform_text.replace(platform_number, "")
         platform = platform_text.lstrip(" -")
         if platform and platform in other_stations:
           continue
 
-      data_package = dict()
-      data_package["platformNumber"] = platform_number
-
-      planed_time = str(row.find("td", "time").string)
+      planed_time = row["time"]
       if two_dates:
         planed_time = datetime.strptime(planed_time + " " + dates[-1], "%H:%M %d.%m.%y")
         if planed_time_before is not None:
@@ -119,37 +247,18 @@ class Station:
         planed_time = datetime.strptime(planed_time + " " + self.request_date, "%H:%M %d.%m.%y")
       
       planed_time_before = planed_time
-      data_package["planedTime"] = planed_time
 
-      transportation_type_pic_url = row.find("td", "train").a.img["src"]
+      transportation_type_pic_url = row["transportationTypePic"]
       transportation_type = re.search("(?<=/)[a-z_]+(?=_\d+x\d+.[a-z]+$)", transportation_type_pic_url).group()
 
-      data_package["transportationType"] = transportation_type
+      train_url = "https://reiseauskunft.bahn.de" + row["trainHref"]
 
-      train_name_field = row.find_all("td", "train")[-1]
-      train_url = "https://reiseauskunft.bahn.de" + str(train_name_field.a["href"])
+      train_name = [re.compile(r"\s+").sub(" ", word) for word in row["trainName"]]
+      train_name = " ".join(train_name)
 
-      data_package["trainUrl"] = train_url
+      endstation = row["endstation"]
 
-      train_name = [re.compile(r"\s+").sub(" ", word) for word in train_name_field.stripped_strings]
-      train_name = " ".join(train_name)
-      data_package["trainName"] = train_name
-
-      route = row.find("td", "route")
-      endstation = "".join(route.span.a.stripped_strings)
-      data_package["endstation"] = endstation
-
-      # sometimes there is extra info (mostly in red) in the route-box
-      extra_info = route.find("div")
-      if extra_info is not None:
-        extra_infos = list()
-        while route.find("div"):
-          extra_info = route.div.extract()
-          extra_infos.append(extra_info)
-
-      # TODO: what do I do with this information?
-          
-      partial_route_raw = " - ".join([all_stops.replace("\n", " ") for all_stops in route.stripped_strings][1:])
+      partial_route_raw = " - ".join([all_stops.replace("\n", " ") for all_stops in row["route"]][1:])
       partial_route_raw = [stop.lstrip("- ") for stop in re.split(r"(?<=\d{2}:\d{2})", partial_route_raw) if len(stop) != 0]
       partial_route_raw = [stop.split("  ") for stop in partial_route_raw]
       partial_route = list()
@@ -160,17 +269,12 @@ class Station:
         if current_station_datetime > planed_time_at_station_x:
           planed_time_at_station_x += timedelta(days=1)
         current_station_datetime = planed_time_at_station_x
-        partial_route.append([stop, planed_time_at_station_x])
+        partial_route.append((stop, planed_time_at_station_x))
         stop = stop.removesuffix(" (Halt entfällt)")
         self.excess_stations.update([stop])
 
-      data_package["partialRoute"] = partial_route
-
-
       # delayedBy, delayedTime, delayedCause, canceled
-      data_package["issues"] = dict()
-      issues = row.find("td", "ris")
-      issues_text = "".join(issues.stripped_strings)
+      issues_text = row["issues"]
       delayed_time = None
       delayed_by = None
       cause = None
@@ -198,39 +302,97 @@ class Station:
           self.delayed_causes.update([cause])
         else:
           cause = None
-      data_package["issues"]["delayedTime"] = delayed_time
-      data_package["issues"]["delayedBy"] = delayed_by
-      data_package["issues"]["cause"] = cause
-      data_package["issues"]["canceled"] = canceled
 
-      data_packages.append(data_package)
+      data_packages.append(BoardEntry(
+        planed_time=planed_time,
+        train_name=train_name,
+        train_url=train_url,
+        transportation_type=transportation_type,
+        endstation=endstation,
+        platform_number=platform_number,
+        partial_route=partial_route,
+        delayed_time=delayed_time,
+        delayed_by=delayed_by,
+        cause=cause,
+        canceled=canceled,
+      ))
       
     return [i for i in reversed(data_packages)]
       
 
 class Train:
-  """API for https://reiseauskunft.bahn.de/bin/traininfo.exe/"""
-  def __init__(self, url):
-    self.url = url
-    self.init()
+  """API for https://reiseauskunft.bahn.de/bin/traininfo.exe/
   
+  parser: "html.parser" (default) or "lxml", see parsers.py
+
+  Nothing is fetched on construction: the page is requested and parsed on the
+  first access of data_package and then cached. refresh() polls again.
+  Unchanged pages aren't parsed again, see Station.
+  """
+
+  FINGERPRINT_SECTION = ('class="tqResults"', 'class="ris"', "</div>")
+  MEMO = fingerprint.TRAIN_MEMO
+
+  def __init__(self, url, parser="html.parser"):
+    self.url = url
+    self.parser = get_engine(parser)
+    self.data = None
+    self._data_package = None
+
+  @property
+  def data_package(self):
+    """The parsed train page; fetched on first access."""
+    if self._data_package is None:
+      self.refresh()
+    return self._data_package
+
   def init(self):
-    self.data = self.get_data(self.url)
-    self.data_package = self.extract_relevant_data(self.data)
+    """Return the data package (fetches only once, see refresh)."""
     return self.data_package
 
+  def refresh(self):
+    """Request the train page again and return the new data package.
+
+    Responses younger than the cache-ttl are reused, see cache.py.
+    """
+    self.data = self.get_data(self.url)
+    self._data_package = self.parse(self.data)
+    return self._data_package
+
+  def parse(self, data):
+    """extract_relevant_data, skipped if the train page didn't change since the last poll."""
+    def parse_page():
+      with metrics.PARSE_DURATION.time(page="train"), profiling.stage("parse"):
+        return self.parse_page(data)
+    parsed = self.MEMO.parse(self.url, self.page_fingerprint(data), parse_page)
+    return self.use_parsed(data, parsed)
+
+  def page_fingerprint(self, data):
+    return fingerprint.fingerprint(fingerprint.section(data, *self.FINGERPRINT_SECTION))
+
+  def parse_page(self, data):
+    return self.extract_relevant_data(data)
+
+  def use_parsed(self, data, parsed):
+    self.data = data
+    self._data_package = parsed
+    return parsed
+
   def get_data(self, url):
+    url = self.realtime_url(url)
+    return cache.RESPONSE_CACHE.get_or_fetch("GET", url, None, lambda: fetch("GET", url))
+
+  @staticmethod
+  def realtime_url(url):
+    """Make sure the delay info is part of the response."""
     url = re.sub(r"rt=0", "rt=1", url)
     url = re.sub(r"rtMode=0", "rtMode=1", url)
-    response = requests.get(url)
-    return response.text
+    return url
 
   def extract_relevant_data(self, data):
-    parsed_html = BeautifulSoup(data, "html.parser")
-
-    data_package = dict()
+    page = self.parser.train_page(data)
 
-    *company_raw, = parsed_html.find("div", "tqRemarks").stripped_strings
+    company_raw = page["remarks"]
     for entry in company_raw:
       if re.match(r"^Betreiber:", entry):
         company = entry.removeprefix("Betreiber:").strip()
@@ -238,33 +400,23 @@ class Train:
       else:
         company = None
 
-    data_package["company"] = company
-
-    train_name_text = parsed_html.find("div", class_="tqResults").find_next("h1").string
+    train_name_text = page["title"]
     train_name = " ".join(train_name_text.split()[2:])
 
-    data_package["trainName"] = train_name
-
-    train_date_text = str(parsed_html.find("h3", class_="trainroute"))
+    train_date_text = page["trainroute"]
     train_date = re.search(r"\d{1,2}.\d{1,2}.\d{1,2}", train_date_text).group()
     train_date = datetime.strptime(train_date, "%d.%m.%y")
-    data_package["trainDate"] = train_date
 
-    route_rows = parsed_html.find_all("div", class_=re.compile(r"tqRow trainrow_\d"))
+    route_rows = page["rows"]
     planed_current_date = train_date
     delayed_current_date = train_date
-    data_package["route"] = dict()
-    for index, row in enumerate(route_rows):
-      data_package["route"][index] = dict()
-
-      station = row.find("div", class_=re.compile("station")).find("a").string
-      data_package["route"][index]["station"] = station
+    route = list()
+    for row in route_rows:
+      station = row["station"]
 
       # Planed and delayed arrival time.
-      arrival = row.find("div", class_="arrival")
-
       arrival_time = None
-      arrival_time_raw = [string_ for string_ in arrival.stripped_strings if re.search(r"\d{1,2}:\d{2}", string_)]
+      arrival_time_raw = [string_ for string_ in row["arrival"] if re.search(r"\d{1,2}:\d{2}", string_)]
       if len(arrival_time_raw) > 0:
         arrival_time = arrival_time_raw[0].split(" ")[-1]
       if arrival_time:
@@ -274,8 +426,6 @@ class Train:
           arrival_time += timedelta(days=1)
         planed_current_date = arrival_time
 
-      data_package["route"][index]["planedArrTime"] = arrival_time
-
       delayed_arrival_time = None
       if len(arrival_time_raw) > 1:
         delayed_arrival_time = arrival_time_raw[-1]
@@ -287,12 +437,9 @@ class Train:
         delayed_current_date = delayed_arrival_time
       else:
         delayed_current_date = arrival_time if arrival_time is not None else delayed_current_date
-      data_package["route"][index]["delayedArrTime"] = delayed_arrival_time
 
       # Planed and delayed departure time.
-      departure = row.find("div", class_="departure")
-      
-      departure_time_raw = [string_ for string_ in departure.stripped_strings if re.search(r"\d{1,2}:\d{2}", string_)]
+      departure_time_raw = [string_ for string_ in row["departure"] if re.search(r"\d{1,2}:\d{2}", string_)]
       departure_time = None
       if len(departure_time_raw) > 0:
         departure_time = departure_time_raw[0].split(" ")[-1]
@@ -302,7 +449,6 @@ class Train:
         if departure_time < planed_current_date:
           departure_time += timedelta(days=1)
         planed_current_date = departure_time
-      data_package["route"][index]["planedDepTime"] = departure_time
 
       delayed_departure_time = None
       if len(departure_time_raw) > 1:
@@ -315,26 +461,31 @@ class Train:
         delayed_current_date = delayed_departure_time
       else:
         delayed_current_date = departure_time if departure_time is not None else departure_time
-      data_package["route"][index]["delayedDepTime"] = delayed_departure_time
 
-      platform_raw = row.find("div", class_="platform")
-      platform_raw = list(platform_raw.stripped_strings)
+      platform_raw = row["platform"]
       platform = None
       if len(platform_raw) > 1 and re.search("\d+", platform_raw[-1]) is not None:
         platform = platform_raw[-1]
 
-      data_package["route"][index]["platform"] = platform
-
-      issues_raw = row.find("div", class_="ris")
-      *issues, = issues_raw.stripped_strings
-      data_package["route"][index]["issues"] = dict()
-      data_package["route"][index]["issues"]["canceled"] = "Halt entfällt" in issues
+      issues = list(row["issues"])
+      canceled = "Halt entfällt" in issues
       issues = [string_ for string_ in issues if string_ not in ["Aktuelles", "Halt entfällt"]]
-      data_package["route"][index]["issues"]["cause"] = issues[0] if len(issues) > 0 else None
+      cause = issues[0] if len(issues) > 0 else None
+
+      route.append(Stop(
+        station=station,
+        planed_arr_time=arrival_time,
+        delayed_arr_time=delayed_arrival_time,
+        planed_dep_time=departure_time,
+        delayed_dep_time=delayed_departure_time,
+        platform=platform,
+        canceled=canceled,
+        cause=cause,
+      ))
 
     # TODO: use excessStations here as well 
 
-    return data_package
+    return TrainRun(train_name=train_name, train_date=train_date, company=company, route=route)
 
 
 
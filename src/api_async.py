@@ -0,0 +1,173 @@
+"""
+asyncio variants of api.Station and api.Train.
+
+All requests go through one AsyncClient (one aiohttp session) that bounds the
+number of requests in flight and applies a timeout to every single request.
+The parsing is the same as in api.py.
+
+  async with AsyncClient(concurrency=200, timeout=20) as client:
+    stations = await client.stations(["Isernhagen", "Hannover Hbf"])
+    urls = [row.train_url for station in stations for row in station.data_package]
+    trains = await client.trains(urls)
+
+Needs aiohttp.
+"""
+
+import asyncio
+import time
+
+try:
+  import aiohttp
+except ImportError:  # aiohttp is optional
+  aiohttp = None
+
+import archive
+import cache
+import http_client
+import metrics
+import ratelimit
+from api import Station, Train
+
+
+class AsyncStation(Station):
+  """Station that is fetched with AsyncClient.fetch(...)."""
+
+  def fetch(self):
+    raise RuntimeError("AsyncStation is fetched with AsyncClient.fetch(...)")
+
+  def request(self):
+    return "POST", self.URL, self.payload()
+
+  def memo_key(self):
+    return self.name
+
+
+class AsyncTrain(Train):
+  """Train that is fetched with AsyncClient.fetch(...)."""
+
+  def refresh(self):
+    raise RuntimeError("AsyncTrain is fetched with AsyncClient.fetch(...)")
+
+  def request(self):
+    return "GET", self.realtime_url(self.url), None
+
+  def memo_key(self):
+    return self.url
+
+
+class AsyncClient:
+  """Fetch and parse many boards and train pages concurrently on one event loop.
+
+  concurrency: max. number of requests in flight
+  timeout: seconds per request (connect + read)
+  parser: parser engine for all pages, see parsers.py
+  executor: optional concurrent.futures executor for the parsing;
+    default is parsing on the event loop
+  use_cache: go through cache.RESPONSE_CACHE; identical requests in flight
+    are coalesced
+  """
+
+  def __init__(self, concurrency=50, timeout=30, parser="html.parser", executor=None, use_cache=True):
+    if aiohttp is None:
+      raise ImportError("AsyncClient needs aiohttp: pip install aiohttp")
+    self.concurrency = concurrency
+    self.timeout = timeout
+    self.parser = parser
+    self.executor = executor
+    self.use_cache = use_cache
+    self.session = None
+    self._semaphore = None
+    self._pending = dict()  # cache key -> task
+
+  async def __aenter__(self):
+    await self.open()
+    return self
+
+  async def __aexit__(self, *exc_info):
+    await self.close()
+
+  async def open(self):
+    self._semaphore = asyncio.Semaphore(self.concurrency)
+    connector = aiohttp.TCPConnector(limit=self.concurrency)
+    self.session = aiohttp.ClientSession(connector=connector, headers=http_client.HEADERS)
+
+  async def close(self):
+    if self.session is not None:
+      await self.session.close()
+    self.session = None
+
+  async def request(self, method, url, data=None):
+    """Return the response text (cached or coalesced if possible)."""
+    if not self.use_cache:
+      return await self._send(method, url, data)
+    key = cache.RESPONSE_CACHE.key(method, url, data)
+    text = cache.RESPONSE_CACHE.lookup(key)
+    if text is not None:
+      return text
+    task = self._pending.get(key)
+    if task is None:
+      task = asyncio.ensure_future(self._send(method, url, data))
+      task.add_done_callback(lambda task: self._finished(key, url, task))
+      self._pending[key] = task
+    return await asyncio.shield(task)
+
+  def _finished(self, key, url, task):
+    del self._pending[key]
+    if not task.cancelled() and task.exception() is None:
+      cache.RESPONSE_CACHE.store(key, url, task.result())
+
+  async def _send(self, method, url, data=None):
+    timeout = aiohttp.ClientTimeout(total=self.timeout)
+    await ratelimit.LIMITER.acquire_async(url)
+    endpoint = metrics.endpoint(url)
+    async with self._semaphore:
+      start = time.perf_counter()
+      try:
+        async with self.session.request(method, url, data=data, timeout=timeout) as response:
+          text = await response.text()
+      except (aiohttp.ClientError, asyncio.TimeoutError):
+        metrics.HTTP_RESPONSES.inc(endpoint=endpoint, status="error")
+        ratelimit.LIMITER.feedback(url)
+        raise
+    metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+    metrics.HTTP_RESPONSES.inc(endpoint=endpoint, status=str(response.status))
+    ratelimit.LIMITER.feedback(url, response.status, empty=len(text) == 0, retry_after=response.headers.get("Retry-After"))
+    if response.status >= 400:  # an error page is neither cached nor archived
+      raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status,
+                                        message=response.reason or "", headers=response.headers)
+    archive.store(url, text)
+    return text
+
+  async def fetch(self, api_object):
+    """Fetch and parse an AsyncStation or AsyncTrain; returns its data package."""
+    html_document = await self.request(*api_object.request())
+    if self.executor is None:
+      return api_object.parse(html_document)
+    # like pipeline.py: unchanged pages come from the parse memo, the rest is parsed in the
+    # executor; parse_page returns the side results (version, ...) as well, a process pool
+    # sets them on a copy of api_object only
+    page_fingerprint = api_object.page_fingerprint(html_document)
+    parsed = api_object.MEMO.lookup(api_object.memo_key(), page_fingerprint)
+    if parsed is None:
+      loop = asyncio.get_running_loop()
+      parsed = await loop.run_in_executor(self.executor, api_object.parse_page, html_document)
+      api_object.MEMO.store(api_object.memo_key(), page_fingerprint, parsed)
+    return api_object.use_parsed(html_document, parsed)
+
+  async def station(self, name, check_version=False):
+    station = AsyncStation(name, check_version=check_version, parser=self.parser)
+    await self.fetch(station)
+    return station
+
+  async def train(self, url):
+    train = AsyncTrain(url, parser=self.parser)
+    await self.fetch(train)
+    return train
+
+  async def stations(self, names, return_exceptions=True):
+    """Fetch all stations concurrently. Failed requests are returned as exceptions."""
+    return await asyncio.gather(*[self.station(name) for name in names], return_exceptions=return_exceptions)
+
+  async def trains(self, urls, return_exceptions=True):
+    """Fetch all trains concurrently. Failed requests are returned as exceptions."""
+    return await asyncio.gather(*[self.train(url) for url in urls], return_exceptions=return_exceptions)
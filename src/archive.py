@@ -0,0 +1,216 @@
+"""
+Archive for the raw html pages (bhftafel, traininfo).
+
+- content-addressed: a page is stored once per sha256; every fetch of it is
+  only a row in the index (time, url, digest)
+- compressed with zstd; once a dictionary is trained (train_dictionary) all new
+  pages use it - the pages are very repetitive, so that makes a big difference.
+  It is trained automatically after train_after pages without one, and again
+  with the first page of a new day, if train_after pages used the old one
+  (e.g. after a layout change)
+- append-only daily segment files, e.g. archive/2026-10-18.seg:
+    [32 bytes sha256][4 bytes length][zstd frame] [32 bytes sha256]...
+  they can be streamed back without the index (iter_segment)
+- index.db (sqlite): pages(digest, segment, offset, length), fetches(fetchedAt, url, digest)
+
+Needs zstandard. api.py archives every fetched page, if an archive is
+configured: archive.configure("archive").
+"""
+
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+from datetime import datetime
+
+try:
+  import zstandard
+except ImportError:  # zstandard is optional
+  zstandard = None
+
+
+RECORD_HEADER = struct.Struct(">32sI")
+DICTIONARY_SIZE = 112640
+TRAIN_AFTER = 2000  # pages (see module doc); None: only train_dictionary() trains
+COMPRESSION_LEVEL = 9
+
+
+class Archive:
+  """Content-addressed, zstd-compressed store of raw pages in daily segments."""
+
+  def __init__(self, path, train_after=TRAIN_AFTER):
+    if zstandard is None:
+      raise ImportError("the archive needs zstandard: pip install zstandard")
+    self.path = path
+    os.makedirs(path, exist_ok=True)
+    self._lock = threading.Lock()
+    self._index = sqlite3.connect(os.path.join(path, "index.db"), check_same_thread=False)
+    self._index.executescript("""
+      CREATE TABLE if not exists pages(digest BLOB PRIMARY KEY, segment TEXT, offset INTEGER, length INTEGER, dictId INTEGER);
+      CREATE TABLE if not exists fetches(fetchedAt TEXT, url TEXT, digest BLOB);
+      CREATE INDEX if not exists fetches_fetchedAt ON fetches(fetchedAt);
+    """)
+    self._index.commit()
+    self._dictionaries = dict()  # dict_id -> ZstdCompressionDict
+    self._compressor = None
+    self._dict_id = 0  # of the new pages, 0: no dictionary
+    self._load_dictionaries()
+    self.train_after = train_after
+    self._training = False
+    self._segment = max(self.segments(), default=None)
+    self._pages_since_training = self._index.execute("SELECT COUNT(*) FROM pages WHERE dictId = ?", (self._dict_id,)).fetchone()[0]
+
+  def _dictionary_path(self, dict_id):
+    return os.path.join(self.path, f"{dict_id}.zdict")
+
+  def _load_dictionaries(self):
+    newest = (0, None)  # the newest dictionary is used for new pages
+    for filename in os.listdir(self.path):
+      if filename.endswith(".zdict"):
+        filepath = os.path.join(self.path, filename)
+        with open(filepath, "rb") as file:
+          dictionary = zstandard.ZstdCompressionDict(file.read())
+        self._dictionaries[dictionary.dict_id()] = dictionary
+        if os.path.getmtime(filepath) >= newest[0]:
+          newest = (os.path.getmtime(filepath), dictionary)
+    self._use_dictionary(newest[1])
+
+  def _use_dictionary(self, dictionary):
+    if dictionary is None:
+      self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+      self._dict_id = 0
+    else:
+      self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dictionary, write_dict_id=True)
+      self._dict_id = dictionary.dict_id()
+
+  def _decompressor(self, frame):
+    dict_id = zstandard.get_frame_parameters(frame).dict_id
+    if dict_id == 0:
+      return zstandard.ZstdDecompressor()
+    return zstandard.ZstdDecompressor(dict_data=self._dictionaries[dict_id])
+
+  def put(self, url, html_document, fetched_at=None):
+    """Archive a fetched page and return its digest (hex)."""
+    fetched_at = fetched_at or datetime.now()
+    raw = html_document.encode("utf-8")
+    digest = hashlib.sha256(raw).digest()
+    segment = fetched_at.strftime("%Y-%m-%d") + ".seg"
+    with self._lock:
+      new_day = self._segment is not None and segment > self._segment
+      self._segment = max(segment, self._segment or segment)
+    if self._should_train(new_day):
+      self._train_automatically()
+    with self._lock:
+      known = self._index.execute("SELECT 1 FROM pages WHERE digest = ?", (digest,)).fetchone()
+      if known is None:
+        frame = self._compressor.compress(raw)
+        with open(os.path.join(self.path, segment), "ab") as file:
+          file.write(RECORD_HEADER.pack(digest, len(frame)))
+          offset = file.tell()
+          file.write(frame)
+        dict_id = zstandard.get_frame_parameters(frame).dict_id
+        self._index.execute("INSERT INTO pages VALUES(?, ?, ?, ?, ?)", (digest, segment, offset, len(frame), dict_id))
+        self._pages_since_training += 1
+      self._index.execute("INSERT INTO fetches VALUES(?, ?, ?)", (fetched_at.isoformat(), url, digest))
+      self._index.commit()
+    if self._should_train():
+      self._train_automatically()
+    return digest.hex()
+
+  def _should_train(self, new_day=False):
+    """Train now? Without a dictionary after train_after pages, with one on a new day (see module doc)."""
+    with self._lock:
+      if not self.train_after or self._training or self._pages_since_training < self.train_after:
+        return False
+      if self._dict_id != 0 and not new_day:
+        return False
+      self._training = True
+      return True
+
+  def _train_automatically(self):
+    try:
+      self.train_dictionary(sample_count=self.train_after)
+    except zstandard.ZstdError as error:  # e.g. too few distinct samples, it is tried again later
+      print(f"archive: no dictionary trained: {error}")
+      with self._lock:
+        self._pages_since_training = 0
+    finally:
+      with self._lock:
+        self._training = False
+
+  def get(self, digest):
+    """Return the page for a digest (hex) or None."""
+    with self._lock:
+      row = self._index.execute("SELECT segment, offset, length FROM pages WHERE digest = ?", (bytes.fromhex(digest),)).fetchone()
+    if row is None:
+      return None
+    segment, offset, length = row
+    with open(os.path.join(self.path, segment), "rb") as file:
+      file.seek(offset)
+      frame = file.read(length)
+    return self._decompressor(frame).decompress(frame).decode("utf-8")
+
+  def fetches(self, start=None, end=None):
+    """Return (fetchedAt, url, digest) of all fetches in [start, end)."""
+    query = "SELECT fetchedAt, url, digest FROM fetches WHERE fetchedAt >= ? AND fetchedAt < ? ORDER BY fetchedAt"
+    start = start.isoformat() if start else ""
+    end = end.isoformat() if end else "9999"
+    with self._lock:
+      rows = self._index.execute(query, (start, end)).fetchall()
+    return [(datetime.fromisoformat(fetched_at), url, digest.hex()) for fetched_at, url, digest in rows]
+
+  def segments(self):
+    return sorted(filename for filename in os.listdir(self.path) if filename.endswith(".seg"))
+
+  def iter_segment(self, segment):
+    """Stream (digest, page) of a segment file in the order they were written."""
+    with open(os.path.join(self.path, segment), "rb") as file:
+      while True:
+        header = file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+          return
+        digest, length = RECORD_HEADER.unpack(header)
+        frame = file.read(length)
+        if len(frame) < length:
+          return  # interrupted write at the end of the segment
+        yield digest.hex(), self._decompressor(frame).decompress(frame).decode("utf-8")
+
+  def train_dictionary(self, sample_count=2000, size=DICTIONARY_SIZE):
+    """Train a shared zstd dictionary on the newest pages; new pages use it.
+
+    Old pages stay readable with the dictionary they were written with.
+    """
+    with self._lock:
+      rows = self._index.execute("SELECT digest FROM pages ORDER BY rowid DESC LIMIT ?", (sample_count,)).fetchall()
+    samples = [self.get(digest.hex()).encode("utf-8") for digest, in rows]
+    dictionary = zstandard.train_dictionary(size, samples)
+    with open(self._dictionary_path(dictionary.dict_id()), "wb") as file:
+      file.write(dictionary.as_bytes())
+    with self._lock:
+      self._dictionaries[dictionary.dict_id()] = dictionary
+      self._use_dictionary(dictionary)
+      self._pages_since_training = 0
+    return dictionary.dict_id()
+
+  def close(self):
+    with self._lock:
+      self._index.close()
+
+
+ARCHIVE = None
+
+
+def configure(path):
+  """Archive every page fetched by api.Station and api.Train in path."""
+  global ARCHIVE
+  if ARCHIVE is not None:
+    ARCHIVE.close()
+  ARCHIVE = Archive(path) if path is not None else None
+  return ARCHIVE
+
+
+def store(url, html_document):
+  """Archive the page, if an archive is configured."""
+  if ARCHIVE is not None:
+    ARCHIVE.put(url, html_document)
@@ -0,0 +1,175 @@
+"""
+Response cache for bhftafel- and traininfo-requests.
+
+- keyed by the normalized url (sorted query) and the post-payload
+- ttl per endpoint (the "<endpoint>.exe" part of the url, e.g. "traininfo")
+- lru-bound for the in-memory entries
+- optional on-disk tier (sqlite), e.g. to survive a restart
+- concurrent identical requests are coalesced: only one fetch goes out,
+  the other threads wait for it and share the result (also errors)
+
+api.Station and api.Train use RESPONSE_CACHE; configure(...) replaces it.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+DEFAULT_TTLS = {"bhftafel": 60, "traininfo": 30}
+
+
+class _Pending:
+  """A fetch in flight that other threads can wait for."""
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+
+class ResponseCache:
+  """TTL/LRU cache for response texts with request coalescing.
+
+  ttls: seconds per endpoint; endpoints without ttl use default_ttl.
+    A ttl of 0 turns caching off for that endpoint (coalescing still works).
+  max_entries: lru-bound of the in-memory tier
+  disk_path: sqlite-file for the on-disk tier (None: memory only)
+  """
+
+  def __init__(self, ttls=None, default_ttl=30, max_entries=2048, disk_path=None):
+    self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+    self.default_ttl = default_ttl
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self.coalesced = 0
+    self._entries = OrderedDict()  # key -> (expires, text)
+    self._pending = dict()  # key -> _Pending
+    self._lock = threading.Lock()
+    self._disk = None
+    if disk_path is not None:
+      self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+      self._disk.execute("CREATE TABLE if not exists responses(key TEXT PRIMARY KEY, expires REAL, body TEXT)")
+      self._disk.commit()
+
+  @staticmethod
+  def key(method, url, payload=None):
+    """Normalized cache key of a request."""
+    scheme, netloc, path, query, _ = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    url = urlunsplit((scheme.lower(), netloc.lower(), path, query, ""))
+    body = urlencode(sorted(payload.items())) if payload else ""
+    return f"{method.upper()} {url} {body}"
+
+  @staticmethod
+  def endpoint(url):
+    """e.g. "traininfo" for https://reiseauskunft.bahn.de/bin/traininfo.exe/dn/..."""
+    for part in urlsplit(url).path.split("/"):
+      if part.endswith(".exe"):
+        return part.removesuffix(".exe")
+    return urlsplit(url).netloc
+
+  def ttl(self, url):
+    return self.ttls.get(self.endpoint(url), self.default_ttl)
+
+  def lookup(self, key):
+    """Return the cached text for key or None."""
+    now = time.time()
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        expires, text = entry
+        if expires > now:
+          self._entries.move_to_end(key)
+          self.hits += 1
+          return text
+        del self._entries[key]
+      if self._disk is not None:
+        row = self._disk.execute("SELECT expires, body FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] > now:
+          self._remember(key, row[0], row[1])
+          self.hits += 1
+          return row[1]
+    return None
+
+  def store(self, key, url, text):
+    ttl = self.ttl(url)
+    if ttl <= 0:
+      return None
+    expires = time.time() + ttl
+    with self._lock:
+      self._remember(key, expires, text)
+      if self._disk is not None:
+        self._disk.execute("INSERT OR REPLACE INTO responses VALUES(?, ?, ?)", (key, expires, text))
+        self._disk.commit()
+    return None
+
+  def _remember(self, key, expires, text):
+    self._entries[key] = (expires, text)
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.max_entries:
+      self._entries.popitem(last=False)
+
+  def get_or_fetch(self, method, url, payload, fetch):
+    """Return the cached response text or call fetch() (once for all concurrent callers)."""
+    key = self.key(method, url, payload)
+    text = self.lookup(key)
+    if text is not None:
+      return text
+
+    with self._lock:
+      pending = self._pending.get(key)
+      owner = pending is None
+      if owner:
+        pending = _Pending()
+        self._pending[key] = pending
+        self.misses += 1
+      else:
+        self.coalesced += 1
+
+    if not owner:
+      pending.done.wait()
+      if pending.error is not None:
+        raise pending.error
+      return pending.result
+
+    try:
+      pending.result = fetch()
+      self.store(key, url, pending.result)
+      return pending.result
+    except BaseException as error:
+      pending.error = error
+      raise
+    finally:
+      with self._lock:
+        del self._pending[key]
+      pending.done.set()
+
+  def purge(self):
+    """Drop expired entries (memory and disk)."""
+    now = time.time()
+    with self._lock:
+      for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+        del self._entries[key]
+      if self._disk is not None:
+        self._disk.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        self._disk.commit()
+
+  def close(self):
+    if self._disk is not None:
+      self._disk.close()
+      self._disk = None
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def configure(ttls=None, default_ttl=30, max_entries=2048, disk_path=None):
+  """Replace the shared response cache."""
+  global RESPONSE_CACHE
+  RESPONSE_CACHE.close()
+  RESPONSE_CACHE = ResponseCache(ttls, default_ttl, max_entries, disk_path)
+  return RESPONSE_CACHE
@@ -0,0 +1,273 @@
+"""
+Day-partitioned Parquet archive of the finished trains, for delay analytics.
+
+Scans like "average delay per line over a year" are slow on the row-oriented
+connections.sql; as Parquet only the needed columns are read, and only the
+days in the asked range (partition pruning):
+
+  <directory>/stops/day=2026-10-18/part-<n>.parquet       one row per stop of a train run
+  <directory>/departures/day=2026-10-18/part-<n>.parquet  one row per board entry (Station, with issues)
+
+Names (station, train, company, platform, cause) are dictionary-encoded,
+times are typed timestamps, delays are durations.
+
+The collector (main.py) buffers the boards it calls and appends them to
+departures every BOARDS_INTERVAL; the stops come from the permanent db with
+the export stage below, which also compacts both datasets.
+
+  archive = ColumnarArchive("analytics")
+  archive.write_runs([(id, train_run), ...])
+  archive.write_board("Isernhagen", board_entries)
+  archive.import_sqlite("connections.sql")   # the permanent db (writebehind.py)
+  archive.compact()                          # many small parts -> one per day, without duplicates
+  archive.read("stops", start=date(2026, 10, 1), columns=["trainName", "arrDelay"])
+
+or as export stage: python columnar.py connections.sql analytics [start day] [end day]
+
+Needs pyarrow.
+"""
+
+import itertools
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from records import Stop, TrainRun
+
+try:
+  import pyarrow
+  import pyarrow.dataset
+  import pyarrow.parquet
+except ImportError:  # pyarrow is optional
+  pyarrow = None
+
+
+STOPS = "stops"
+DEPARTURES = "departures"
+KEYS = {STOPS: ["runId", "stopIndex"], DEPARTURES: ["station", "trainName", "planedTime"]}  # of a row
+
+if pyarrow is not None:
+  _NAME = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+  _TIME = pyarrow.timestamp("s")
+  _DELAY = pyarrow.duration("s")
+  SCHEMAS = {
+    STOPS: pyarrow.schema([
+      ("runId", pyarrow.string()),
+      ("trainName", _NAME),
+      ("company", _NAME),
+      ("trainDate", pyarrow.date32()),
+      ("stopIndex", pyarrow.int16()),
+      ("station", _NAME),
+      ("planedArrTime", _TIME),
+      ("delayedArrTime", _TIME),
+      ("arrDelay", _DELAY),
+      ("planedDepTime", _TIME),
+      ("delayedDepTime", _TIME),
+      ("depDelay", _DELAY),
+      ("platform", _NAME),
+      ("canceled", pyarrow.bool_()),
+      ("cause", _NAME),
+    ]),
+    DEPARTURES: pyarrow.schema([
+      ("station", _NAME),
+      ("trainName", _NAME),
+      ("transportationType", _NAME),
+      ("endstation", _NAME),
+      ("platform", _NAME),
+      ("planedTime", _TIME),
+      ("delayedTime", _TIME),
+      ("delay", _DELAY),
+      ("canceled", pyarrow.bool_()),
+      ("cause", _NAME),
+    ]),
+  }
+
+
+def _delay(planed, delayed):
+  return delayed - planed if planed is not None and delayed is not None else None
+
+
+def _day(value):
+  return value.strftime("%Y-%m-%d")
+
+
+class ColumnarArchive:
+  """Parquet datasets stops and departures, partitioned by day (see module doc)."""
+
+  def __init__(self, directory):
+    if pyarrow is None:
+      raise ImportError("the columnar archive needs pyarrow: pip install pyarrow")
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+
+  def _write(self, dataset, rows_by_day):
+    """Write one part file per day; rows are dicts of the dataset's columns."""
+    paths = list()
+    for day, rows in rows_by_day.items():
+      table = pyarrow.Table.from_pylist(rows, schema=SCHEMAS[dataset])
+      partition = os.path.join(self.directory, dataset, f"day={day}")
+      os.makedirs(partition, exist_ok=True)
+      path = os.path.join(partition, f"part-{time.time_ns()}.parquet")
+      pyarrow.parquet.write_table(table, path, compression="zstd")
+      paths.append(path)
+    return paths
+
+  def write_runs(self, runs):
+    """Append finished train runs, [(id, records.TrainRun)]; partitioned by the train date."""
+    rows_by_day = dict()
+    for id, run in runs:
+      rows = rows_by_day.setdefault(_day(run.train_date), list())
+      for index, stop in enumerate(run.route):
+        rows.append({
+          "runId": id,
+          "trainName": run.train_name,
+          "company": run.company,
+          "trainDate": run.train_date.date(),
+          "stopIndex": index,
+          "station": stop.station,
+          "planedArrTime": stop.planed_arr_time,
+          "delayedArrTime": stop.delayed_arr_time,
+          "arrDelay": _delay(stop.planed_arr_time, stop.delayed_arr_time),
+          "planedDepTime": stop.planed_dep_time,
+          "delayedDepTime": stop.delayed_dep_time,
+          "depDelay": _delay(stop.planed_dep_time, stop.delayed_dep_time),
+          "platform": stop.platform,
+          "canceled": stop.canceled,
+          "cause": stop.cause,
+        })
+    return self._write(STOPS, rows_by_day)
+
+  def write_board(self, station, entries):
+    """Append the board of a station (records.BoardEntry with the issues); partitioned by the planed time."""
+    return self.write_boards([(station, entries)])
+
+  def write_boards(self, boards):
+    """Append the boards of several calls, [(station, [records.BoardEntry])], one part per day.
+
+    A departure on several of the boards is written once, as on the last one.
+    """
+    rows_by_day = dict()
+    for station, entries in boards:
+      for entry in entries:
+        rows = rows_by_day.setdefault(_day(entry.planed_time), dict())
+        rows[station, entry.train_name, entry.planed_time] = {
+          "station": station,
+          "trainName": entry.train_name,
+          "transportationType": entry.transportation_type,
+          "endstation": entry.endstation,
+          "platform": entry.platform_number,
+          "planedTime": entry.planed_time,
+          "delayedTime": entry.delayed_time,
+          "delay": entry.delayed_by,
+          "canceled": entry.canceled,
+          "cause": entry.cause,
+        }
+    return self._write(DEPARTURES, {day: list(rows.values()) for day, rows in rows_by_day.items()})
+
+  def import_sqlite(self, path, start=None, end=None, batch=10000):
+    """Export the train runs of the permanent db (writebehind.py) with a train date in [start, end).
+
+    One query (runs joined with their stops, ordered by run and stop), written every batch runs.
+    Exporting a range again duplicates its rows until compact().
+    """
+    query = ("SELECT r.id, r.trainName, r.trainDate, r.company, s.station, s.planedArrTime, s.delayedArrTime, "
+             "s.planedDepTime, s.delayedDepTime, s.platform, s.canceled, s.cause "
+             "FROM trainRuns r LEFT JOIN stops s ON s.runId = r.id")
+    conditions, parameters = list(), list()
+    if start is not None:
+      conditions.append("r.trainDate >= ?")
+      parameters.append(int(datetime.combine(start, datetime.min.time()).timestamp()))
+    if end is not None:
+      conditions.append("r.trainDate < ?")
+      parameters.append(int(datetime.combine(end, datetime.min.time()).timestamp()))
+    if conditions:
+      query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY r.id, s.stopIndex"
+
+    def timestamp(value):
+      return datetime.fromtimestamp(value) if value is not None else None
+
+    connection = sqlite3.connect(path)
+    count, runs = 0, list()
+    try:
+      for (id, train_name, train_date, company), rows in itertools.groupby(connection.execute(query, parameters),
+                                                                            key=lambda row: row[:4]):
+        route = [Stop(station=station, planed_arr_time=timestamp(planed_arr), delayed_arr_time=timestamp(delayed_arr),
+                      planed_dep_time=timestamp(planed_dep), delayed_dep_time=timestamp(delayed_dep),
+                      platform=platform, canceled=bool(canceled), cause=cause)
+                 for _, _, _, _, station, planed_arr, delayed_arr, planed_dep, delayed_dep, platform, canceled, cause in rows
+                 if station is not None]  # a run without stops
+        runs.append((id, TrainRun(train_name=train_name, train_date=timestamp(train_date), company=company, route=route)))
+        if len(runs) >= batch:
+          self.write_runs(runs)
+          count, runs = count + len(runs), list()
+    finally:
+      connection.close()
+    self.write_runs(runs)
+    return count + len(runs)
+
+  def days(self, dataset):
+    """The days (partitions) of a dataset."""
+    directory = os.path.join(self.directory, dataset)
+    if not os.path.isdir(directory):
+      return list()
+    return sorted(name.split("=", 1)[1] for name in os.listdir(directory) if name.startswith("day="))
+
+  def compact(self, dataset=STOPS, days=None):
+    """Merge the part files of each day into one (sorted by time).
+
+    Rows written more than once (a stop exported again, a departure on every call of the board)
+    are merged into the last written one.
+    """
+    sort_key = "planedArrTime" if dataset == STOPS else "planedTime"
+    for day in days or self.days(dataset):
+      partition = os.path.join(self.directory, dataset, f"day={day}")
+      parts = sorted(os.path.join(partition, name) for name in os.listdir(partition) if name.endswith(".parquet"))
+      if len(parts) < 2:
+        continue
+      table = pyarrow.concat_tables(pyarrow.parquet.read_table(part, schema=SCHEMAS[dataset]) for part in parts)
+      table = table.append_column("row", pyarrow.array(range(table.num_rows), pyarrow.int64()))
+      last = table.group_by(KEYS[dataset]).aggregate([("row", "max")]).column("row_max")
+      table = table.take(last).drop_columns(["row"]).sort_by([(sort_key, "ascending")])
+      merged = os.path.join(partition, f"part-{time.time_ns()}.parquet.tmp")
+      pyarrow.parquet.write_table(table, merged, compression="zstd")
+      os.replace(merged, merged[:-len(".tmp")])
+      for part in parts:
+        os.remove(part)
+
+  def read(self, dataset=STOPS, start=None, end=None, columns=None, filter=None):
+    """pyarrow.Table of the days in [start, end); only the partitions in the range are read.
+
+    columns: only these columns (projection); filter: an additional pyarrow.dataset expression
+    """
+    directory = os.path.join(self.directory, dataset)
+    if not os.path.isdir(directory):
+      return SCHEMAS[dataset].empty_table().select(columns or SCHEMAS[dataset].names)
+    partitioning = pyarrow.dataset.partitioning(pyarrow.schema([("day", pyarrow.string())]), flavor="hive")
+    source = pyarrow.dataset.dataset(directory, format="parquet", partitioning=partitioning,
+                                     schema=SCHEMAS[dataset].append(pyarrow.field("day", pyarrow.string())))
+    expression = None
+    if start is not None:
+      expression = pyarrow.dataset.field("day") >= _day(start)
+    if end is not None:
+      condition = pyarrow.dataset.field("day") < _day(end)
+      expression = condition if expression is None else expression & condition
+    if filter is not None:
+      expression = filter if expression is None else expression & filter
+    return source.to_table(columns=columns or SCHEMAS[dataset].names, filter=expression)
+
+
+if __name__ == "__main__":
+  import sys
+  from datetime import date
+
+  arguments = sys.argv[1:]
+  if len(arguments) < 2:
+    print(__doc__)
+    sys.exit(1)
+  start, end = [date.fromisoformat(day) for day in arguments[2:4]] + [None] * (4 - len(arguments[:4]))
+  archive = ColumnarArchive(arguments[1])
+  print(f"exported {archive.import_sqlite(arguments[0], start, end)} train runs")
+  archive.compact(STOPS)
+  archive.compact(DEPARTURES)
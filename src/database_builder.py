@@ -2,6 +2,7 @@
 Build stations database.
 -> works mostly autonomous, i.e. handles ratelimits - just runs. DatabaseBuilder(<mode>) starts it.
    Strg+c can end the run.
+   DatabaseBuilder(<mode>, profile=<seconds>) profiles the run (stages fetch, store, geocode; see profiling.py).
 
    #TODO beginning: you can only call with one mode. (maybe later add add_country_code as a flag and do this work in in a seperate thread or so.)
 """
@@ -15,9 +16,13 @@ import random
 import xml.etree.ElementTree as ET
 import sqlite3
 
-import requests
 import reverse_geocode
 
+import http_client
+import profiling
+from prefix_crawler import PrefixCrawler
+from id_scanner import IdScanner, RangeSet
+
 
 class DatabaseBuilder:
   """Building a database of "Deutsche Bahn"-stations in Germany.
@@ -44,12 +49,12 @@ class DatabaseBuilder:
   SAVED_STATES_PATH = os.path.join(CURRENT_DIRECTORY, "database_builder", "")
   DATABASE_PATH = os.path.join(CURRENT_DIRECTORY, "stations", "")
   STATIONS_DB_FILEPATH = os.path.join(DATABASE_PATH, "stations.db")
-  LAST_PARITAL_CITY = "last_partial_city.txt"
-  LAST_STATION_ID = "last_station_id.txt"
+  PROFILES_PATH = os.path.join(CURRENT_DIRECTORY, "profiles", "")
+  FRONTIER = "frontier.json"  # the prefixes still to crawl in "city" mode, see prefix_crawler.py
+  INVALID_IDS = "invalid_ids.json"  # ids without a station, never requested again in "id" mode, see id_scanner.py
   COUNTRY_CODES_FILE = "country_codes.json"
 
   MODE = None
-  GEONAMES_REQUEST_COUNTER = 0
   STARTTIME = None
   ENDTIME = None
 
@@ -68,8 +73,8 @@ class DatabaseBuilder:
                                             self._get_country_code_openstreetmap,
                                             ]}
 
-  def __init__(self, mode, timelimit: int = 60*30):  # , add_country_code=False):
-    """Call with a mode. (Optional: set a runtime limit in seconds.)
+  def __init__(self, mode, timelimit: int = 60*30, profile: int = None):  # , add_country_code=False):
+    """Call with a mode. (Optional: set a runtime limit in seconds, profile the first <profile> seconds.)
 
     mode: "city" | "id" | "addCountry"
     function-modes: 
@@ -77,14 +82,14 @@ class DatabaseBuilder:
      - dynamic: call until load limit (error) and than sleep x seconds.
      -> implement so that I can change that later.
 
-    example call-structur:
-      -> startup (loads the last value)
-      -> extend_with_partial_city (called x-times)
-      -> close (stores the last processed value)
-      -> 
+    example call-structur ("city"):
+      -> crawl_prefixes (resumes from the frontier file, runs until done or the timelimit)
+      -> the frontier file keeps the prefixes still to crawl
     """
 
     self.MODE = mode
+    if profile:
+      profiling.configure(self.PROFILES_PATH, duration=profile)
     self.STARTTIME = time.time()
     self.ENDTIME = self.STARTTIME + timelimit
     self.sqlite_connection = sqlite3.connect(self.STATIONS_DB_FILEPATH)
@@ -94,19 +99,16 @@ class DatabaseBuilder:
     self._monitor()
     match mode:
       case "city":
-        # Works on an empty database.
-        last_partial_city = self._startup(self.SAVED_STATES_PATH, self.LAST_PARITAL_CITY)
-        last_partial_city = self._run(self._extend_with_partial_city, last_partial_city)
-        self._close(self.SAVED_STATES_PATH, self.LAST_PARITAL_CITY, last_partial_city)
+        # Works on an empty database. Only saturated prefixes are expanded (see prefix_crawler.py).
+        self._crawl_prefixes()
       case "id":
         # Fill the spaces between ids in the database.
         cursor = self.sqlite_connection.cursor()
         cursor.execute("select count(*) from stations")
         database_entries_count = cursor.fetchall()
         if database_entries_count[0][0] >= 2:
-          last_station_id = self._startup(self.SAVED_STATES_PATH, self.LAST_STATION_ID)
-          last_station_id = self._run(self._extend_with_last_station_id, last_station_id)
-          self._close(self.SAVED_STATES_PATH, self.LAST_STATION_ID, last_station_id)
+          # the gaps between the ids are probed concurrently (see id_scanner.py)
+          self._extend_with_overlooked_ids()
         else:
           print(f"Not enough database entries in {self.STATIONS_DB_FILEPATH}. Needs at least 2.")
         cursor.close()
@@ -121,50 +123,23 @@ class DatabaseBuilder:
         print("not a valid mode value: 'city' or 'id', or 'addCountry")
     self.sqlite_connection.close()
     self._monitor()
+    if profile:
+      profiling.stop()
   
-  def _run(self, func, last_partial_city_or_id: str = None):
-    """Generice function-runner.
-
-    It's hard to determine the number of calls with _extend_with_last_station_id(...).
-    """
+  def _run(self, func):
+    """Generice function-runner (until the timelimit or an error)."""
     while True:
       if time.time() > self.ENDTIME:
         print("Timelimit reached. Exiting.")
-        return last_partial_city_or_id
+        return None
       try:
-        if last_partial_city_or_id is not None:
-          last_partial_city_or_id = func(last_partial_city_or_id)
-        else:
-          func()  # calls _add_countries_to_database
+        func()  # calls _add_countries_to_database
       except KeyboardInterrupt:
         print("userexit: Strg + C pressed")
-        return last_partial_city_or_id
+        return None
       except:
-        return last_partial_city_or_id
-
-  def _startup(self, folderpath, filename):
-    """Load last saved partial city name or last saved id."""
-    if not os.path.isdir(folderpath):
-      os.mkdir(folderpath)
-    if filename not in os.listdir(self.SAVED_STATES_PATH):
-      open(os.path.join(self.SAVED_STATES_PATH, filename), "a").close()
-      last_partial_city_or_id = ""
-    else:
-      with open(os.path.join(self.SAVED_STATES_PATH, filename), "r") as file:
-        content = file.read()
-      last_line = content.rstrip("\n")
-      if last_line == "":
-        last_partial_city_or_id = ""
-      else:
-        last_partial_city_or_id = last_line
-    return last_partial_city_or_id
+        return None
 
-  def _close(self, foldername, filename, last_partial_city_or_id):
-    """Save last processed partial city or id."""
-    with open(os.path.join(foldername, filename), "w", encoding="utf-8") as file:
-      file.write(last_partial_city_or_id)
-    return None
-  
   def _store_stations(self, stations):
     """Add stations that are not in the database to it."""
     cursor = self.sqlite_connection.cursor()
@@ -182,51 +157,23 @@ class DatabaseBuilder:
       print(stations_for_database)  # TODO: test
       if len(stations_for_database) > 0:
         placeholders = ",".join(["?"] * columnCount)
-        cursor.executemany(f"INSERT INTO stations VALUES({placeholders})", stations_for_database)
-        self.sqlite_connection.commit()
+        with profiling.stage("store"):
+          cursor.executemany(f"INSERT INTO stations VALUES({placeholders})", stations_for_database)
+          self.sqlite_connection.commit()
       cursor.close()
     return None
   
-  def _extend_with_partial_city(self, last_partial_city):
-    """Get station suggestions, stores them and returns the last processed partial city."""
-    next_partial_city = self._next_partial_city(last_partial_city)
-    stations = self._get_stations(next_partial_city)
-    # if self.add_country_code:
-    #   for station in stations:
-    #     country_code = self.get_country_code(station)
-    #     if country_code is not None:
-    #       station["country"] = country_code
-    if len(stations) > 0:
-      self._store_stations(stations)  
-    return next_partial_city
-
-  #@register_post_processing
-  def _extend_with_last_station_id(self, last_station_id):
-    """Based on the database of station ids, it adds -1 and +1 to the id to find new stations.
-    
-    Based on the last processed station (stored in a file),
-      the function gets the following station from the database.
-      With station id it calles forwards and backwards to find new
-      stations.
-    
-    Requires that a minimum of two stations are stored in the database.
-    """
-    stations = list()
-    cursor = self.sqlite_connection.cursor()
-    request = cursor.execute(f"select stationId from stations where stationId > '{last_station_id}' order by stationId asc")
-    station_id = request.fetchone()[0]
-    station_id_upper_limit = request.fetchone()[0]
-
-    backwards_found_stations = self._backwards(station_id, last_station_id)
-    stations.extend(backwards_found_stations)
-
-    forwards_found_stations, last_station_id = self._forwards(station_id, station_id_upper_limit)
-    stations.extend(forwards_found_stations)
-
-    cursor.close()
-    if len(stations) > 0:
-      self._store_stations(stations)
-    return last_station_id
+  def _crawl_prefixes(self):
+    """Crawl the station suggestions by prefix until done or the timelimit; resumes from the frontier file."""
+    crawler = PrefixCrawler(self._fetch_stations, self._store_stations, os.path.join(self.SAVED_STATES_PATH, self.FRONTIER))
+    try:
+      done = crawler.run(deadline=self.ENDTIME)
+    except KeyboardInterrupt:
+      print("userexit: Strg + C pressed")
+      done = False
+    print(f"{crawler.requests} requests, {crawler.saturated} saturated prefixes, {len(crawler.pending)} prefixes left"
+          + (" - done." if done else "."))
+    return crawler
 
   #@register_post_processing
   def _add_countries_to_database(self):
@@ -263,7 +210,8 @@ class DatabaseBuilder:
         self.sqlite_connection.commit()
         break
     else:
-      country_code = self.get_country_code(lat=lat, lng=lng)
+      with profiling.stage("geocode"):
+        country_code = self.get_country_code(lat=lat, lng=lng)
       if country_code != None:
         cursor_update_country_code.execute(f"update stations set country='{country_code}' where stationId='{station_id}'")
         self.sqlite_connection.commit()
@@ -274,8 +222,22 @@ class DatabaseBuilder:
     """
     search for stationId-ranges that are not in the database yet
     e.g. 000102569 to 000102587, because e.g. 000102573 is a valid stationId
+
+    Probes the gaps between the known ids concurrently until done or the timelimit;
+    ids without a station are saved and not requested again (see id_scanner.py).
     """
-    pass  #TODO
+    cursor = self.sqlite_connection.cursor()
+    known_ids = [id for (id,) in cursor.execute("select stationId from stations") if str(id).isdigit()]
+    cursor.close()
+    scanner = IdScanner(self._fetch_stations, self._store_stations, os.path.join(self.SAVED_STATES_PATH, self.INVALID_IDS))
+    try:
+      done = scanner.run(known_ids, deadline=self.ENDTIME)
+    except KeyboardInterrupt:
+      print("userexit: Strg + C pressed")
+      done = False
+    print(f"{scanner.requests} ids probed, {scanner.found} stations found, {len(scanner.invalid)} invalid ids known"
+          + (" - done." if done else "."))
+    return scanner
 
   #@register_post_processing
   def _check_station_name(self):
@@ -348,49 +310,12 @@ class DatabaseBuilder:
       json.dump(country_codes, file)
     return None
 
-  def _backwards(self, station_id: str, station_id_lower_limit: str) -> list[dict]:
-    """Go backwards from a station_id starting point and return a list of stations.
-    
-    Stop when a last_station_id-bottom is reached 
-      OR the "Deutsche Bahn"-API does not recognize 
-      the station_id as a valid station.
-    """
-    new_stations = list()
-    station_id = str(int(station_id) - 1).rjust(9, "0")
-    while station_id_lower_limit < station_id:
-      stations = self._get_stations(station_id)
-      if len(stations) == 1:
-        new_stations.extend(stations)
-      else:
-        break
-      station_id = str(int(station_id) - 1).rjust(9, "0")
-    return new_stations
-
-  def _forwards(self, station_id: str, station_id_upper_limit: str) -> tuple[list[dict], str]:
-    """Go forward from station_id and return a list of stations and the last valid station id.
-    
-    Stop when the next_station_id_in_database is reached
-      OR the "Deutsche Bahn"-API does not recognize 
-      the station_id as a valid station.
-    """
-    new_stations = list()
-    last_valid_station_id = station_id
-    while True:
-      station_id = str(int(station_id) + 1).rjust(9,"0")
-      if station_id == station_id_upper_limit:
-        last_valid_station_id = station_id
-        break
-      stations = self._get_stations(station_id)
-      if len(stations) == 1:
-        new_stations.extend(stations)
-        last_valid_station_id = station_id
-      else:
-        break
-    return new_stations, last_valid_station_id
-
   @staticmethod
   def _next_partial_city(last_partial_city: str) -> str:
-    """Determine next letter-sequence used as input for bahn-api."""
+    """Determine next letter-sequence used as input for bahn-api.
+
+    The order of the old exhaustive walk; "city" mode crawls by prefix now (see prefix_crawler.py).
+    """
     # TODO: write a test for this function
     letters = string.ascii_lowercase + " _"
     if last_partial_city == "":
@@ -413,67 +338,75 @@ class DatabaseBuilder:
 
   @staticmethod
   def _get_stations(partial_city_or_station_id: str) -> list[dict]:
-    """Fetches "Deutsche Bahn" json-data and extracts relevant data."""
-    sleeptime = random.randint(0, 21)
-    time.sleep(sleeptime / 7)
-    url = f"https://reiseauskunft.bahn.de/bin/ajax-getstop.exe/dn?REQ0JourneyStopsS0A=1&REQ0JourneyStopsF=excludeMetaStations&REQ0JourneyStopsS0G={partial_city_or_station_id}&js=true"
+    """Fetches "Deutsche Bahn" json-data and extracts relevant data.
+
+    Throttled by the rate limiter of http_client (see ratelimit.py).
+    """
     try:
-      response = requests.get(url)
-      data = response.text
-      if data.startswith("SLs.sls="):
-        data = data.removeprefix("SLs.sls=")
-      if data.endswith(";SLs.showSuggestion();"):
-        data = data.removesuffix(";SLs.showSuggestion();")
-      data = json.loads(data)
-
-      stations = data["suggestions"]
-      stations_formated = list()
-      for station in stations:
-        try:  # e.g. mode == "id"
-          request_id = int(partial_city_or_station_id)
-          if int(station["extId"]) != request_id:  # e.g. "Km. 109+000 H." (005327747) turns up for other ids as well (000112463, 000112464, ...) 
-            continue
-        except:
-          pass
-        station_name = html.unescape(station["value"])
-        station_id = station["extId"]
-        coded_id = station["id"]
-
-        lat = station["ycoord"]
-        if lat.startswith("-") and len(lat) < 7:
-          lat = "-" + lat.lstrip("-").rjust(6, "0")
-        elif len(lat) < 6:
-          lat = lat.rjust(6, "0")
-        if lat[:-6] == "":
-          lat = "0" + "." + lat[-6:]
-        elif lat[:-6] == "-":
-          lat = "-" + "0" + "." + lat[-6:]
-        else:
-          lat = lat[:-6] + "." + lat[-6:]
-
-        lng = station["xcoord"]
-        if lng.startswith("-") and len(lng) < 7:
-          lng = "-" + lng.lstrip("-").rjust(6, "0")
-        elif len(lng) < 6:
-          lng = lng.rjust(6, "0")
-        if lng[:-6] == "":
-          lng = "0" + "." + lng[-6:]
-        elif lng[:-6] == "-":
-          lng = "-" + "0" + "." + lng[-6:]
-        else:
-          lng = lng[:-6] + "." + lng[-6:]
-
-        station_formated = {"stationName": station_name,
-                            "stationId"  : station_id,
-                            "lat"        : lat,
-                            "lng"        : lng,
-                            "country"    : None
-                            }
-        stations_formated.append(station_formated)
-      return stations_formated
+      return DatabaseBuilder._fetch_stations(partial_city_or_station_id)
     except:
       print("Problem with the deutsche bahn api.")
       return []
+
+  @staticmethod
+  def _fetch_stations(partial_city_or_station_id: str) -> list[dict]:
+    """_get_stations, but raises if the request or the answer fails (e.g. to try again later)."""
+    url = f"https://reiseauskunft.bahn.de/bin/ajax-getstop.exe/dn?REQ0JourneyStopsS0A=1&REQ0JourneyStopsF=excludeMetaStations&REQ0JourneyStopsS0G={partial_city_or_station_id}&js=true"
+    with profiling.stage("fetch"):
+      response = http_client.get(url)
+    response.raise_for_status()
+    data = response.text
+    if data.startswith("SLs.sls="):
+      data = data.removeprefix("SLs.sls=")
+    if data.endswith(";SLs.showSuggestion();"):
+      data = data.removesuffix(";SLs.showSuggestion();")
+    data = json.loads(data)
+
+    stations = data["suggestions"]
+    stations_formated = list()
+    for station in stations:
+      try:  # e.g. mode == "id"
+        request_id = int(partial_city_or_station_id)
+        if int(station["extId"]) != request_id:  # e.g. "Km. 109+000 H." (005327747) turns up for other ids as well (000112463, 000112464, ...) 
+          continue
+      except:
+        pass
+      station_name = html.unescape(station["value"])
+      station_id = station["extId"]
+      coded_id = station["id"]
+
+      lat = station["ycoord"]
+      if lat.startswith("-") and len(lat) < 7:
+        lat = "-" + lat.lstrip("-").rjust(6, "0")
+      elif len(lat) < 6:
+        lat = lat.rjust(6, "0")
+      if lat[:-6] == "":
+        lat = "0" + "." + lat[-6:]
+      elif lat[:-6] == "-":
+        lat = "-" + "0" + "." + lat[-6:]
+      else:
+        lat = lat[:-6] + "." + lat[-6:]
+
+      lng = station["xcoord"]
+      if lng.startswith("-") and len(lng) < 7:
+        lng = "-" + lng.lstrip("-").rjust(6, "0")
+      elif len(lng) < 6:
+        lng = lng.rjust(6, "0")
+      if lng[:-6] == "":
+        lng = "0" + "." + lng[-6:]
+      elif lng[:-6] == "-":
+        lng = "-" + "0" + "." + lng[-6:]
+      else:
+        lng = lng[:-6] + "." + lng[-6:]
+
+      station_formated = {"stationName": station_name,
+                          "stationId"  : station_id,
+                          "lat"        : lat,
+                          "lng"        : lng,
+                          "country"    : None
+                          }
+      stations_formated.append(station_formated)
+    return stations_formated
   
   
   #@register_geolocation_service(location="online")
@@ -481,31 +414,25 @@ class DatabaseBuilder:
     """Call geonames.org with lat and lng and return a geocode.
 
     hourly limit of 1000 'credits' per ip; one request to that endpoint seems to take 3 credits => max. 333 requests / hour
+    that budget is enforced by the rate limiter (see ratelimit.py); on errors it backs off by itself
     """
     url = f"https://www.geonames.org/findNearbyPlaceName?lat={lat}&lng={lng}"
-    if self.GEONAMES_REQUEST_COUNTER >= 333:
-      try:
-        response = requests.get(url)
-        self.GEONAMES_REQUEST_COUNTER += 1
-        # TODO: test the response in case of a rate limit blocking; different status_code?
-        root = ET.fromstring(response.text)
-        country = root[0].find("countryCode").text
-        alpha_2_code = country_codes.get(country)
-        if alpha_2_code:
-          return alpha_2_code
-        elif allow_user_input:
-          alpha_2_code = self._ask_user_for_alpha_2_code(country)
-          country_codes[country] = alpha_2_code
-          return alpha_2_code, country_codes
-        else:
-          return None
-      except:
-        print("# Ratelimit (counter > 333) for geonames-api reached. Sleep for an hour.")
-        time.sleep(60*60)
+    try:
+      response = http_client.get(url)
+      # TODO: test the response in case of a rate limit blocking; different status_code?
+      root = ET.fromstring(response.text)
+      country = root[0].find("countryCode").text
+      alpha_2_code = country_codes.get(country)
+      if alpha_2_code:
+        return alpha_2_code
+      elif allow_user_input:
+        alpha_2_code = self._ask_user_for_alpha_2_code(country)
+        country_codes[country] = alpha_2_code
+        return alpha_2_code, country_codes
+      else:
         return None
-    else:
-      print("# Ratelimit for geonames-api reached. Sleep for an hour.")
-      time.sleep(60*60)
+    except:
+      print("# Problem with the geonames-api (maybe the ratelimit). Skipped.")
       return None
 
   #@register_geolocation_service(location="online")
@@ -515,17 +442,15 @@ class DatabaseBuilder:
     https://nominatim.org/release-docs/develop/api/Search/
     Max. 1 requests / second; add a http-referer/user-agent.
     """
-    # Try not to overload the api.
-    sleeptime = random.randint(2,4)
-    time.sleep(sleeptime)
+    # 1 request / second is the budget of the rate limiter (see ratelimit.py)
     headers = {"user-agent": "bahn_station_classifier/0.1.0"}
     url = f"https://nominatim.openstreetmap.org/search?q={lat}+{lng}&format=geocodejson"
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-      response = response.json()
-      if len(response) == 0:
+    response = http_client.get(url, headers=headers)
+    if response.status_code == 200:
+      features = response.json().get("features", [])
+      if len(features) == 0:
         return None
-      address_name = response["features"]["properties"]["geocoding"]["label"]
+      address_name = features[0]["properties"]["geocoding"]["label"]
       country = address_name.split(",")[-1].strip()
       alpha_2_code = country_codes.get(country)
       if alpha_2_code:
@@ -537,8 +462,7 @@ class DatabaseBuilder:
       else:
         return None
     else:
-      print("openstreetmap-api returned an error. Need to analyse that! Sleep for an hour - just in case.")
-      time.sleep(60*60)
+      print("openstreetmap-api returned an error. Need to analyse that! The rate limiter backs off.")
       return None
 
   #@register_geolocation_service(location="local")
@@ -615,10 +539,14 @@ class DatabaseBuilder:
 
   def _monitor(self):
     """Show some database- and state-information."""
-    with open(os.path.join(self.SAVED_STATES_PATH, self.LAST_PARITAL_CITY)) as file:
-      print(file.read().strip())
-    with open(os.path.join(self.SAVED_STATES_PATH, self.LAST_STATION_ID)) as file:
-      print(file.read().strip())
+    frontier_path = os.path.join(self.SAVED_STATES_PATH, self.FRONTIER)
+    if os.path.isfile(frontier_path):
+      with open(frontier_path, encoding="utf-8") as file:
+        frontier = json.load(file)
+      print(f"city: {len(frontier['pending'])} prefixes left after {frontier.get('requests', 0)} requests")
+    invalid_ids_path = os.path.join(self.SAVED_STATES_PATH, self.INVALID_IDS)
+    if os.path.isfile(invalid_ids_path):
+      print(f"id: {len(RangeSet.load(invalid_ids_path))} invalid ids known")
     connection = sqlite3.connect(self.STATIONS_DB_FILEPATH)
     cursor = connection.cursor()
     cursor.execute("select count(*) from stations")
@@ -642,7 +570,7 @@ class Analyse:
   def get(self, partialCity):
     # partialCity = "darmst_"
     url = f"https://reiseauskunft.bahn.de/bin/ajax-getstop.exe/dn?REQ0JourneyStopsS0A=1&REQ0JourneyStopsF=excludeMetaStations&REQ0JourneyStopsS0G={partialCity}&js=true"
-    response = requests.get(url)
+    response = http_client.get(url)
     data = response.text
     if data.startswith("SLs.sls="):
       data = data.removeprefix("SLs.sls=")
@@ -0,0 +1,118 @@
+"""
+Change detection between two polls of the same train (records.TrainRun).
+
+diff(old, new) compares the stops (planed/delayed arrival and departure,
+platform, canceled, cause) and returns only the changes as StopEvents.
+A stored train is then: the first snapshot + the events, i.e. storage and
+traffic grow with the number of changes, not with route length * polls.
+
+encode/decode turn events into compact lists for storage:
+  [observed (epoch seconds), stop index, field code, value]
+  e.g. [1792332420, 3, "da", 1792333260] -> delayed arrival at stop 3
+apply(run, events) replays events onto a snapshot.
+"""
+
+from dataclasses import dataclass, replace
+from datetime import datetime
+
+from records import Stop, TrainRun
+
+
+FIELDS = {
+  "planed_arr_time": "pa",
+  "delayed_arr_time": "da",
+  "planed_dep_time": "pd",
+  "delayed_dep_time": "dd",
+  "platform": "p",
+  "canceled": "c",
+  "cause": "r",
+}
+TIME_FIELDS = {"planed_arr_time", "delayed_arr_time", "planed_dep_time", "delayed_dep_time"}
+ADDED = "+"  # value: station name; the stop's fields follow as separate events
+REMOVED = "-"  # value: station name
+FIELD_NAMES = {code: name for name, code in FIELDS.items()}
+
+
+@dataclass(slots=True)
+class StopEvent:
+  """A change of one field of one stop.
+
+  stop is the index into the new route; for REMOVED into the old route.
+  """
+  observed: datetime
+  stop: int
+  field: str
+  value: object
+
+
+def _stop_keys(route):
+  """(station, n-th occurrence) per stop - a station can be on a route twice."""
+  seen = dict()
+  keys = list()
+  for stop in route:
+    seen[stop.station] = seen.get(stop.station, 0) + 1
+    keys.append((stop.station, seen[stop.station]))
+  return keys
+
+
+def diff(old, new, observed=None):
+  """Return the StopEvents that turn old into new (old may be None)."""
+  observed = observed or datetime.now()
+  old_route = old.route if old is not None else list()
+  old_keys = _stop_keys(old_route)
+  old_stops = dict(zip(old_keys, old_route))
+  new_keys = _stop_keys(new.route)
+  events = list()
+
+  # removed stops first (descending), then added/changed stops (ascending),
+  # so the indices stay valid when the events are applied in order
+  new_key_set = set(new_keys)
+  for index in reversed(range(len(old_keys))):
+    if old_keys[index] not in new_key_set:
+      events.append(StopEvent(observed, index, REMOVED, old_keys[index][0]))
+
+  for index, (key, stop) in enumerate(zip(new_keys, new.route)):
+    old_stop = old_stops.get(key)
+    if old_stop is None:
+      events.append(StopEvent(observed, index, ADDED, stop.station))
+      old_stop = Stop(station=stop.station)
+    for name in FIELDS:
+      value = getattr(stop, name)
+      if value != getattr(old_stop, name):
+        events.append(StopEvent(observed, index, name, value))
+  return events
+
+
+def apply(run, events):
+  """Return a copy of run with the events applied (in the order given)."""
+  route = [replace(stop) for stop in run.route]
+  for event in events:
+    if event.field == ADDED:
+      route.insert(event.stop, Stop(station=event.value))
+    elif event.field == REMOVED:
+      del route[event.stop]
+    else:
+      setattr(route[event.stop], event.field, event.value)
+  return TrainRun(train_name=run.train_name, train_date=run.train_date, company=run.company, route=route)
+
+
+def encode(events):
+  """StopEvents -> compact lists (json-serializable)."""
+  encoded = list()
+  for event in events:
+    value = event.value
+    if event.field in TIME_FIELDS and value is not None:
+      value = int(value.timestamp())
+    encoded.append([int(event.observed.timestamp()), event.stop, FIELDS.get(event.field, event.field), value])
+  return encoded
+
+
+def decode(encoded):
+  """Compact lists -> StopEvents."""
+  events = list()
+  for observed, stop, code, value in encoded:
+    field = FIELD_NAMES.get(code, code)
+    if field in TIME_FIELDS and value is not None:
+      value = datetime.fromtimestamp(value)
+    events.append(StopEvent(datetime.fromtimestamp(observed), stop, field, value))
+  return events
@@ -0,0 +1,90 @@
+"""
+Skip re-parsing of unchanged pages.
+
+Consecutive polls of a board or a train page mostly return the same html.
+Before parsing, only the relevant section of the page (e.g. div#sqResult or
+the tqRow rows) is hashed - a plain string search, no soup. If the hash is
+the same as at the last poll of that board/train, the last parsed result is
+reused.
+
+STATION_MEMO and TRAIN_MEMO count hits and misses (stats()), i.e. how many
+parses were saved.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def section(html_document, start_marker, end_marker, closing_tag):
+  """The part of the page from start_marker to the closing_tag after the last end_marker.
+
+  Falls back to the whole page if the markers are missing.
+  """
+  start = html_document.find(start_marker)
+  end = html_document.rfind(end_marker)
+  if start == -1 or end < start:
+    return html_document
+  end = html_document.find(closing_tag, end)
+  if end == -1:
+    return html_document[start:]
+  return html_document[start:end + len(closing_tag)]
+
+
+def fingerprint(text, *context):
+  """Hash of text and context (e.g. the request date, which changes the parse)."""
+  digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16)
+  for value in context:
+    digest.update(b"\0" + str(value).encode("utf-8"))
+  return digest.digest()
+
+
+class ParseMemo:
+  """Last fingerprint and parse result per board/train (lru-bound)."""
+
+  def __init__(self, max_entries=20000):
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()  # key -> (fingerprint, result)
+    self._lock = threading.Lock()
+
+  def parse(self, key, page_fingerprint, parse):
+    """Return the last result for key if the fingerprint matches, otherwise parse()."""
+    result = self.lookup(key, page_fingerprint)
+    if result is None:
+      result = parse()
+      self.store(key, page_fingerprint, result)
+    return result
+
+  def lookup(self, key, page_fingerprint):
+    """The last result for key if the fingerprint matches, else None (counts hits and misses)."""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[0] == page_fingerprint:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+      self.misses += 1
+      return None
+
+  def store(self, key, page_fingerprint, result):
+    with self._lock:
+      self._entries[key] = (page_fingerprint, result)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def stats(self):
+    total = self.hits + self.misses
+    return {"hits": self.hits, "misses": self.misses, "hitRate": self.hits / total if total else 0.0}
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.hits = 0
+      self.misses = 0
+
+
+STATION_MEMO = ParseMemo()
+TRAIN_MEMO = ParseMemo()
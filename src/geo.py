@@ -0,0 +1,141 @@
+"""
+Spatial index of the stations (stations.db, see database_builder.py), to
+select the stations of an area: a bounding box, a point plus radius or a
+polygon.
+
+The stations are loaded once into a scipy cKDTree over 3d unit vectors
+(points on the sphere), so a radius on the earth is a radius in the tree
+(the chord) and the queries take milliseconds, even for all the stations.
+Bounding boxes and polygons are answered from the circle around them, then
+filtered exactly.
+
+  index = StationIndex("stations/stations.db")
+  index.within_radius(52.37, 9.73, km=20)                  # names, nearest first
+  index.within_bbox(south=52.2, west=9.5, north=52.5, east=10.0)
+  index.within_polygon([(52.2, 9.5), (52.5, 9.7), (52.3, 10.0)])
+  index.select({"center": (52.37, 9.73), "radius": 20})    # the area forms of Management
+
+Coordinates are (lat, lng) in degrees. Needs numpy and scipy.
+"""
+
+import math
+import sqlite3
+
+try:
+  import numpy
+  from scipy.spatial import cKDTree
+except ImportError:  # numpy and scipy are optional
+  numpy = None
+  cKDTree = None
+
+
+EARTH_RADIUS = 6371.0  # km
+
+
+def _unit_vectors(lats, lngs):
+  lats, lngs = numpy.radians(lats), numpy.radians(lngs)
+  return numpy.column_stack((numpy.cos(lats) * numpy.cos(lngs), numpy.cos(lats) * numpy.sin(lngs), numpy.sin(lats)))
+
+
+def _chord(km):
+  """Length of the chord on the unit sphere for a distance on the earth."""
+  return 2 * math.sin(min(km / EARTH_RADIUS, math.pi) / 2)
+
+
+def distance(lat1, lng1, lat2, lng2):
+  """Great-circle distance in km (haversine)."""
+  lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+  a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+  return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def _inside(lats, lngs, polygon):
+  """Ray casting for arrays of points; polygon: [(lat, lng)], open or closed."""
+  inside = numpy.zeros(len(lats), dtype=bool)
+  vertices = list(polygon)
+  for (lat1, lng1), (lat2, lng2) in zip(vertices, vertices[1:] + vertices[:1]):
+    if lat1 == lat2:
+      continue
+    crosses = (lat1 > lats) != (lat2 > lats)
+    lng_at = lng1 + (lats - lat1) * (lng2 - lng1) / (lat2 - lat1)
+    inside ^= crosses & (lngs < lng_at)
+  return inside
+
+
+class StationIndex:
+  """The stations of stations.db in a kd-tree (see module doc)."""
+
+  def __init__(self, path):
+    if cKDTree is None:
+      raise ImportError("the station index needs scipy: pip install scipy")
+    self.path = path
+    connection = sqlite3.connect(path)
+    try:
+      rows = connection.execute("SELECT stationName, stationId, lat, lng FROM stations").fetchall()
+    finally:
+      connection.close()
+    names, ids, lats, lngs = list(), list(), list(), list()
+    for name, id, lat, lng in rows:
+      try:
+        lat, lng = float(lat), float(lng)
+      except (TypeError, ValueError):
+        continue
+      names.append(name)
+      ids.append(id)
+      lats.append(lat)
+      lngs.append(lng)
+    self.names = names
+    self.ids = ids
+    self.lats = numpy.array(lats, dtype=float)
+    self.lngs = numpy.array(lngs, dtype=float)
+    self.tree = cKDTree(_unit_vectors(self.lats, self.lngs) if names else numpy.empty((0, 3)))
+
+  def __len__(self):
+    return len(self.names)
+
+  def _candidates(self, lat, lng, km):
+    """Indices of the stations within km of (lat, lng), nearest first."""
+    center = _unit_vectors([lat], [lng])[0]
+    indices = numpy.array(self.tree.query_ball_point(center, _chord(km)), dtype=int)
+    if len(indices) == 0:
+      return indices
+    distances = numpy.linalg.norm(self.tree.data[indices] - center, axis=1)
+    return indices[numpy.argsort(distances, kind="stable")]
+
+  def within_radius(self, lat, lng, km):
+    """Names of the stations within km of (lat, lng), nearest first."""
+    return [self.names[index] for index in self._candidates(lat, lng, km)]
+
+  def _enclosing_circle(self, lats, lngs):
+    lat, lng = (min(lats) + max(lats)) / 2, (min(lngs) + max(lngs)) / 2
+    return lat, lng, max(distance(lat, lng, corner_lat, corner_lng)
+                         for corner_lat in (min(lats), max(lats)) for corner_lng in (min(lngs), max(lngs)))
+
+  def within_bbox(self, south, west, north, east):
+    """Names of the stations in the bounding box (degrees)."""
+    lat, lng, km = self._enclosing_circle((south, north), (west, east))
+    indices = self._candidates(lat, lng, km)
+    lats, lngs = self.lats[indices], self.lngs[indices]
+    inside = (south <= lats) & (lats <= north) & (west <= lngs) & (lngs <= east)
+    return [self.names[index] for index in indices[inside]]
+
+  def within_polygon(self, polygon):
+    """Names of the stations in the polygon, [(lat, lng)]."""
+    lat, lng, km = self._enclosing_circle([lat for lat, _ in polygon], [lng for _, lng in polygon])
+    indices = self._candidates(lat, lng, km)
+    inside = _inside(self.lats[indices], self.lngs[indices], polygon)
+    return [self.names[index] for index in indices[inside]]
+
+  def select(self, area):
+    """Names of the stations of an area:
+      {"bbox": (south, west, north, east)}
+      {"center": (lat, lng), "radius": km}
+      {"polygon": [(lat, lng), ...]}
+    """
+    if "bbox" in area:
+      return self.within_bbox(*area["bbox"])
+    if "center" in area:
+      return self.within_radius(*area["center"], area["radius"])
+    if "polygon" in area:
+      return self.within_polygon(area["polygon"])
+    raise ValueError(f"unknown area: {area}")
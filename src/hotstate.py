@@ -0,0 +1,128 @@
+"""
+Hot state of the active trains in redis.
+
+  <prefix>:active       set of the ids of the active trains (no KEYS-scan)
+  <prefix>:<id>         json document of the last snapshot (RedisJSON)
+  <prefix>:<id>:events  list of the changes (see diff.py)
+
+An update only writes the changed json paths (e.g.
+$.route[3].delayedArrTime) and appends the events, everything in one
+pipeline (MULTI/EXEC), i.e. one round trip per train. load() reads many
+snapshots in one round trip.
+
+Datetimes are stored as epoch seconds, like in the events.
+"""
+
+import json
+from datetime import datetime
+
+import diff
+import metrics
+from records import Stop, TrainRun
+
+
+STOP_KEYS = {
+  "station": "station",
+  "planed_arr_time": "planedArrTime",
+  "delayed_arr_time": "delayedArrTime",
+  "planed_dep_time": "planedDepTime",
+  "delayed_dep_time": "delayedDepTime",
+  "platform": "platform",
+  "canceled": "canceled",
+  "cause": "cause",
+}
+STOP_FIELDS = {key: name for name, key in STOP_KEYS.items()}
+
+
+def encode_time(value):
+  return int(value.timestamp()) if value is not None else None
+
+
+def decode_time(value):
+  return datetime.fromtimestamp(value) if value is not None else None
+
+
+def encode_value(name, value):
+  return encode_time(value) if name in diff.TIME_FIELDS else value
+
+
+def encode_run(run):
+  """TrainRun -> json document."""
+  return {
+    "trainName": run.train_name,
+    "trainDate": encode_time(run.train_date),
+    "company": run.company,
+    "route": [{key: encode_value(name, getattr(stop, name)) for name, key in STOP_KEYS.items()} for stop in run.route],
+  }
+
+
+def decode_run(document):
+  """json document -> TrainRun."""
+  route = list()
+  for stop in document["route"]:
+    route.append(Stop(**{STOP_FIELDS[key]: decode_time(value) if STOP_FIELDS[key] in diff.TIME_FIELDS else value
+                         for key, value in stop.items()}))
+  return TrainRun(train_name=document["trainName"], train_date=decode_time(document["trainDate"]),
+                  company=document["company"], route=route)
+
+
+class HotState:
+  """Snapshots and events of the active trains (see module doc).
+
+  client: a redis.Redis with decode_responses=True (or fakeredis)
+  """
+
+  def __init__(self, client, prefix="train"):
+    self.client = client
+    self.prefix = prefix
+    self.index_key = f"{prefix}:active"
+
+  def key(self, id):
+    return f"{self.prefix}:{id}"
+
+  def events_key(self, id):
+    return f"{self.prefix}:{id}:events"
+
+  def update(self, id, old, new, events):
+    """Store the new snapshot of a train; old is the last one (None for a new train)."""
+    pipeline = self.client.pipeline(transaction=True)
+    if old is None or any(event.field in (diff.ADDED, diff.REMOVED) for event in events):
+      pipeline.json().set(self.key(id), "$", encode_run(new))
+    else:
+      for event in events:
+        path = f"$.route[{event.stop}].{STOP_KEYS[event.field]}"
+        pipeline.json().set(self.key(id), path, encode_value(event.field, event.value))
+    if events:
+      pipeline.rpush(self.events_key(id), *[json.dumps(event) for event in diff.encode(events)])
+    pipeline.sadd(self.index_key, id)
+    with metrics.WRITE_LATENCY.time(store="redis"):
+      pipeline.execute()
+
+  def snapshot(self, id):
+    """The last snapshot of a train or None."""
+    document = self.client.json().get(self.key(id))
+    return decode_run(document) if document is not None else None
+
+  def load(self, ids=None):
+    """{id: snapshot} of the given (default: all active) trains in one round trip."""
+    ids = sorted(self.active()) if ids is None else list(ids)
+    pipeline = self.client.pipeline(transaction=False)
+    for id in ids:
+      pipeline.json().get(self.key(id))
+    return {id: decode_run(document) for id, document in zip(ids, pipeline.execute()) if document is not None}
+
+  def events(self, id):
+    return diff.decode([json.loads(event) for event in self.client.lrange(self.events_key(id), 0, -1)])
+
+  def active(self):
+    return self.client.smembers(self.index_key)
+
+  def remove(self, *ids):
+    """Forget finished trains."""
+    if not ids:
+      return
+    pipeline = self.client.pipeline(transaction=True)
+    pipeline.srem(self.index_key, *ids)
+    for id in ids:
+      pipeline.delete(self.key(id), self.events_key(id))
+    pipeline.execute()
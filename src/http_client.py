@@ -0,0 +1,99 @@
+"""
+Shared http client for every outgoing request (bahn.de, geonames, openstreetmap).
+
+One requests.Session per process, i.e. keep-alive connections are pooled and
+reused across all requests. gzip/deflate is handled transparently by requests
+(the Accept-Encoding header is set and the body is decoded on the fly).
+
+Use get/post from this module instead of requests.get/requests.post.
+configure(...) changes pool sizes, timeout and retries (rebuilds the session).
+Every request waits for the rate limiter of its host, see ratelimit.py, and
+is recorded in the metrics (latency, status), see metrics.py.
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import ratelimit
+
+
+POOL_CONNECTIONS = 10  # number of hosts that get their own pool
+POOL_MAXSIZE = 32  # keep-alive connections per host
+TIMEOUT = (5, 30)  # (connect, read) in seconds
+MAX_RETRIES = 0  # retries on connection errors (not on http errors)
+HEADERS = {"Accept-Encoding": "gzip, deflate"}
+
+_session = None
+_lock = threading.Lock()
+
+
+def _build_session():
+  session = requests.Session()
+  session.headers.update(HEADERS)
+  adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=MAX_RETRIES)
+  session.mount("https://", adapter)
+  session.mount("http://", adapter)
+  return session
+
+
+def configure(pool_connections=None, pool_maxsize=None, timeout=None, max_retries=None):
+  """Change the settings of the shared session. Open connections are closed."""
+  global POOL_CONNECTIONS, POOL_MAXSIZE, TIMEOUT, MAX_RETRIES
+  if pool_connections is not None:
+    POOL_CONNECTIONS = pool_connections
+  if pool_maxsize is not None:
+    POOL_MAXSIZE = pool_maxsize
+  if timeout is not None:
+    TIMEOUT = timeout
+  if max_retries is not None:
+    MAX_RETRIES = max_retries
+  close()
+
+
+def session():
+  """Return the shared session (created on first use)."""
+  global _session
+  if _session is None:
+    with _lock:
+      if _session is None:
+        _session = _build_session()
+  return _session
+
+
+def close():
+  """Close all pooled connections; the next request opens a new session."""
+  global _session
+  with _lock:
+    if _session is not None:
+      _session.close()
+    _session = None
+
+
+def request(method, url, **kwargs):
+  kwargs.setdefault("timeout", TIMEOUT)
+  ratelimit.LIMITER.acquire(url)
+  endpoint = metrics.endpoint(url)
+  start = time.perf_counter()
+  try:
+    response = session().request(method, url, **kwargs)
+  except requests.RequestException:
+    metrics.HTTP_RESPONSES.inc(endpoint=endpoint, status="error")
+    ratelimit.LIMITER.feedback(url)
+    raise
+  metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+  metrics.HTTP_RESPONSES.inc(endpoint=endpoint, status=str(response.status_code))
+  ratelimit.LIMITER.feedback(url, response.status_code, empty=len(response.content) == 0,
+                             retry_after=response.headers.get("Retry-After"))
+  return response
+
+
+def get(url, **kwargs):
+  return request("GET", url, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+  return request("POST", url, data=data, **kwargs)
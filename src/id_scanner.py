@@ -0,0 +1,187 @@
+"""
+Gap scanner for the station ids, used by DatabaseBuilder in "id" mode.
+
+The station ids in the database have gaps (e.g. 000102569 to 000102587),
+some of the ids in there are valid stations as well. The scanner probes
+the ids of the gaps concurrently, in batches; the requests are throttled by
+the rate limiter of http_client (see ratelimit.py).
+
+Gaps up to max_gap ids are scanned completely, of larger ones only edge
+ids at both ends (stations tend to come in runs of ids): the first and the
+last edge ids that aren't known to be invalid yet. So the edges move
+inwards run by run until the gap is done; stations found at an edge split
+the gap on the next run.
+
+Ids without a station go into a RangeSet (sorted, merged ranges), saved as
+json after every batch - they are never requested again:
+
+  {"ranges": [[102570, 102573], [102574, 102587]]}    # [start, end)
+
+  scanner = IdScanner(fetch, store, "database_builder/invalid_ids.json")
+  scanner.run(known_ids, deadline=time.time() + 30*60)
+
+fetch(id) returns the stations of an id ([] if it isn't one) and raises on
+errors (the id is probed again next time); store(stations) saves them.
+"""
+
+import bisect
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+ID_WIDTH = 9  # "000102569"
+
+
+class RangeSet:
+  """Set of ints as sorted, disjoint, merged ranges [start, end)."""
+
+  def __init__(self, ranges=()):
+    self.starts = list()
+    self.ends = list()
+    for start, end in ranges:
+      self.add_range(start, end)
+
+  def __contains__(self, value):
+    index = bisect.bisect_right(self.starts, value) - 1
+    return index >= 0 and value < self.ends[index]
+
+  def __len__(self):
+    """Number of ints in the set."""
+    return sum(end - start for start, end in zip(self.starts, self.ends))
+
+  def add(self, value):
+    self.add_range(value, value + 1)
+
+  def add_range(self, start, end):
+    """Add [start, end), merged with the overlapping and adjacent ranges."""
+    if start >= end:
+      return
+    first = bisect.bisect_left(self.ends, start)
+    last = bisect.bisect_right(self.starts, end)
+    if first < last:
+      start = min(start, self.starts[first])
+      end = max(end, self.ends[last - 1])
+    self.starts[first:last] = [start]
+    self.ends[first:last] = [end]
+
+  def ranges(self):
+    return list(zip(self.starts, self.ends))
+
+  def missing(self, start, end, reverse=False):
+    """The ints of [start, end) that are not in the set, ascending (the set may change meanwhile)."""
+    if reverse:
+      yield from self._missing_descending(start, end)
+      return
+    value = start
+    while value < end:
+      index = bisect.bisect_right(self.starts, value) - 1
+      if index >= 0 and value < self.ends[index]:
+        value = self.ends[index]
+        continue
+      stop = min(end, self.starts[index + 1]) if index + 1 < len(self.starts) else end
+      yield from range(value, stop)
+      value = stop
+
+  def _missing_descending(self, start, end):
+    value = end - 1
+    while value >= start:
+      index = bisect.bisect_right(self.starts, value) - 1
+      if index >= 0 and value < self.ends[index]:
+        value = self.starts[index] - 1
+        continue
+      stop = max(start, self.ends[index]) if index >= 0 else start
+      yield from range(value, stop - 1, -1)
+      value = stop - 1
+
+  @classmethod
+  def load(cls, path):
+    if not os.path.isfile(path):
+      return cls()
+    with open(path, encoding="utf-8") as file:
+      return cls(json.load(file)["ranges"])
+
+  def save(self, path):
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+      json.dump({"ranges": self.ranges()}, file)
+    os.replace(path + ".tmp", path)
+
+
+class IdScanner:
+  """Probes the gaps between known station ids concurrently (see module doc)."""
+
+  def __init__(self, fetch, store, invalid_path, workers=8, max_gap=1000, edge=50, width=ID_WIDTH):
+    self.fetch = fetch
+    self.store = store
+    self.invalid_path = invalid_path
+    self.invalid = RangeSet.load(invalid_path)
+    self.workers = workers
+    self.max_gap = max_gap
+    self.edge = edge
+    self.width = width
+    self.requests = 0
+    self.found = 0
+    self.failed = 0
+
+  def gaps(self, known_ids):
+    """[start, end) ranges between the known ids."""
+    known = sorted(set(known_ids))
+    for lower, upper in zip(known, known[1:]):
+      if upper - lower > 1:
+        yield lower + 1, upper
+
+  def candidates(self, known_ids):
+    """The ids to probe, not known to be invalid: of small gaps all, of large ones the edges."""
+    for start, end in self.gaps(known_ids):
+      if end - start <= max(self.max_gap, 2 * self.edge):
+        yield from self.invalid.missing(start, end)
+        continue
+      low = list(itertools.islice(self.invalid.missing(start, end), self.edge))
+      high = list(itertools.islice(self.invalid.missing(start, end, reverse=True), self.edge))
+      yield from low
+      yield from sorted(set(high) - set(low))
+
+  def _probe(self, id):
+    try:
+      return id, self.fetch(str(id).rjust(self.width, "0")), None
+    except Exception as error:
+      return id, None, error
+
+  def run(self, known_ids, deadline=None, max_requests=None):
+    """Probe the candidates until done, the deadline (time.time()) or max_requests; returns True if done."""
+    candidates = self.candidates([int(id) for id in known_ids])
+    size = self.workers * 4
+    start_requests = self.requests
+    with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan") as executor:
+      try:
+        while True:
+          if deadline is not None and time.time() > deadline:
+            return False
+          if max_requests is not None and self.requests - start_requests >= max_requests:
+            return False
+          batch = [id for _, id in zip(range(size), candidates)]
+          if not batch:
+            return True
+          results = list(executor.map(self._probe, batch))
+          self.requests += len(batch)
+          stations = list()
+          for id, found, error in results:
+            if error is not None:
+              self.failed += 1
+            elif found:
+              stations.extend(found)
+            else:
+              self.invalid.add(id)
+          if stations:
+            self.found += len(stations)
+            self.store(stations)
+          self.invalid.save(self.invalid_path)
+          if all(error is not None for _, _, error in results):  # the api is down or blocks us
+            return False
+      finally:
+        self.invalid.save(self.invalid_path)
@@ -0,0 +1,127 @@
+"""
+Persistent store of the tracked trains and their next poll time (sqlite).
+
+Management saves every scheduled processTrain job here, so a restart
+doesn't lose the trains. On startup resume() plans the restart:
+ - runs that finished while we were down are dropped,
+ - overdue polls are caught up in priority order (the trains that finish
+   first, first) and spread out (catch_up_rate polls per second) instead
+   of firing all at once,
+ - every poll that didn't happen on time is recorded as a missed
+   observation (table missed), so the gaps in the data are known.
+
+The train (records.BoardEntry from the board) is stored pickled.
+"""
+
+import pickle
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import metrics
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id TEXT PRIMARY KEY,
+  train BLOB NOT NULL,
+  nextRun REAL NOT NULL,
+  finishesAt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS missed (
+  id TEXT NOT NULL,
+  due REAL NOT NULL,
+  noticed REAL NOT NULL,
+  reason TEXT NOT NULL
+);
+"""
+OVERDUE = "overdue"  # the poll was late, caught up after the restart
+FINISHED = "finished"  # the run finished while we were down
+
+
+def finishes_at(train):
+  """Planed arrival at the endstation of a BoardEntry."""
+  if train.partial_route:
+    return train.partial_route[-1][-1]
+  return train.planed_time
+
+
+class JobStore:
+  """Tracked trains in sqlite; safe to use from the scheduler threads."""
+
+  def __init__(self, path="jobs.db"):
+    self.path = path
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    self.connection.execute("PRAGMA journal_mode=WAL")
+    self.connection.execute("PRAGMA synchronous=NORMAL")
+    self.connection.executescript(SCHEMA)
+    self._lock = threading.Lock()
+
+  def save(self, id, train, next_run):
+    """Insert or update the job of a train."""
+    with self._lock, metrics.WRITE_LATENCY.time(store="jobstore"), self.connection:
+      self.connection.execute(
+        "INSERT INTO jobs (id, train, nextRun, finishesAt) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET nextRun = excluded.nextRun",
+        (id, pickle.dumps(train), next_run.timestamp(), finishes_at(train).timestamp()))
+
+  def delete(self, id):
+    with self._lock, self.connection:
+      self.connection.execute("DELETE FROM jobs WHERE id = ?", (id,))
+
+  def load(self):
+    """All jobs as (id, train, next run), in one query."""
+    with self._lock:
+      rows = self.connection.execute("SELECT id, train, nextRun FROM jobs").fetchall()
+    return [(id, pickle.loads(train), datetime.fromtimestamp(next_run)) for id, train, next_run in rows]
+
+  def resume(self, now=None, finished_after=timedelta(minutes=30), catch_up_rate=10):
+    """Return the jobs to schedule after a restart as [(id, train, run at)], see module doc.
+
+    finished_after: a run counts as finished that long after its planed arrival
+    catch_up_rate: overdue polls per second
+    """
+    now = now or datetime.now()
+    plan = list()
+    overdue = list()
+    dropped = list()
+    missed = list()
+    for id, train, next_run in self.load():
+      if finishes_at(train) + finished_after < now:
+        dropped.append((id,))
+        missed.append((id, next_run.timestamp(), now.timestamp(), FINISHED))
+      elif next_run < now:
+        overdue.append((finishes_at(train), id, train))
+        missed.append((id, next_run.timestamp(), now.timestamp(), OVERDUE))
+      else:
+        plan.append((id, train, next_run))
+
+    overdue.sort(key=lambda job: job[0])
+    for index, (_, id, train) in enumerate(overdue):
+      plan.append((id, train, now + timedelta(seconds=index / catch_up_rate)))
+
+    with self._lock, self.connection:
+      self.connection.executemany("DELETE FROM jobs WHERE id = ?", dropped)
+      self.connection.executemany("INSERT INTO missed (id, due, noticed, reason) VALUES (?, ?, ?, ?)", missed)
+      self.connection.executemany("UPDATE jobs SET nextRun = ? WHERE id = ?",
+                                  [(run_at.timestamp(), id) for id, _, run_at in plan])
+    return plan
+
+  def missed(self, id=None):
+    """Missed observations as (id, due, noticed, reason)."""
+    query = "SELECT id, due, noticed, reason FROM missed"
+    parameters = ()
+    if id is not None:
+      query += " WHERE id = ?"
+      parameters = (id,)
+    with self._lock:
+      rows = self.connection.execute(query + " ORDER BY due", parameters).fetchall()
+    return [(id, datetime.fromtimestamp(due), datetime.fromtimestamp(noticed), reason) for id, due, noticed, reason in rows]
+
+  def __len__(self):
+    with self._lock:
+      return self.connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+  def close(self):
+    with self._lock:
+      self.connection.close()
@@ -60,21 +60,48 @@ TODO: Wie wird mit sich ändernden An-/Abfahrtszeiten verfahren?
 
 
 from api import Station, Train
-import schedule
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.events import EVENT_JOB_EXECUTED
-import time
+from hotstate import HotState
+from writebehind import WriteBehind
+from polling import PollingPolicy
+from pipeline import ParsePipeline
+import archive
+import columnar
+import diff
+from scheduler import Scheduler
+from jobstore import JobStore
+from geo import StationIndex
+import metrics
+import profiling
+from sharding import Cluster
 from datetime import datetime, timedelta
 import redis
-import sqlite3
-# import asyncio
-# import threading
+import asyncio
+import os
+import signal
+import threading
 
 def wrapper(func):
   def inner(*args, **kwargs):
     pass
   return inner
 
+ARCHIVE_PATH = "archive"
+JOBS_PATH = "jobs.db"
+CONNECTIONS_PATH = "connections.sql"
+STATIONS_PATH = os.path.join("stations", "stations.db")  # see database_builder.py
+STATION_INTERVAL = 5*60  # seconds between two calls of a station
+REQUESTS_PER_HOUR = 3600  # budget of the train polls
+STATION_JITTER = 10  # seconds, spreads the station calls
+TRAIN_JITTER = 5  # seconds, spreads trains with the same next stop time
+HEARTBEAT_INTERVAL = 5  # seconds, membership of the collector processes (see sharding.py)
+METRICS_PORT = 9108  # http://127.0.0.1:9108/metrics (see metrics.py)
+METRICS_LOG_INTERVAL = 60  # seconds between two metrics log lines
+PROFILES_PATH = "profiles"  # flamegraphs and stage timers (see profiling.py)
+PROFILE_DURATION = 5*60  # seconds of profiling after kill -USR1 <pid>
+COLUMNAR_PATH = "analytics"  # the departures dataset (see columnar.py)
+BOARDS_INTERVAL = 15*60  # seconds between two writes of the called boards
+_last_bhftafel_version = None
+
 def _track_bhftafel_version(version):
   """Track version changes of bhftafel.
   
@@ -85,21 +112,68 @@ def _track_bhftafel_version(version):
     OR Only get the train-urls from Station and save the raw-html from Train.
     If a review of the version-changes is completed -> extract data from the raw htmls
       and go back to normal.
+
+  The raw pages go into the archive (see archive.py), which is switched on with
+  the first version change and stays on until the review is done.
   """
-  pass
+  global _last_bhftafel_version
+  if version is None or version == _last_bhftafel_version:
+    return None
+  if _last_bhftafel_version is not None:
+    print(f"bhftafel version changed: {_last_bhftafel_version} -> {version}. Archiving raw pages.")
+    if archive.ARCHIVE is None:
+      archive.configure(ARCHIVE_PATH)
+  _last_bhftafel_version = version
+  return None
+
+def trainId(train):
+  """id of a train from its board entry: name, endstation and the planed time there"""
+  id = train.train_name + train.endstation + str(train.partial_route[-1][-1])
+  return id.replace(" ", "")
 
 class Management:
-  def __init__(self):
-    self.run()
+  def __init__(self, mode="static", area=None, profile=None):
+    """
+    profile: profile the first <profile> seconds (see profiling.py);
+      a running collector is profiled for PROFILE_DURATION on SIGUSR1
+    """
+    if profile:
+      profiling.configure(PROFILES_PATH, duration=profile)
+    self.snapshots = dict()  # train id -> last TrainRun, to find the changes
+    self.stations = list()  # all stations of the mode, this collector calls the ones it owns
+    self.boards = list()  # (station, board) since the last writeBoards
+    self.boardsLock = threading.Lock()
+    self.run(mode, area)
 
   def callStaticStations(self):
     """
     registers the specified stations once and schedules recurring calls to them
     """
     stations = ["Isernhagen"]
+    self.scheduleStations(stations)
+
+  def callGeoStations(self, area):
+    """
+    registers the stations of an area and schedules recurring calls to them
+
+    area: {"bbox": (south, west, north, east)}, {"center": (lat, lng), "radius": km}
+      or {"polygon": [(lat, lng), ...]}; the stations come from the stations database (see geo.py)
+    """
+    stations = StationIndex(STATIONS_PATH).select(area)
+    print(f"{len(stations)} stations in {area}")
+    self.scheduleStations(stations)
+
+  def scheduleStations(self, stations):
+    """
+    schedules a call to every station (owned by this collector) each STATION_INTERVAL;
+    the first calls are spread over the interval
+    """
+    self.stations = list(stations)
+    stations = [station for station in self.stations if self.cluster.owns(station)]
+    now = datetime.now()
     for index, station in enumerate(stations):
-      delaySeconds = 5*60 + index*30
-      schedule.every(delaySeconds).seconds.do(self.callStation, station=station)
+      firstCall = now + timedelta(seconds=index * STATION_INTERVAL / len(stations))
+      self.scheduler.add(f"station:{station}", self.callStation, station, run_at=firstCall, interval=STATION_INTERVAL, jitter=STATION_JITTER)
 
   def callStation(self, station):
     """
@@ -107,20 +181,23 @@ class Management:
   
     gets called on a schedule 
     """
-    data = Station(station).init()
+    stationApi = Station(station, check_version=True)
+    data = self.pipeline.fetch(stationApi)
+    _track_bhftafel_version(stationApi.bhftafel_version)
+    if self.columnar is not None:
+      with self.boardsLock:
+        self.boards.append((station, data))
     for train in data:
-      trainName = train["trainName"]
-      trainEndstation = train["endstation"]
-      trainEndstationPlanedTime = train["partialRoute"][-1][-1]
-      id = trainName + trainEndstation + str(trainEndstationPlanedTime)
-      id = id.replace(" ", "")
+      id = trainId(train)
       # annahme: eine zugnummer taucht nur einmal am tag auf
       # zusatz: add the planedTime of arrival at the endstation
 
-      if id not in list(map(lambda x: x.id, self.scheduler.get_jobs())):
-        self.scheduler.add_job(self.processTrain, args=[train], id=id)
-    now = datetime.now()
-    print(f"{station} was called at {now}")
+      # the train may belong to another collector (see sharding.py)
+      self.cluster.register(id, train)
+      if self.cluster.owns(id) and id not in self.scheduler:
+        metrics.TRAINS.inc(event="discovered")
+        self.jobStore.save(id, train, datetime.now())
+        self.scheduler.add(id, self.processTrain, train)
 
   def processTrain(self, train):
     """
@@ -139,91 +216,225 @@ class Management:
      b. schedule to next time (in the train-data)
     """
 
-    trainData = Train(train["trainUrl"]).init()
-    date = trainData["trainDate"]
+    # only the collector with the lease polls the train (see sharding.py)
+    # one id for the job, the job store, the registry, the lease, redis and the polling policy:
+    # the one of callStation (the train page may rename or cancel the last stop later on)
+    id = trainId(train)
+    if not self.cluster.claim(id):
+      if self.cluster.owns(id):  # the previous owner still holds the lease
+        self.scheduler.add(id, self.processTrain, train, run_at=datetime.now()+timedelta(seconds=self.cluster.ttl), jitter=TRAIN_JITTER)
+      return
+
+    # download here, parse in a parser process (see pipeline.py)
+    trainData = self.pipeline.fetch(Train(train.train_url))
+    date = trainData.train_date
 
-    # create unique id - second try : this id is the same as the one in callStation
-    name = trainData["trainName"]
-    trainRoute = list(trainData["route"].values())
-    lastStation = trainRoute[-1]["station"]
-    lastStationPlanedTime = trainRoute[-1]["planedArrTime"]
-    id = name + lastStation + str(lastStationPlanedTime)
-    id = id.replace(" ", "")
+    # only for the name of the job
+    name = trainData.train_name
+    lastStation = trainData.route[-1].station if trainData.route else train.endstation
 
     # store the current active trains in a redis-db
     # if the trains become inactive they're being stored in the actual permanant db 
-    ids = self.redis.keys()
-    if id in ids:
-      oldTrainData = self.redis.json().get(id)  # TODO: only get values that could change
-      # TODO: check for changes
-      self.redis.json().set(id, ".", "test")# trainData)  # TODO: check out redis-om for saving datetime objects natively
-    else:
-      self.redis.json().set(id, ".", "test")# trainData)
+    # only the changes since the last poll are stored, as compact events (see diff.py)
+    # the snapshot and the events live in redis (see hotstate.py), self.snapshots saves the read
+    oldTrainData = self.snapshots.get(id)
+    if oldTrainData is None:
+      oldTrainData = self.hotState.snapshot(id)
+    with profiling.stage("diff"):
+      events = diff.diff(oldTrainData, trainData)
+    with profiling.stage("store"):
+      self.hotState.update(id, oldTrainData, trainData, events)
+    self.snapshots[id] = trainData
+    metrics.TRAINS.inc(event="polled")
 
     # when should the next request be made?
-    # first mode: next time (next stop)
-    currentTime = datetime.now()
-    allTimes = list()
-    nextRequestTime = None
-    for stops in trainData["route"].values():
-      a = stops["delayedArrTime"]
-      b = stops["delayedDepTime"]
-      c = stops["planedArrTime"]
-      d = stops["planedDepTime"]
-      allTimes.extend([a,b,c,d])
-    for time in sorted(filter(lambda x: isinstance(x, datetime), allTimes)):
-      if time > currentTime:   # maybe add a few minutes to currentTime
-        nextRequestTime = time
-        scheduledJobs = self.scheduler.get_jobs()
-        if id in [job.id for job in scheduledJobs]:
-          print(name, nextRequestTime, "!modified!")
-          self.scheduler.reschedule_job(job_id=id, trigger="date", run_date=nextRequestTime)
+    # within the request budget, by priority (see polling.py); at the latest at the next stop
+    with profiling.stage("schedule"):
+      currentTime = datetime.now()
+      nextRequestTime = self.pollingPolicy.observe(id, trainData, currentTime)
+      if nextRequestTime is not None:
+        self.jobStore.save(id, train, nextRequestTime)
+        # adding a job with the same id reschedules it
+        self.scheduler.add(id, self.processTrain, train, run_at=nextRequestTime, jitter=TRAIN_JITTER, name=f"{name} on the {date} to {lastStation}")
+      else:
+        allTimes = [time for stop in trainData.route for time in stop.times()]
+        if len(allTimes) == 0 or currentTime - timedelta(minutes=30) > max(allTimes):
+          # redis -> permanent database; removed from redis once it is written (see archivedTrains)
+          self.scheduler.remove(id)
+          self.jobStore.delete(id)
+          self.pollingPolicy.finish(id, trainData)
+          self.writeBehind.put(id, trainData, self.hotState.events(id))
+          self.snapshots.pop(id, None)
+          self.cluster.unregister(id)
+          self.cluster.release(id)
+          metrics.TRAINS.inc(event="finished")
         else:
-          print(name, nextRequestTime, "!scheduled!")
-          self.scheduler.add_job(self.processTrain, args=[train], id=id, name=f"{name} on the {date} to {lastStation}", trigger="date", run_date=nextRequestTime)
-        break
+          self.jobStore.save(id, train, currentTime+timedelta(minutes=15))
+          self.scheduler.add(id, self.processTrain, train, run_at=currentTime+timedelta(minutes=15), jitter=TRAIN_JITTER)
+
+
+  def resumeTrains(self):
+    """
+    schedules the trains of the job store again (after a restart)
+
+    finished runs are dropped, overdue ones are caught up one after another;
+    the missed observations are recorded in the job store
+    """
+    plan = self.jobStore.resume()
+    for id, train, runAt in plan:
+      self.cluster.register(id, train)
+      self.scheduler.add(id, self.processTrain, train, run_at=runAt)
+    # trains in redis without a job are finished, but not yet in the permanent database;
+    # the index has the trains of all collectors, the others still poll theirs
+    tracked = set(id for id, _, _ in plan)
+    for id in self.hotState.active() - tracked:
+      if not self.cluster.owns(id):
+        continue
+      snapshot = self.hotState.snapshot(id)
+      if snapshot is not None:
+        self.writeBehind.put(id, snapshot, self.hotState.events(id))
+    print(f"resumed {len(plan)} trains, {len(self.jobStore.missed())} missed observations so far")
+
+  def heartbeat(self):
+    """
+    membership of this collector; rebalances when a collector joined or died,
+    otherwise takes over the trains the other collectors found for this one
+    """
+    if self.cluster.heartbeat():
+      print("collectors:", sorted(self.cluster.members()))
+      self.rebalance()
     else:
-      if currentTime - timedelta(minutes=30) > time:
-        # self.sqlCursor.execute("")  #TODO: add to permanent database
-        self.scheduler.remove_job(id)
-        self.redis.delete(id)
-      else:
-        self.scheduler.reschedule_job(job_id=id, trigger="date", run_date=currentTime+timedelta(minute=15))
+      trains = self.cluster.inbox()
+      metrics.TRAINS.inc(len(trains), event="discovered")
+      self.scheduleTrains(trains)
+
+  def rebalance(self):
+    """
+    schedules the stations and trains this collector owns now and drops the others
+    """
+    for station in self.stations:
+      jobId = f"station:{station}"
+      if self.cluster.owns(station) and jobId not in self.scheduler:
+        self.scheduler.add(jobId, self.callStation, station, interval=STATION_INTERVAL, jitter=STATION_JITTER)
+      elif not self.cluster.owns(station):
+        self.scheduler.remove(jobId)
+    lost = [job.id for job in self.scheduler.jobs() if job.func == self.processTrain and not self.cluster.owns(job.id)]
+    for id in lost:
+      self.scheduler.remove(id)
+      self.jobStore.delete(id)
+      self.snapshots.pop(id, None)
+      self.pollingPolicy.forget(id)
+    self.cluster.release(*lost)
+    self.cluster.inbox()  # contained in the registry
+    self.scheduleTrains(self.cluster.trains())
+
+  def scheduleTrains(self, trains):
+    """
+    schedules the trains ({id: train}) of the registry this collector doesn't poll yet
+    """
+    now = datetime.now()
+    for id, train in trains.items():
+      if id not in self.scheduler:
+        self.jobStore.save(id, train, now)
+        self.scheduler.add(id, self.processTrain, train, jitter=TRAIN_JITTER)
+
+  def writeBoards(self):
+    """
+    appends the called boards to the departures dataset, every BOARDS_INTERVAL and on shutdown
+    """
+    with self.boardsLock:
+      boards, self.boards = self.boards, list()
+    if boards:
+      self.columnar.write_boards(boards)
+
+  def archivedTrains(self, ids):
+    """
+    called by the write-behind, when finished trains are in the permanent database
+    """
+    self.hotState.remove(*ids)
 
+  def eventCall(self, job, exception):
+    """
+    called after every job; only the failures are logged, the rest is in the metrics
+    """
+    if exception:
+      print(datetime.now(), job.name or job.id, "failed:", exception)
 
-  def eventCall(self, event):
-    print(datetime.now())
-    print(event)
-    print("-------------")
-    print("jobs scheduled: ", self.scheduler.get_jobs())
+  def logMetrics(self):
+    """
+    one compact line of the metrics, every METRICS_LOG_INTERVAL
+    """
+    stats = self.pollingPolicy.stats()
+    print(datetime.now(), metrics.summary(), f"polls/h={stats['pollsLastHour']}/{stats['budgetPerHour']}")
 
-  def run(self, mode="static"):
-    self.sqlConnection = sqlite3.connect("connections.sql")
-    self.sqlCursor = self.sqlConnection.cursor()
+  def profileSignal(self, signum, frame):
+    """
+    SIGUSR1: profile for PROFILE_DURATION seconds
+    """
+    print(f"profiling for {PROFILE_DURATION}s")
+    profiling.configure(PROFILES_PATH, duration=PROFILE_DURATION)
+
+  def run(self, mode="static", area=None):
     self.redis = redis.Redis(host="localhost", port=6379, db=2, decode_responses=True)
-    self.scheduler = BackgroundScheduler(job_defaults={"max_instances": 2})
-    ## TODO: make the database for the scheduled task persistent, because I need to implement a traffic limit and dont want to lose tasks (but need to implement 
-    #        a way to resume gracefully; i.e. some task won't be useful anymore, so I need to account and show, that details might have been lost)
-    self.scheduler.start()
-    self.scheduler.add_listener(self.eventCall, EVENT_JOB_EXECUTED)
+    self.hotState = HotState(self.redis)
+    # finished trains go to the permanent database in batches (see writebehind.py)
+    self.writeBehind = WriteBehind(CONNECTIONS_PATH, on_flushed=self.archivedTrains)
+    self.scheduler = Scheduler()
+    self.pipeline = ParsePipeline()
+    self.pollingPolicy = PollingPolicy(REQUESTS_PER_HOUR)
+    # the scheduled trains are persistent, see jobstore.py
+    self.jobStore = JobStore(JOBS_PATH)
+    # stations and trains are split between the running collectors (see sharding.py)
+    self.cluster = Cluster(self.redis)
+    self.cluster.heartbeat()
+    self.scheduler.add("cluster:heartbeat", self.heartbeat, interval=HEARTBEAT_INTERVAL)
+    self.scheduler.listeners.append(self.eventCall)
+    metrics.JOBS_PENDING.set_function(lambda: len(self.scheduler))
+    metrics.POLL_COVERAGE.set_function(lambda: self.pollingPolicy.stats()["coverage"])
+    metrics.POLLS_ALLOCATED.set_function(lambda: self.pollingPolicy.stats()["allocatedPerHour"])
+    metrics.ACTIVE_TRAINS.set_function(lambda: self.pollingPolicy.stats()["activeTrains"])
+    try:
+      metrics.METRICS.serve(METRICS_PORT)
+    except OSError as error:  # e.g. another collector on this host has the port
+      print(f"no metrics endpoint on port {METRICS_PORT}: {error}")
+    self.scheduler.add("metrics:log", self.logMetrics, interval=METRICS_LOG_INTERVAL)
+    # the boards with their issues go into a parquet dataset, if pyarrow is there (see columnar.py)
+    try:
+      self.columnar = columnar.ColumnarArchive(COLUMNAR_PATH)
+      self.scheduler.add("columnar:boards", self.writeBoards, interval=BOARDS_INTERVAL)
+    except ImportError as error:
+      self.columnar = None
+      print(f"no departures dataset: {error}")
+    if hasattr(signal, "SIGUSR1"):  # not on windows
+      signal.signal(signal.SIGUSR1, self.profileSignal)
+    self.resumeTrains()
 
     if mode == "static":
       self.callStaticStations()
-    # TODO: add different modes, i.e. geo-infos
+    elif mode == "geo":
+      self.callGeoStations(area)
     else:
       print("wrong or no mode given")
+    # drop the resumed trains of other collectors, take over the ones of dead collectors
+    self.rebalance()
       
     # TODO: Can I use a context manager here?  Too initalize the databases and
     #       the connections and all that?
     try:
-      while True:
-        schedule.run_pending()
-        time.sleep(1)
+      asyncio.run(self.scheduler.run())
     except KeyboardInterrupt:
       self.scheduler.shutdown()
-      self.sqlCursor.close()
-      self.sqlConnection.close()
-      self.redis.flushdb()
+      # the other collectors take over right away
+      self.cluster.release(*[job.id for job in self.scheduler.jobs() if job.func == self.processTrain])
+      self.cluster.leave()
+      self.pipeline.close()
+      self.writeBehind.close()
+      if self.columnar is not None:
+        self.writeBoards()
+      metrics.METRICS.close()
+      profiling.stop()
+      self.jobStore.close()
+      # redis is kept: the events of the active trains are needed on resume
     else:
       pass  # Close the databases and all that.
 
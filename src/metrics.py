@@ -0,0 +1,305 @@
+"""
+Counters, gauges and histograms of the collector, in the Prometheus text
+format on a local http endpoint, and as a compact log line.
+
+  METRICS.serve(9108)        # http://127.0.0.1:9108/metrics
+  print(metrics.summary())   # requests=120 p50=85ms p95=410ms errors=2 parse p95=11ms lag p95=0.03s ...
+
+The metrics of the collector are defined here (REQUEST_LATENCY, ...) and
+recorded where it happens: http_client/api_async (requests), api/pipeline
+(parsing), scheduler (lag), hotstate/writebehind/jobstore (writes),
+ratelimit (waits), main (trains, polling policy).
+
+No dependency; metrics with labels keep one series per label values.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+  return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+  pairs = list(zip(names, values)) + list(extra)
+  if not pairs:
+    return ""
+  return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+  if value is None:  # e.g. no finished train yet
+    return "NaN"
+  if value == float("inf"):
+    return "+Inf"
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+  kind = None
+
+  def __init__(self, name, help, labels=()):
+    self.name = name
+    self.help = help
+    self.labels = tuple(labels)
+    self._series = dict()  # label values -> value
+    self._lock = threading.Lock()
+
+  def _key(self, labels):
+    if set(labels) != set(self.labels):
+      raise ValueError(f"{self.name} has the labels {self.labels}, not {tuple(labels)}")
+    return tuple(labels[name] for name in self.labels)
+
+  def _header(self):
+    return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+  """A value that only goes up (requests, errors, ...)."""
+  kind = "counter"
+
+  def inc(self, amount=1, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._series[key] = self._series.get(key, 0) + amount
+
+  def value(self, **labels):
+    """Value of one series; without labels the total over all series."""
+    with self._lock:
+      if labels:
+        return self._series.get(self._key(labels), 0)
+      return sum(self._series.values())
+
+  def render(self):
+    with self._lock:
+      series = sorted(self._series.items())
+    return self._header() + [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in series]
+
+
+class Gauge(Counter):
+  """A current value (jobs pending, ...); set() or a function that is read on collection."""
+  kind = "gauge"
+
+  def __init__(self, name, help, labels=()):
+    super().__init__(name, help, labels)
+    self.function = None
+
+  def set(self, value, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._series[key] = value
+
+  def set_function(self, function):
+    """Read the (unlabeled) value from function(), e.g. lambda: len(scheduler)."""
+    self.function = function
+
+  def value(self, **labels):
+    if self.function is not None and not labels:
+      return self.function()
+    return super().value(**labels)
+
+  def render(self):
+    if self.function is not None:
+      return self._header() + [f"{self.name} {_number(self.function())}"]
+    return super().render()
+
+
+class Histogram(_Metric):
+  """Distribution of durations (seconds) in cumulative buckets."""
+  kind = "histogram"
+
+  def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+    super().__init__(name, help, labels)
+    self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value, **labels):
+    key = self._key(labels)
+    index = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      series = self._series.get(key)
+      if series is None:
+        series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]  # counts (last: +Inf), sum, count
+      series[0][index] += 1
+      series[1] += value
+      series[2] += 1
+
+  @contextmanager
+  def time(self, **labels):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - start, **labels)
+
+  def _merged(self, labels):
+    with self._lock:
+      if labels:
+        selected = [self._series.get(self._key(labels))]
+      else:
+        selected = list(self._series.values())
+      counts = [0] * (len(self.buckets) + 1)
+      total, count = 0.0, 0
+      for series in selected:
+        if series is None:
+          continue
+        counts = [a + b for a, b in zip(counts, series[0])]
+        total += series[1]
+        count += series[2]
+    return counts, total, count
+
+  def count(self, **labels):
+    return self._merged(labels)[2]
+
+  def sum(self, **labels):
+    return self._merged(labels)[1]
+
+  def quantile(self, q, **labels):
+    """Estimate (linear within the bucket); without labels over all series. None without observations."""
+    counts, _, count = self._merged(labels)
+    if count == 0:
+      return None
+    rank = q * count
+    cumulative = 0
+    for index, bucket_count in enumerate(counts):
+      if cumulative + bucket_count >= rank and bucket_count:
+        if index == len(self.buckets):  # beyond the last bucket
+          return self.buckets[-1]
+        lower = self.buckets[index - 1] if index else 0.0
+        return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+      cumulative += bucket_count
+    return self.buckets[-1]
+
+  def render(self):
+    lines = self._header()
+    with self._lock:
+      series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+    for key, (counts, total, count) in series:
+      cumulative = 0
+      for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+        cumulative += bucket_count
+        lines.append(f"{self.name}_bucket{_labels(self.labels, key, [('le', _number(bound))])} {cumulative}")
+      lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+      lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+    return lines
+
+
+class Registry:
+  """All metrics of the process; render() is the Prometheus text format."""
+
+  def __init__(self):
+    self.metrics = dict()
+    self._lock = threading.Lock()
+    self.server = None
+
+  def _get(self, kind, name, help, **options):
+    with self._lock:
+      metric = self.metrics.get(name)
+      if metric is None:
+        metric = self.metrics[name] = kind(name, help, **options)
+      elif not isinstance(metric, kind):
+        raise ValueError(f"{name} is a {metric.kind}")
+      return metric
+
+  def counter(self, name, help, labels=()):
+    return self._get(Counter, name, help, labels=labels)
+
+  def gauge(self, name, help, labels=()):
+    return self._get(Gauge, name, help, labels=labels)
+
+  def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return self._get(Histogram, name, help, labels=labels, buckets=buckets)
+
+  def render(self):
+    with self._lock:
+      metrics = list(self.metrics.values())
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+  def serve(self, port=9108, host="127.0.0.1"):
+    """Serve /metrics in a background thread; returns the server."""
+    registry = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+          self.send_error(404)
+          return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass
+
+    self.server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+    return self.server
+
+  def close(self):
+    if self.server is not None:
+      self.server.shutdown()
+      self.server.server_close()
+      self.server = None
+
+
+def endpoint(url):
+  """Label of a url: host and path, without the query."""
+  parts = urlsplit(url)
+  return f"{parts.hostname or ''}{parts.path}"
+
+
+METRICS = Registry()
+
+REQUEST_LATENCY = METRICS.histogram("collector_request_seconds", "Latency of the outgoing requests.", labels=("endpoint",))
+HTTP_RESPONSES = METRICS.counter("collector_responses_total", "Answers by http status (error: no answer).", labels=("endpoint", "status"))
+PARSE_DURATION = METRICS.histogram("collector_parse_seconds", "Time to parse a page.", labels=("page",))
+SCHEDULER_LAG = METRICS.histogram("collector_scheduler_lag_seconds", "Delay between the due time and the start of a job.")
+JOBS_PENDING = METRICS.gauge("collector_jobs_pending", "Scheduled jobs.")
+JOB_RUNS = METRICS.counter("collector_job_runs_total", "Executed jobs by outcome.", labels=("outcome",))
+WRITE_LATENCY = METRICS.histogram("collector_write_seconds", "Latency of the writes to redis and sqlite.", labels=("store",))
+TRAINS = METRICS.counter("collector_trains_total", "Trains discovered on the boards, polled and finished.", labels=("event",))
+RATELIMIT_WAIT = METRICS.histogram("collector_ratelimit_wait_seconds", "Time a request waited for the rate limiter.", labels=("host",))
+POLL_COVERAGE = METRICS.gauge("collector_poll_coverage_ratio", "Stops of the finished trains observed around their time (see polling.py).")
+POLLS_ALLOCATED = METRICS.gauge("collector_polls_allocated_per_hour", "Polls per hour the polling policy allocates to the active trains.")
+ACTIVE_TRAINS = METRICS.gauge("collector_active_trains", "Trains the polling policy schedules.")
+
+
+def summary():
+  """One compact log line of the collector metrics."""
+  def milliseconds(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+  def seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+  def percent(value):
+    return "-" if value is None else f"{value * 100:.0f}%"
+
+  with HTTP_RESPONSES._lock:
+    errors = sum(value for (_, status), value in HTTP_RESPONSES._series.items()
+                 if status in ("error", "429") or status.startswith("5"))
+  return " ".join([
+    f"requests={REQUEST_LATENCY.count()}",
+    f"p50={milliseconds(REQUEST_LATENCY.quantile(0.5))}",
+    f"p95={milliseconds(REQUEST_LATENCY.quantile(0.95))}",
+    f"errors={errors}",
+    f"parse p95={milliseconds(PARSE_DURATION.quantile(0.95))}",
+    f"lag p95={seconds(SCHEDULER_LAG.quantile(0.95))}",
+    f"jobs={JOBS_PENDING.value()}",
+    f"trains active={ACTIVE_TRAINS.value()} polled={TRAINS.value(event='polled')} finished={TRAINS.value(event='finished')}",
+    f"coverage={percent(POLL_COVERAGE.value())}",
+    f"allocated/h={POLLS_ALLOCATED.value():.0f}",
+    f"redis p95={milliseconds(WRITE_LATENCY.quantile(0.95, store='redis'))}",
+    f"sqlite p95={milliseconds(WRITE_LATENCY.quantile(0.95, store='sqlite'))}",
+    f"ratelimit wait={seconds(RATELIMIT_WAIT.sum())}",
+  ])
@@ -0,0 +1,238 @@
+"""
+Parser engines for the bhftafel- and traininfo-pages.
+
+An engine only pulls the raw strings out of the html (the "raw page").
+Turning these strings into datetimes, delays, etc. is done in api.Station and
+api.Train, so every engine returns exactly the same data packages.
+
+engines:
+ - "html.parser": BeautifulSoup with the pure-python html.parser (default)
+ - "lxml": lxml.html with precompiled XPath-expressions (needs lxml)
+"""
+
+import re
+
+from bs4 import BeautifulSoup
+
+try:
+  from lxml import etree
+  from lxml import html as lxml_html
+except ImportError:  # lxml is optional
+  etree = None
+  lxml_html = None
+
+
+JOURNEY_ROW = re.compile(r"^journeyRow_\d+")
+TRAIN_ROW = re.compile(r"tqRow trainrow_\d")
+STATION_CLASS = re.compile("station")
+
+
+def _plain(text):
+  """NavigableString (or lxml's string result) -> str; None stays None."""
+  return str(text) if text is not None else None
+
+
+class Bs4Engine:
+  """Extract the raw pages with BeautifulSoup and the "html.parser"."""
+
+  name = "html.parser"
+
+  def station_page(self, html_document):
+    parsed_html = BeautifulSoup(html_document, "html.parser")
+
+    page = dict()
+    script = parsed_html.find("script")
+    page["script"] = "".join(script.stripped_strings) if script is not None else ""
+    page["dates_text"] = "".join(parsed_html.find("div", id="sqResult").h2.strong.stripped_strings)
+    other_stations_text = parsed_html.find("p", "lastParagraph").find_all("a")
+    page["other_stations"] = ["".join(a.stripped_strings) for a in other_stations_text]
+
+    page["rows"] = list()
+    for row in parsed_html.find_all("tr", id=JOURNEY_ROW):
+      raw_row = dict()
+      platform = row.find("td", "platform")
+      raw_row["platform"] = None
+      raw_row["platformNumber"] = None
+      if platform is not None:
+        raw_row["platform"] = "".join(platform.stripped_strings)
+        platform_number = platform.find("strong")
+        if platform_number is not None:
+          raw_row["platformNumber"] = "".join(platform_number.stripped_strings)
+
+      raw_row["time"] = str(row.find("td", "time").string)
+      raw_row["transportationTypePic"] = row.find("td", "train").a.img["src"]
+      train_name_field = row.find_all("td", "train")[-1]
+      raw_row["trainHref"] = str(train_name_field.a["href"])
+      raw_row["trainName"] = list(train_name_field.stripped_strings)
+
+      route = row.find("td", "route")
+      raw_row["endstation"] = "".join(route.span.a.stripped_strings)
+      # sometimes there is extra info (mostly in red) in the route-box
+      # TODO: what do I do with this information?
+      while route.find("div"):
+        route.div.extract()
+      raw_row["route"] = list(route.stripped_strings)
+
+      raw_row["issues"] = "".join(row.find("td", "ris").stripped_strings)
+      page["rows"].append(raw_row)
+    return page
+
+  def train_page(self, html_document):
+    parsed_html = BeautifulSoup(html_document, "html.parser")
+
+    page = dict()
+    page["remarks"] = list(parsed_html.find("div", "tqRemarks").stripped_strings)
+    page["title"] = _plain(parsed_html.find("div", class_="tqResults").find_next("h1").string)
+    page["trainroute"] = str(parsed_html.find("h3", class_="trainroute"))
+
+    page["rows"] = list()
+    for row in parsed_html.find_all("div", class_=TRAIN_ROW):
+      raw_row = dict()
+      raw_row["station"] = _plain(row.find("div", class_=STATION_CLASS).find("a").string)
+      raw_row["arrival"] = list(row.find("div", class_="arrival").stripped_strings)
+      raw_row["departure"] = list(row.find("div", class_="departure").stripped_strings)
+      raw_row["platform"] = list(row.find("div", class_="platform").stripped_strings)
+      raw_row["issues"] = list(row.find("div", class_="ris").stripped_strings)
+      page["rows"].append(raw_row)
+    return page
+
+
+def _has_class(class_name):
+  """XPath-predicate that behaves like bs4's find(<tag>, class_=<class_name>)."""
+  return f'contains(concat(" ", normalize-space(@class), " "), " {class_name} ")'
+
+
+if etree is not None:
+  _REGEXP_NS = {"re": "http://exslt.org/regular-expressions"}
+  # station page
+  _XP_SCRIPT = etree.XPath("(//script)[1]")
+  _XP_DATES = etree.XPath('(//div[@id="sqResult"])[1]/descendant::h2[1]/descendant::strong[1]')
+  _XP_OTHER_STATIONS = etree.XPath(f'(//p[{_has_class("lastParagraph")}])[1]/descendant::a')
+  _XP_JOURNEY_ROWS = etree.XPath(r'//tr[re:test(@id, "^journeyRow_\d+")]', namespaces=_REGEXP_NS)
+  _XP_PLATFORM = etree.XPath(f'descendant::td[{_has_class("platform")}][1]')
+  _XP_STRONG = etree.XPath("descendant::strong[1]")
+  _XP_TIME = etree.XPath(f'descendant::td[{_has_class("time")}][1]')
+  _XP_TRAIN = etree.XPath(f'descendant::td[{_has_class("train")}]')
+  _XP_FIRST_A = etree.XPath("descendant::a[1]")
+  _XP_PIC = etree.XPath("descendant::a[1]/descendant::img[1]/@src")
+  _XP_HREF = etree.XPath("descendant::a[1]/@href")
+  _XP_ROUTE = etree.XPath(f'descendant::td[{_has_class("route")}][1]')
+  _XP_ENDSTATION = etree.XPath("descendant::span[1]/descendant::a[1]")
+  _XP_DIVS = etree.XPath("descendant::div")
+  _XP_RIS_TD = etree.XPath(f'descendant::td[{_has_class("ris")}][1]')
+  # train page
+  _XP_REMARKS = etree.XPath(f'(//div[{_has_class("tqRemarks")}])[1]')
+  _XP_TITLE = etree.XPath(
+    f'((//div[{_has_class("tqResults")}])[1]/descendant::h1'
+    f' | (//div[{_has_class("tqResults")}])[1]/following::h1)[1]')
+  _XP_TRAINROUTE = etree.XPath(f'(//h3[{_has_class("trainroute")}])[1]')
+  _XP_TRAIN_ROWS = etree.XPath(r'//div[re:test(normalize-space(@class), "tqRow trainrow_\d")]', namespaces=_REGEXP_NS)
+  _XP_STATION = etree.XPath('descendant::div[re:test(normalize-space(@class), "station")][1]', namespaces=_REGEXP_NS)
+  _XP_ARRIVAL = etree.XPath(f'descendant::div[{_has_class("arrival")}][1]')
+  _XP_DEPARTURE = etree.XPath(f'descendant::div[{_has_class("departure")}][1]')
+  _XP_TRAIN_PLATFORM = etree.XPath(f'descendant::div[{_has_class("platform")}][1]')
+  _XP_RIS_DIV = etree.XPath(f'descendant::div[{_has_class("ris")}][1]')
+
+
+def _stripped_strings(element):
+  """Same as bs4's Tag.stripped_strings."""
+  for text in element.itertext():
+    text = text.strip()
+    if text:
+      yield text
+
+
+def _string(element):
+  """Same as bs4's Tag.string: the text of an element with exactly one child."""
+  if len(element) == 0:
+    return _plain(element.text)
+  if len(element) == 1 and not element.text and not element[0].tail:
+    return _string(element[0])
+  return None
+
+
+def _first(result):
+  return result[0] if len(result) > 0 else None
+
+
+class LxmlEngine:
+  """Extract the raw pages with lxml and precompiled XPath-expressions."""
+
+  name = "lxml"
+
+  def __init__(self):
+    if etree is None:
+      raise ImportError("the lxml parser engine needs lxml: pip install lxml")
+
+  def station_page(self, html_document):
+    parsed_html = lxml_html.document_fromstring(html_document)
+
+    page = dict()
+    script = _first(_XP_SCRIPT(parsed_html))
+    page["script"] = "".join(_stripped_strings(script)) if script is not None else ""
+    page["dates_text"] = "".join(_stripped_strings(_XP_DATES(parsed_html)[0]))
+    page["other_stations"] = ["".join(_stripped_strings(a)) for a in _XP_OTHER_STATIONS(parsed_html)]
+
+    page["rows"] = list()
+    for row in _XP_JOURNEY_ROWS(parsed_html):
+      raw_row = dict()
+      platform = _first(_XP_PLATFORM(row))
+      raw_row["platform"] = None
+      raw_row["platformNumber"] = None
+      if platform is not None:
+        raw_row["platform"] = "".join(_stripped_strings(platform))
+        platform_number = _first(_XP_STRONG(platform))
+        if platform_number is not None:
+          raw_row["platformNumber"] = "".join(_stripped_strings(platform_number))
+
+      raw_row["time"] = str(_string(_XP_TIME(row)[0]))
+      train_fields = _XP_TRAIN(row)
+      raw_row["transportationTypePic"] = str(_XP_PIC(train_fields[0])[0])
+      raw_row["trainHref"] = str(_XP_HREF(train_fields[-1])[0])
+      raw_row["trainName"] = list(_stripped_strings(train_fields[-1]))
+
+      route = _XP_ROUTE(row)[0]
+      raw_row["endstation"] = "".join(_stripped_strings(_XP_ENDSTATION(route)[0]))
+      for div in _XP_DIVS(route):
+        div.drop_tree()  # keeps the tail, like bs4's extract()
+      raw_row["route"] = list(_stripped_strings(route))
+
+      raw_row["issues"] = "".join(_stripped_strings(_XP_RIS_TD(row)[0]))
+      page["rows"].append(raw_row)
+    return page
+
+  def train_page(self, html_document):
+    parsed_html = lxml_html.document_fromstring(html_document)
+
+    page = dict()
+    page["remarks"] = list(_stripped_strings(_XP_REMARKS(parsed_html)[0]))
+    page["title"] = _string(_XP_TITLE(parsed_html)[0])
+    trainroute = _first(_XP_TRAINROUTE(parsed_html))
+    page["trainroute"] = etree.tostring(trainroute, encoding="unicode", with_tail=False) if trainroute is not None else "None"
+
+    page["rows"] = list()
+    for row in _XP_TRAIN_ROWS(parsed_html):
+      raw_row = dict()
+      raw_row["station"] = _string(_XP_FIRST_A(_XP_STATION(row)[0])[0])
+      raw_row["arrival"] = list(_stripped_strings(_XP_ARRIVAL(row)[0]))
+      raw_row["departure"] = list(_stripped_strings(_XP_DEPARTURE(row)[0]))
+      raw_row["platform"] = list(_stripped_strings(_XP_TRAIN_PLATFORM(row)[0]))
+      raw_row["issues"] = list(_stripped_strings(_XP_RIS_DIV(row)[0]))
+      page["rows"].append(raw_row)
+    return page
+
+
+ENGINES = {
+  Bs4Engine.name: Bs4Engine,
+  LxmlEngine.name: LxmlEngine,
+}
+_engine_instances = dict()
+
+
+def get_engine(name):
+  """Return the (shared) parser engine for name."""
+  if name not in ENGINES:
+    raise ValueError(f"unknown parser engine '{name}'; choose one of {list(ENGINES)}")
+  if name not in _engine_instances:
+    _engine_instances[name] = ENGINES[name]()
+  return _engine_instances[name]
@@ -0,0 +1,130 @@
+"""
+Fetch/parse pipeline: parsing in worker processes, separate from the downloads.
+
+Parsing (BeautifulSoup) is CPU-bound and holds the GIL, so parsing in the
+scheduler threads uses one core at most. Here the fetch threads only
+download the html and put it into a bounded queue (a full queue stops the
+downloads: backpressure). A dispatcher hands the pages to a
+ProcessPoolExecutor of parser processes; the parsed data packages come back
+through futures.
+
+  pipeline = ParsePipeline(fetch_workers=16, parse_workers=8)
+  future = pipeline.submit(Train(url))   # concurrent.futures.Future -> data package
+  train_run = pipeline.fetch(Train(url))  # the same, blocking
+
+Pages that didn't change since the last poll aren't sent to a parser
+(the parse memo, see fingerprint.py).
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import metrics
+import profiling
+from api import Station
+
+# start method of the parser processes (no fork, see ParsePipeline); forkserver is only on unix
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _parse(api_object, html_document):
+  """Runs in a parser process; returns the parsed page and the seconds it took."""
+  start = time.perf_counter()
+  parsed = api_object.parse_page(html_document)
+  return parsed, time.perf_counter() - start
+
+
+def _download(api_object):
+  if isinstance(api_object, Station):
+    return api_object.get_data()
+  return api_object.get_data(api_object.url)
+
+
+def _memo_key(api_object):
+  return api_object.name if isinstance(api_object, Station) else api_object.url
+
+
+class ParsePipeline:
+  """Fetch threads -> bounded queue -> parser processes (see module doc).
+
+  parse_workers: parser processes (default: number of cores)
+  queue_size: downloaded pages waiting for a parser
+  use_memo: skip unchanged pages
+  """
+
+  def __init__(self, fetch_workers=16, parse_workers=None, queue_size=64, use_memo=True):
+    self.parse_workers = parse_workers or os.cpu_count() or 1
+    self.use_memo = use_memo
+    self.fetchers = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="fetch")
+    # the collector has threads (scheduler, metrics, write-behind) by now, forked children could
+    # inherit their locks held; forkserver children start from a fresh single-threaded process
+    self.parsers = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context(START_METHOD))
+    self.queue = queue.Queue(maxsize=queue_size)
+    # at most two pages per parser process are submitted, the rest waits in the queue
+    self._in_flight = threading.BoundedSemaphore(2 * self.parse_workers)
+    self._dispatcher = threading.Thread(target=self._dispatch, name="parse-dispatcher", daemon=True)
+    self._dispatcher.start()
+
+  def submit(self, api_object):
+    """Fetch and parse an api.Station or api.Train; returns a Future of its data package."""
+    future = Future()
+    self.fetchers.submit(self._fetch, api_object, future)
+    return future
+
+  def fetch(self, api_object):
+    return self.submit(api_object).result()
+
+  def _fetch(self, api_object, future):
+    try:
+      with profiling.stage("fetch"):
+        html_document = _download(api_object)
+      page_fingerprint = api_object.page_fingerprint(html_document)
+      if self.use_memo:
+        parsed = api_object.MEMO.lookup(_memo_key(api_object), page_fingerprint)
+        if parsed is not None:
+          future.set_result(api_object.use_parsed(html_document, parsed))
+          return
+    except Exception as error:
+      future.set_exception(error)
+      return
+    self.queue.put((api_object, html_document, page_fingerprint, future))
+
+  def _dispatch(self):
+    while True:
+      item = self.queue.get()
+      if item is None:
+        return
+      api_object, html_document, page_fingerprint, future = item
+      self._in_flight.acquire()
+      try:
+        parse_future = self.parsers.submit(_parse, api_object, html_document)
+      except Exception as error:  # e.g. the pool is shut down
+        self._in_flight.release()
+        future.set_exception(error)
+        continue
+      parse_future.add_done_callback(partial(self._parsed, api_object, html_document, page_fingerprint, future))
+
+  def _parsed(self, api_object, html_document, page_fingerprint, future, parse_future):
+    self._in_flight.release()
+    try:
+      parsed, seconds = parse_future.result()
+    except Exception as error:
+      future.set_exception(error)
+      return
+    metrics.PARSE_DURATION.observe(seconds, page="station" if isinstance(api_object, Station) else "train")
+    profiling.record("parse", seconds)
+    if self.use_memo:
+      api_object.MEMO.store(_memo_key(api_object), page_fingerprint, parsed)
+    future.set_result(api_object.use_parsed(html_document, parsed))
+
+  def close(self):
+    """Finish the queued pages and stop the workers."""
+    self.fetchers.shutdown(wait=True)
+    self.queue.put(None)
+    self._dispatcher.join()
+    self.parsers.shutdown(wait=True)
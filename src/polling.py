@@ -0,0 +1,140 @@
+"""
+Polling policy: spread a global request budget (requests per hour) over the
+active trains.
+
+Every train gets a priority, the expected information gain of its next poll:
+ - its current delay (delays change, punctual trains mostly don't),
+ - its upcoming stops (many stops in the next half hour: much can happen),
+ - the time since its last observation,
+ - the risk of a cancellation (canceled stops or a cause on the route).
+The budget is split in proportion to the priorities, i.e. a train is polled
+every sum(priorities) / (budget * priority) seconds (within
+[min_interval, max_interval]). If its next stop is due earlier, the poll is
+moved to that stop, like before.
+
+Coverage: a stop counts as observed, if there was a poll within
+coverage_window after it (its delayed or planed time). stats() reports
+the coverage of the finished trains and the allocated requests per hour.
+"""
+
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+
+DELAY_WEIGHT = 1.0
+UPCOMING_WEIGHT = 1.0
+STALENESS_WEIGHT = 0.5
+CANCEL_WEIGHT = 1.0
+BASE_PRIORITY = 0.1  # every active train gets a share
+HORIZON = timedelta(minutes=30)  # stops within that count as upcoming
+
+
+def stop_time(stop):
+  """Departure (else arrival) of a stop, the delayed one if known."""
+  return stop.delayed_dep_time or stop.planed_dep_time or stop.delayed_arr_time or stop.planed_arr_time
+
+
+def stop_delay(stop):
+  if stop.delayed_dep_time and stop.planed_dep_time:
+    return stop.delayed_dep_time - stop.planed_dep_time
+  if stop.delayed_arr_time and stop.planed_arr_time:
+    return stop.delayed_arr_time - stop.planed_arr_time
+  return timedelta(0)
+
+
+class PollingPolicy:
+  """Next poll times of the active trains within a request budget (see module doc)."""
+
+  def __init__(self, requests_per_hour=3600, min_interval=60, max_interval=30*60,
+               coverage_window=timedelta(minutes=5)):
+    self.requests_per_hour = requests_per_hour
+    self.min_interval = min_interval
+    self.max_interval = max_interval
+    self.coverage_window = coverage_window
+    self.priorities = dict()  # id -> priority
+    self.intervals = dict()  # id -> seconds
+    self.observations = dict()  # id -> [poll times]
+    self.polls = 0
+    self.covered_stops = 0
+    self.finished_stops = 0
+    self._recent_polls = deque()
+    self._lock = threading.Lock()
+
+  def priority(self, run, now, last_observed=None):
+    """Expected information gain of polling run now."""
+    times = [(stop_time(stop), stop) for stop in run.route if stop_time(stop) is not None]
+    upcoming = [stop for time, stop in times if time > now]
+    if not upcoming:
+      return 0.0
+    passed = [stop for time, stop in times if time <= now]
+    current = passed[-1] if passed else upcoming[0]
+    delay_minutes = max(stop_delay(current), stop_delay(upcoming[0])).total_seconds() / 60
+    soon = sum(1 for time, _ in times if now < time <= now + HORIZON)
+    staleness = 1.0 if last_observed is None else min((now - last_observed).total_seconds() / self.max_interval, 1.0)
+    cancel_risk = 1.0 if any(stop.canceled or stop.cause for stop in run.route) else 0.0
+    return (BASE_PRIORITY
+            + DELAY_WEIGHT * min(max(delay_minutes, 0) / 30, 1.0)
+            + UPCOMING_WEIGHT * min(soon / 5, 1.0)
+            + STALENESS_WEIGHT * staleness
+            + CANCEL_WEIGHT * cancel_risk)
+
+  def observe(self, id, run, now=None):
+    """Record a poll of the train; returns the time of the next one (None: no stop ahead)."""
+    now = now or datetime.now()
+    with self._lock:
+      observations = self.observations.setdefault(id, list())
+      priority = self.priority(run, now, observations[-1] if observations else None)
+      observations.append(now)
+      self.polls += 1
+      self._recent_polls.append(now)
+      while self._recent_polls and self._recent_polls[0] < now - timedelta(hours=1):
+        self._recent_polls.popleft()
+      if priority == 0:
+        self.priorities.pop(id, None)
+        self.intervals.pop(id, None)
+        return None
+      self.priorities[id] = priority
+      total = sum(self.priorities.values())
+      interval = total / (self.requests_per_hour / 3600 * priority)
+      interval = min(max(interval, self.min_interval), self.max_interval)
+      self.intervals[id] = interval
+
+    next_poll = now + timedelta(seconds=interval)
+    upcoming = [stop_time(stop) for stop in run.route if stop_time(stop) is not None and stop_time(stop) > now]
+    next_stop = min(upcoming)
+    if now + timedelta(seconds=self.min_interval) <= next_stop < next_poll:
+      next_poll = next_stop
+    return next_poll
+
+  def finish(self, id, run):
+    """The train is done: count the coverage of its stops and forget it."""
+    with self._lock:
+      observations = self.observations.pop(id, list())
+      self.priorities.pop(id, None)
+      self.intervals.pop(id, None)
+      for stop in run.route:
+        time = stop_time(stop)
+        if time is None:
+          continue
+        self.finished_stops += 1
+        if any(time <= observed <= time + self.coverage_window for observed in observations):
+          self.covered_stops += 1
+
+  def forget(self, id):
+    """Drop a train without counting its coverage, e.g. another collector polls it now."""
+    with self._lock:
+      self.observations.pop(id, None)
+      self.priorities.pop(id, None)
+      self.intervals.pop(id, None)
+
+  def stats(self):
+    with self._lock:
+      return {
+        "activeTrains": len(self.priorities),
+        "budgetPerHour": self.requests_per_hour,
+        "allocatedPerHour": sum(3600 / interval for interval in self.intervals.values()),
+        "pollsLastHour": len(self._recent_polls),
+        "polls": self.polls,
+        "coverage": self.covered_stops / self.finished_stops if self.finished_stops else None,
+      }
@@ -0,0 +1,136 @@
+"""
+Saturation-pruned prefix crawler for the station suggestions
+(ajax-getstop), used by DatabaseBuilder in "city" mode.
+
+The suggestion list of a prefix has a maximum length (cap). A prefix with
+fewer suggestions than the cap returned all of its stations, i.e. its
+subtree of the trie is done. Only a saturated prefix (cap suggestions) is
+expanded by one character. So the crawl follows the station names instead
+of every string over the alphabet.
+
+The cap is learned: it is the longest list seen so far (or given). While
+it is too small, a few prefixes are expanded without need, never too few.
+
+The children of a prefix (siblings) are fetched concurrently; the requests
+are throttled by the rate limiter of http_client (see ratelimit.py). The
+frontier (the prefixes still to fetch) is a json file, written after every
+batch, so an interrupted crawl resumes where it stopped.
+
+  crawler = PrefixCrawler(fetch, store, "database_builder/frontier.json")
+  crawler.run(deadline=time.time() + 30*60)
+
+fetch(prefix) returns the stations of a prefix (a list of dicts with
+"stationId") and raises on errors (the prefix is tried again);
+store(stations) saves new stations.
+"""
+
+import json
+import os
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# the characters of DatabaseBuilder._next_partial_city, the umlauts and "-" (e.g. "Halle-Neustadt")
+ALPHABET = string.ascii_lowercase + "äöüß-" + " _"
+START = string.ascii_lowercase + "äöü"
+SEPARATORS = " _-"
+MAX_DEPTH = 24  # longer prefixes aren't expanded, even if saturated
+
+
+class PrefixCrawler:
+  """Crawls the trie of prefixes, expands only saturated ones (see module doc)."""
+
+  def __init__(self, fetch, store, frontier_path, alphabet=ALPHABET, cap=None, max_depth=MAX_DEPTH, workers=8):
+    self.fetch = fetch
+    self.store = store
+    self.frontier_path = frontier_path
+    self.alphabet = alphabet
+    self.max_depth = max_depth
+    self.workers = workers
+    self.cap = cap
+    self.pending = list(START)
+    self.requests = 0
+    self.saturated = 0
+    self.failed = 0
+    self.load()
+
+  def load(self):
+    """Resume from the frontier file, if there is one."""
+    if not os.path.isfile(self.frontier_path):
+      return
+    with open(self.frontier_path, encoding="utf-8") as file:
+      state = json.load(file)
+    self.pending = state["pending"]
+    self.cap = self.cap or state.get("cap")
+    self.requests = state.get("requests", 0)
+    self.saturated = state.get("saturated", 0)
+
+  def save(self):
+    state = {"pending": self.pending, "cap": self.cap, "requests": self.requests, "saturated": self.saturated}
+    directory = os.path.dirname(self.frontier_path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    with open(self.frontier_path + ".tmp", "w", encoding="utf-8") as file:
+      json.dump(state, file)
+    os.replace(self.frontier_path + ".tmp", self.frontier_path)
+
+  @property
+  def done(self):
+    return not self.pending
+
+  def children(self, prefix):
+    """The prefixes one character longer; no separator after a separator."""
+    if len(prefix) >= self.max_depth:
+      return []
+    return [prefix + character for character in self.alphabet
+            if not (character in SEPARATORS and prefix[-1:] in SEPARATORS)]
+
+  def _fetch(self, prefix):
+    try:
+      return prefix, self.fetch(prefix), None
+    except Exception as error:
+      return prefix, None, error
+
+  def step(self, executor, size):
+    """Fetch the next size prefixes concurrently; returns the number that succeeded."""
+    batch, self.pending = self.pending[:size], self.pending[size:]
+    results = list(executor.map(self._fetch, batch))
+    self.requests += len(batch)
+    self.cap = max([self.cap or 0] + [len(stations) for _, stations, _ in results if stations is not None]) or None
+    found, seen, retry, expand = list(), set(), list(), list()
+    for prefix, stations, error in results:
+      if error is not None:
+        self.failed += 1
+        retry.append(prefix)
+        continue
+      for station in stations:
+        if station["stationId"] not in seen:
+          seen.add(station["stationId"])
+          found.append(station)
+      if self.cap and len(stations) >= self.cap:
+        self.saturated += 1
+        expand.extend(self.children(prefix))
+    if found:
+      self.store(found)
+    # depth first: the children come next, so the frontier stays small
+    self.pending = expand + self.pending + retry
+    self.save()
+    return len(batch) - len(retry)
+
+  def run(self, deadline=None, max_requests=None):
+    """Crawl until the frontier is empty, the deadline (time.time()) or max_requests; returns done."""
+    size = self.workers * 2
+    start_requests = self.requests
+    with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawl") as executor:
+      try:
+        while self.pending:
+          if deadline is not None and time.time() > deadline:
+            break
+          if max_requests is not None and self.requests - start_requests >= max_requests:
+            break
+          if self.step(executor, size) == 0:  # everything failed: the api is down or blocks us
+            break
+      finally:
+        self.save()
+    return self.done
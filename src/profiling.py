@@ -0,0 +1,206 @@
+"""
+On-demand profiling of the collector (main.py) and the station builder
+(database_builder.py).
+
+Stage timers: the stages (fetch, parse, diff, store, schedule, ...) are
+wrapped with stage("fetch"). While no profiler runs, stage() returns a
+shared no-op context, i.e. costs one function call. While it runs, every
+stage counts its calls, total and max time.
+
+Sampling profiler (optional): a background thread takes the stacks of all
+threads every interval seconds (sys._current_frames) - the profiled code
+isn't instrumented, so it's safe for production. The stacks start with the
+thread and its current stage. The profiler stops after duration seconds
+and writes
+  <directory>/profile-<time>.folded            collapsed stacks (flamegraph.pl, speedscope, inferno)
+  <directory>/profile-<time>.speedscope.json   https://www.speedscope.app
+  <directory>/profile-<time>.stages.txt        the stage timers
+
+  profiling.configure("profiles", duration=300)  # or kill -USR1 <pid> of the collector
+  with profiling.stage("fetch"):
+    ...
+
+Parsing runs in the parser processes (pipeline.py): its time is recorded
+with record("parse", seconds), the samples don't include it.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+
+PROFILER = None  # the running Profiler; set with configure()
+_NO_STAGE = contextlib.nullcontext()
+MAX_DEPTH = 100  # frames per sample
+
+
+class Profiler:
+  """Stage timers and a sampling profiler for a bounded window (see module doc)."""
+
+  def __init__(self, directory="profiles", duration=300, interval=0.01, sample=True):
+    self.directory = directory
+    self.duration = duration
+    self.interval = interval
+    self.sample = sample
+    self.stages = dict()  # name -> [count, total seconds, max seconds]
+    self.stacks = dict()  # collapsed stack -> samples
+    self.samples = 0
+    self.started = None
+    self.paths = list()
+    self._current = dict()  # thread id -> [stage names]
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    self._thread = None
+
+  def start(self):
+    self.started = time.time()
+    self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+    self._thread.start()
+    return self
+
+  def _run(self):
+    end = time.monotonic() + self.duration
+    own = threading.get_ident()
+    while not self._stopped.is_set() and time.monotonic() < end:
+      if self.sample:
+        self._sample(own)
+      self._stopped.wait(self.interval if self.sample else max(end - time.monotonic(), 0))
+    self._finish()
+
+  def _sample(self, own):
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+      if ident == own:
+        continue
+      frames = list()
+      while frame is not None and len(frames) < MAX_DEPTH:
+        code = frame.f_code
+        frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+      stages = self._current.get(ident, ())[-1:]  # a slice: the thread may leave its stage meanwhile
+      prefix = [names.get(ident, str(ident))] + [f"stage:{name}" for name in stages]
+      stack = ";".join(prefix + frames[::-1])
+      with self._lock:
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+    self.samples += 1
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    ident = threading.get_ident()
+    stages = self._current.setdefault(ident, list())
+    stages.append(name)
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.record(name, time.perf_counter() - start)
+      stages.pop()
+
+  def record(self, name, seconds):
+    with self._lock:
+      timer = self.stages.get(name)
+      if timer is None:
+        timer = self.stages[name] = [0, 0.0, 0.0]
+      timer[0] += 1
+      timer[1] += seconds
+      timer[2] = max(timer[2], seconds)
+
+  def report(self):
+    """The stage timers as text, the most time first."""
+    with self._lock:
+      stages = sorted(self.stages.items(), key=lambda item: item[1][1], reverse=True)
+    lines = [f"{'stage':<12}{'calls':>10}{'total':>12}{'mean':>12}{'max':>12}"]
+    for name, (count, total, longest) in stages:
+      lines.append(f"{name:<12}{count:>10}{total:>11.3f}s{total / count * 1000:>10.2f}ms{longest * 1000:>10.2f}ms")
+    return "\n".join(lines)
+
+  def folded(self):
+    """Collapsed stacks, one "frame;frame;frame count" per line."""
+    with self._lock:
+      return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+  def speedscope(self):
+    """The samples in the speedscope file format (sampled profile)."""
+    frames, index = list(), dict()
+    samples, weights = list(), list()
+    with self._lock:
+      stacks = list(self.stacks.items())
+    for stack, count in stacks:
+      sample = list()
+      for name in stack.split(";"):
+        if name not in index:
+          index[name] = len(frames)
+          frames.append({"name": name})
+        sample.append(index[name])
+      samples.append(sample)
+      weights.append(count * self.interval)
+    return {
+      "$schema": "https://www.speedscope.app/file-format-schema.json",
+      "shared": {"frames": frames},
+      "profiles": [{"type": "sampled", "name": f"profile {time.ctime(self.started)}", "unit": "seconds",
+                    "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights}],
+      "exporter": "profiling.py",
+    }
+
+  def write(self):
+    """Write the files (see module doc); returns their paths."""
+    os.makedirs(self.directory, exist_ok=True)
+    base = os.path.join(self.directory, f"profile-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}")
+    paths = [base + ".stages.txt"]
+    with open(paths[0], "w", encoding="utf-8") as file:
+      file.write(self.report() + "\n")
+    if self.sample:
+      paths.append(base + ".folded")
+      with open(paths[-1], "w", encoding="utf-8") as file:
+        file.write(self.folded())
+      paths.append(base + ".speedscope.json")
+      with open(paths[-1], "w", encoding="utf-8") as file:
+        json.dump(self.speedscope(), file)
+    return paths
+
+  def _finish(self):
+    global PROFILER
+    self.paths = self.write()
+    if PROFILER is self:
+      PROFILER = None
+    print(f"profiling done ({self.samples} samples):", ", ".join(self.paths))
+
+  def stop(self):
+    """Stop now (instead of after duration) and wait for the files."""
+    self._stopped.set()
+    if self._thread is not None:
+      self._thread.join()
+    return self.paths
+
+
+def configure(directory="profiles", duration=300, interval=0.01, sample=True):
+  """Start profiling for duration seconds (a running profiler is stopped first)."""
+  global PROFILER
+  if PROFILER is not None:
+    PROFILER.stop()
+  PROFILER = Profiler(directory, duration, interval, sample).start()
+  return PROFILER
+
+
+def stop():
+  """Stop the running profiler; returns the paths of its files."""
+  profiler = PROFILER
+  return profiler.stop() if profiler is not None else list()
+
+
+def stage(name):
+  """Time the with-block as stage name (no-op without profiler)."""
+  profiler = PROFILER
+  if profiler is None:
+    return _NO_STAGE
+  return profiler.stage(name)
+
+
+def record(name, seconds):
+  """Add a time measured elsewhere (e.g. in a parser process) to stage name."""
+  profiler = PROFILER
+  if profiler is not None:
+    profiler.record(name, seconds)
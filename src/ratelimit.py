@@ -0,0 +1,148 @@
+"""
+Adaptive rate limiter per host (token buckets), shared by everything that
+goes through http_client.py or api_async.AsyncClient.
+
+Every host has a budget (requests per second and a burst). A request takes
+a token; without a token the caller waits - acquire() sleeps,
+acquire_async() awaits, so the event loop keeps running.
+
+The rate adapts to the answers (feedback):
+ - 429, 5xx, connection errors and empty responses halve the rate (down to
+   1/32 of the budget); a Retry-After header pauses the host,
+ - every successful response raises it again by 5 % of the budget, up to
+   the budget.
+So the collector runs at the highest rate the host takes, instead of a
+conservative fixed sleep.
+
+  ratelimit.LIMITER.configure("reiseauskunft.bahn.de", rate=20, burst=40)
+"""
+
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+
+import metrics
+
+
+BUDGETS = {
+  "reiseauskunft.bahn.de": (10.0, 20),
+  "www.geonames.org": (333 / 3600, 5),  # 1000 credits per hour, 3 per request
+  "nominatim.openstreetmap.org": (1.0, 1),  # max. 1 request per second
+}
+DEFAULT_BUDGET = (5.0, 10)
+MIN_RATE_FACTOR = 1 / 32
+BACKOFF_FACTOR = 0.5
+RECOVERY_STEP = 0.05
+
+
+class TokenBucket:
+  """Token bucket with adaptive rate (see module doc)."""
+
+  def __init__(self, rate, burst):
+    self.budget = rate
+    self.rate = rate
+    self.burst = burst
+    self.tokens = float(burst)
+    self.updated = time.monotonic()
+    self.throttled = 0  # number of backoffs
+    self._lock = threading.Lock()
+
+  def _refill(self, now):
+    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  def reserve(self):
+    """Take a token; returns the seconds to wait before it may be used (0: now)."""
+    with self._lock:
+      now = time.monotonic()
+      self._refill(now)
+      self.tokens -= 1
+      if self.tokens >= 0:
+        return 0.0
+      return -self.tokens / self.rate
+
+  def acquire(self):
+    """Wait for a token; returns the seconds waited."""
+    delay = self.reserve()
+    if delay > 0:
+      time.sleep(delay)
+    return delay
+
+  async def acquire_async(self):
+    delay = self.reserve()
+    if delay > 0:
+      await asyncio.sleep(delay)
+    return delay
+
+  def feedback(self, ok, retry_after=None):
+    """Adapt the rate to the answer of a request."""
+    with self._lock:
+      self._refill(time.monotonic())
+      if ok:
+        self.rate = min(self.budget, self.rate + self.budget * RECOVERY_STEP)
+        return
+      self.throttled += 1
+      self.rate = max(self.budget * MIN_RATE_FACTOR, self.rate * BACKOFF_FACTOR)
+      # drop the saved tokens; with Retry-After: pause the host for that long
+      self.tokens = min(self.tokens, 0.0)
+      if retry_after:
+        self.tokens = min(self.tokens, -retry_after * self.rate)
+
+
+def _retry_after(value):
+  try:
+    return float(value) if value is not None else None
+  except ValueError:  # a http-date; not worth parsing
+    return None
+
+
+class RateLimiter:
+  """One TokenBucket per host."""
+
+  def __init__(self, budgets=None, default=DEFAULT_BUDGET):
+    self.budgets = dict(BUDGETS if budgets is None else budgets)
+    self.default = default
+    self.buckets = dict()
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def host(url):
+    return urlsplit(url).hostname or ""
+
+  def bucket(self, url):
+    host = self.host(url)
+    bucket = self.buckets.get(host)
+    if bucket is None:
+      with self._lock:
+        bucket = self.buckets.get(host)
+        if bucket is None:
+          bucket = self.buckets[host] = TokenBucket(*self.budgets.get(host, self.default))
+    return bucket
+
+  def configure(self, host, rate, burst=None):
+    """Set the budget of a host (requests per second)."""
+    burst = burst or max(1, int(rate))
+    with self._lock:
+      self.budgets[host] = (rate, burst)
+      self.buckets.pop(host, None)
+
+  def acquire(self, url):
+    """Wait (blocking) until a request to url may be sent."""
+    metrics.RATELIMIT_WAIT.observe(self.bucket(url).acquire(), host=self.host(url))
+
+  async def acquire_async(self, url):
+    """Wait (without blocking the event loop) until a request to url may be sent."""
+    metrics.RATELIMIT_WAIT.observe(await self.bucket(url).acquire_async(), host=self.host(url))
+
+  def feedback(self, url, status=None, empty=False, retry_after=None):
+    """Report the answer of a request; status None means no answer (connection error)."""
+    ok = status is not None and status != 429 and status < 500 and not empty
+    self.bucket(url).feedback(ok, _retry_after(retry_after))
+
+  def stats(self):
+    return {host: {"rate": bucket.rate, "budget": bucket.budget, "throttled": bucket.throttled}
+            for host, bucket in self.buckets.items()}
+
+
+LIMITER = RateLimiter()
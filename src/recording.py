@@ -0,0 +1,139 @@
+"""
+Record real responses into fixtures and replay them offline.
+
+Both are transport adapters for the shared session in http_client.py, so
+everything that goes through http_client (Station, Train, DatabaseBuilder)
+is recorded/replayed without changes:
+
+  recording.record("tests/fixtures")   # real requests, responses are saved
+  recording.replay("tests/fixtures")   # no network; unknown requests fail
+  recording.stop()                     # back to normal
+
+A fixture directory holds the response bodies as files and an index.json:
+  {<key>: {"method", "url", "body", "status", "contentType", "file"}}
+The key ignores the date/time fields of the post-body (bhftafel), so a
+recorded board can be replayed at any time.
+"""
+
+import json
+import os
+import re
+import threading
+from urllib.parse import parse_qsl
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+import cache
+import http_client
+
+
+INDEX_FILE = "index.json"
+IGNORED_BODY_FIELDS = ("date", "time")
+
+
+def fixture_key(method, url, body=None):
+  """Key of a request in index.json; body is the (urlencoded) post-body."""
+  if isinstance(body, bytes):
+    body = body.decode("utf-8")
+  payload = dict(parse_qsl(body or "", keep_blank_values=True))
+  for field in IGNORED_BODY_FIELDS:
+    payload.pop(field, None)
+  return cache.ResponseCache.key(method, url, payload)
+
+
+def load_index(directory):
+  path = os.path.join(directory, INDEX_FILE)
+  if not os.path.isfile(path):
+    return dict()
+  with open(path, encoding="utf-8") as file:
+    return json.load(file)
+
+
+def _filename(method, url, index):
+  endpoint = cache.ResponseCache.endpoint(url)
+  return f"{len(index) + 1:04}_{re.sub(r'[^a-z0-9_]+', '_', endpoint.lower())}_{method.lower()}.html"
+
+
+class RecordingAdapter(HTTPAdapter):
+  """Sends the requests for real and saves every response as a fixture."""
+
+  def __init__(self, directory, **kwargs):
+    super().__init__(**kwargs)
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+    self._lock = threading.Lock()
+    self.index = load_index(directory)
+
+  def send(self, request, **kwargs):
+    response = super().send(request, **kwargs)
+    key = fixture_key(request.method, request.url, request.body)
+    with self._lock:
+      entry = self.index.get(key)
+      if entry is None:
+        entry = {"method": request.method, "url": request.url,
+                 "body": request.body.decode("utf-8") if isinstance(request.body, bytes) else request.body,
+                 "file": _filename(request.method, request.url, self.index)}
+        self.index[key] = entry
+      entry["status"] = response.status_code
+      entry["contentType"] = response.headers.get("Content-Type", "text/html")
+      with open(os.path.join(self.directory, entry["file"]), "w", encoding="utf-8") as file:
+        file.write(response.text)
+      with open(os.path.join(self.directory, INDEX_FILE), "w", encoding="utf-8") as file:
+        json.dump(self.index, file, indent=2, ensure_ascii=False)
+    return response
+
+
+class ReplayAdapter(BaseAdapter):
+  """Serves the recorded fixtures; a request without fixture raises ConnectionError."""
+
+  def __init__(self, directory):
+    super().__init__()
+    self.directory = directory
+    self.index = load_index(directory)
+    self._bodies = dict()
+
+  def _body(self, filename):
+    if filename not in self._bodies:
+      with open(os.path.join(self.directory, filename), "rb") as file:
+        self._bodies[filename] = file.read()
+    return self._bodies[filename]
+
+  def send(self, request, **kwargs):
+    entry = self.index.get(fixture_key(request.method, request.url, request.body))
+    if entry is None:
+      raise requests.ConnectionError(f"no fixture for {request.method} {request.url}", request=request)
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response.headers["Content-Type"] = entry["contentType"]
+    response._content = self._body(entry["file"])
+    response.encoding = "utf-8"
+    response.url = request.url
+    response.request = request
+    return response
+
+  def close(self):
+    pass
+
+
+def _mount(adapter):
+  session = http_client.session()
+  session.mount("https://", adapter)
+  session.mount("http://", adapter)
+  return adapter
+
+
+def record(directory):
+  """Record every response of the shared session into directory."""
+  return _mount(RecordingAdapter(directory, pool_connections=http_client.POOL_CONNECTIONS,
+                                 pool_maxsize=http_client.POOL_MAXSIZE, max_retries=http_client.MAX_RETRIES))
+
+
+def replay(directory):
+  """Serve every request of the shared session from the fixtures in directory."""
+  return _mount(ReplayAdapter(directory))
+
+
+def stop():
+  """Back to real requests (a new shared session)."""
+  http_client.close()
@@ -0,0 +1,132 @@
+"""
+Record types for the data packages of api.Station and api.Train.
+
+Slotted dataclasses instead of nested dicts: less memory per active train
+and smaller pickles (the BoardEntry rows of jobstore.JobStore, the records
+sent back from the parser processes of pipeline), since the records are
+pickled as plain tuples of their field values. Station names, train
+names and causes are interned, so the same name is one object everywhere.
+
+to_dict() returns the old dict layout (camelCase keys, nested "issues").
+"""
+
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+
+def intern(text):
+  """sys.intern for optional strings."""
+  return sys.intern(text) if text is not None else None
+
+
+def _reduce(record):
+  """Pickle the field values positionally (no field names in every pickle).
+
+  Unpickling goes through __init__ again, so the names are interned again.
+  """
+  return (type(record), tuple(getattr(record, name) for name in record.__slots__))
+
+
+@dataclass(slots=True)
+class BoardEntry:
+  """One departure of a station board (bhftafel)."""
+  planed_time: datetime
+  train_name: str
+  train_url: str
+  transportation_type: str
+  endstation: str
+  platform_number: str | None = None
+  partial_route: list[tuple[str, datetime]] = field(default_factory=list)
+  delayed_time: datetime | None = None
+  delayed_by: timedelta | None = None
+  cause: str | None = None
+  canceled: bool = False
+
+  def __post_init__(self):
+    self.train_name = intern(self.train_name)
+    self.transportation_type = intern(self.transportation_type)
+    self.endstation = intern(self.endstation)
+    self.cause = intern(self.cause)
+    self.partial_route = [(intern(stop), planed_time) for stop, planed_time in self.partial_route]
+
+  __reduce__ = _reduce
+
+  def to_dict(self):
+    return {
+      "platformNumber": self.platform_number,
+      "planedTime": self.planed_time,
+      "transportationType": self.transportation_type,
+      "trainUrl": self.train_url,
+      "trainName": self.train_name,
+      "endstation": self.endstation,
+      "partialRoute": [[stop, planed_time] for stop, planed_time in self.partial_route],
+      "issues": {
+        "delayedTime": self.delayed_time,
+        "delayedBy": self.delayed_by,
+        "cause": self.cause,
+        "canceled": self.canceled,
+      },
+    }
+
+
+@dataclass(slots=True)
+class Stop:
+  """One stop of a train run (traininfo)."""
+  station: str
+  planed_arr_time: datetime | None = None
+  delayed_arr_time: datetime | None = None
+  planed_dep_time: datetime | None = None
+  delayed_dep_time: datetime | None = None
+  platform: str | None = None
+  canceled: bool = False
+  cause: str | None = None
+
+  def __post_init__(self):
+    self.station = intern(self.station)
+    self.platform = intern(self.platform)
+    self.cause = intern(self.cause)
+
+  __reduce__ = _reduce
+
+  def times(self):
+    """All known times of the stop (planed and delayed)."""
+    return [time for time in (self.delayed_arr_time, self.delayed_dep_time, self.planed_arr_time, self.planed_dep_time)
+            if time is not None]
+
+  def to_dict(self):
+    return {
+      "station": self.station,
+      "planedArrTime": self.planed_arr_time,
+      "delayedArrTime": self.delayed_arr_time,
+      "planedDepTime": self.planed_dep_time,
+      "delayedDepTime": self.delayed_dep_time,
+      "platform": self.platform,
+      "issues": {
+        "canceled": self.canceled,
+        "cause": self.cause,
+      },
+    }
+
+
+@dataclass(slots=True)
+class TrainRun:
+  """A train on one day with its route (traininfo)."""
+  train_name: str
+  train_date: datetime
+  company: str | None = None
+  route: list[Stop] = field(default_factory=list)
+
+  def __post_init__(self):
+    self.train_name = intern(self.train_name)
+    self.company = intern(self.company)
+
+  __reduce__ = _reduce
+
+  def to_dict(self):
+    return {
+      "company": self.company,
+      "trainName": self.train_name,
+      "trainDate": self.train_date,
+      "route": {index: stop.to_dict() for index, stop in enumerate(self.route)},
+    }
@@ -0,0 +1,205 @@
+"""
+A timer-heap scheduler on one asyncio event loop.
+
+Replaces schedule (recurring station calls) and APScheduler (one-shot train
+calls) in main.py. Jobs are kept in a heap ordered by their run time:
+adding and rescheduling are O(log n) pushes. Rescheduling doesn't search the
+heap, the old entry just becomes stale (the job's version changed) and is
+skipped when it comes up (lazy deletion). The heap is compacted when most of
+it is stale.
+
+  scheduler = Scheduler()
+  scheduler.add("station:Isernhagen", callStation, "Isernhagen", interval=300, jitter=10)
+  scheduler.add(train_id, processTrain, train, run_at=datetime(...), jitter=5)
+  asyncio.run(scheduler.run())
+
+Coroutine functions run as tasks on the loop, plain functions (blocking
+requests) in a thread pool. add/remove can be called from any thread, also
+from a running job (e.g. a train reschedules itself).
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import metrics
+import profiling
+
+
+@dataclass(slots=True, eq=False)
+class Job:
+  id: str
+  func: object
+  args: tuple = ()
+  run_at: datetime | None = None
+  interval: float | None = None  # seconds; None: one-shot
+  jitter: float = 0.0  # seconds, a random delay of 0..jitter per run
+  name: str | None = None
+  version: int = 0
+  due: float = field(default=0.0, repr=False)  # timestamp incl. jitter
+
+
+class Scheduler:
+  """Recurring and one-shot jobs, run at their time (see module doc).
+
+  max_workers: threads for plain (blocking) functions
+  """
+
+  def __init__(self, max_workers=32):
+    self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler")
+    self.listeners = list()  # called with (job, exception or None) after every run
+    self.max_slippage = 0.0  # seconds between due time and start of a run
+    self.runs = 0
+    self._jobs = dict()  # id -> Job
+    self._heap = list()  # (due, sequence, version, job)
+    self._sequence = itertools.count()
+    self._lock = threading.Lock()
+    self._loop = None
+    self._loop_thread = None
+    self._wakeup = None
+    self._stopped = False
+    self._tasks = set()
+
+  def __len__(self):
+    return len(self._jobs)
+
+  def __contains__(self, id):
+    return id in self._jobs
+
+  def get(self, id):
+    return self._jobs.get(id)
+
+  def jobs(self):
+    """The scheduled jobs, next first."""
+    with self._lock:
+      return sorted(self._jobs.values(), key=lambda job: job.due)
+
+  def add(self, id, func, *args, run_at=None, interval=None, jitter=0.0, name=None):
+    """Schedule func(*args) at run_at (default: now, or now + interval for recurring jobs).
+
+    A job with the same id is replaced, i.e. this is also the reschedule.
+    """
+    now = datetime.now()
+    if run_at is None:
+      run_at = now if interval is None else datetime.fromtimestamp(now.timestamp() + interval)
+    job = Job(id=id, func=func, args=args, run_at=run_at, interval=interval, jitter=jitter, name=name)
+    with self._lock:
+      old = self._jobs.get(id)
+      if old is not None:
+        job.version = old.version + 1
+      self._jobs[id] = job
+      self._push(job)
+    return job
+
+  def reschedule(self, id, run_at):
+    """Move the job to run_at; returns False if there is no such job."""
+    with self._lock:
+      job = self._jobs.get(id)
+      if job is None:
+        return False
+      job.version += 1
+      job.run_at = run_at
+      self._push(job)
+    return True
+
+  def remove(self, id):
+    """Remove the job; its heap entry is dropped when it comes up."""
+    with self._lock:
+      return self._jobs.pop(id, None) is not None
+
+  def _push(self, job):
+    """Push the job (the lock is held)."""
+    job.due = job.run_at.timestamp() + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+    heapq.heappush(self._heap, (job.due, next(self._sequence), job.version, job))
+    if len(self._heap) > 64 and len(self._heap) > 2 * len(self._jobs):
+      self._heap = [entry for entry in self._heap if self._jobs.get(entry[3].id) is entry[3] and entry[2] == entry[3].version]
+      heapq.heapify(self._heap)
+    if self._heap[0][3] is job:
+      self._wake()
+
+  def _wake(self):
+    if self._loop is not None and self._wakeup is not None:
+      if self._loop_thread == threading.get_ident():
+        self._wakeup.set()
+      else:
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+  def _pop_due(self, now):
+    """Return (jobs that are due, seconds until the next one or None)."""
+    due = list()
+    with self._lock:
+      while self._heap:
+        when, _, version, job = self._heap[0]
+        if self._jobs.get(job.id) is not job or version != job.version:
+          heapq.heappop(self._heap)  # stale entry
+          continue
+        if when > now:
+          return due, when - now
+        heapq.heappop(self._heap)
+        if job.interval is None:
+          del self._jobs[job.id]
+        else:
+          # next run; if the loop fell behind a whole interval, don't run all missed ones
+          next_run = job.run_at.timestamp() + job.interval
+          if next_run <= now:
+            next_run = now + job.interval
+          job.version += 1
+          job.run_at = datetime.fromtimestamp(next_run)
+          self._push(job)
+        due.append((when, job))
+    return due, None
+
+  async def run(self):
+    """Run the jobs until stop() is called."""
+    self._loop = asyncio.get_running_loop()
+    self._loop_thread = threading.get_ident()
+    self._wakeup = asyncio.Event()
+    self._stopped = False
+    while not self._stopped:
+      with profiling.stage("schedule"):
+        now = datetime.now().timestamp()
+        due, delay = self._pop_due(now)
+        for when, job in due:
+          self.max_slippage = max(self.max_slippage, now - when)
+          metrics.SCHEDULER_LAG.observe(max(now - when, 0.0))
+          task = self._loop.create_task(self._execute(job))
+          self._tasks.add(task)
+          task.add_done_callback(self._tasks.discard)
+      if due:
+        await asyncio.sleep(0)
+        continue
+      self._wakeup.clear()
+      try:
+        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+      except asyncio.TimeoutError:
+        pass
+    if self._tasks:
+      await asyncio.gather(*self._tasks, return_exceptions=True)
+
+  async def _execute(self, job):
+    exception = None
+    try:
+      if asyncio.iscoroutinefunction(job.func):
+        await job.func(*job.args)
+      else:
+        await self._loop.run_in_executor(self.executor, job.func, *job.args)
+    except Exception as error:
+      exception = error
+    self.runs += 1
+    metrics.JOB_RUNS.inc(outcome="failed" if exception else "ok")
+    for listener in self.listeners:
+      listener(job, exception)
+
+  def stop(self):
+    """Let run() return (after the running jobs are finished)."""
+    self._stopped = True
+    self._wake()
+
+  def shutdown(self):
+    self.stop()
+    self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,224 @@
+"""
+Sharding of the stations and trains over several collector processes
+(Management instances, also on several hosts), coordinated through redis.
+
+Membership: every node sends a heartbeat (redis TIME) into the sorted set
+<prefix>:nodes; nodes without a heartbeat for ttl seconds are dead and
+removed. The members form a consistent hash ring (virtual nodes), a key
+(station name or train id) belongs to the node after its hash. A node that
+joins or dies only moves about 1/N of the keys.
+
+Leases: before a train is polled, its owner claims the lease
+<prefix>:lease:<id> (SET NX, renewed with WATCH/MULTI). While the members
+change, two nodes may see different rings for a moment; the lease makes
+sure only one of them polls. A node releases the leases of the keys it
+lost, so the new owner takes over right away, otherwise after lease_ttl.
+
+Registry: the trains found on the boards go into the hash <prefix>:trains
+(id -> json of the board entry, no pickles: redis is shared), so the owner
+of a train learns about it, even if another node called the station. The
+id of a new train found by another node is also pushed to the list
+<prefix>:inbox:<owner>, which the owner drains on every heartbeat
+(cluster.inbox()); the whole registry is only read when the members change.
+
+  cluster = Cluster(redis_client)
+  if cluster.heartbeat():  # the members changed
+    ... schedule what cluster.owns(), drop the rest (cluster.release())
+  for id, train in cluster.inbox().items():
+    ... schedule the trains found by the other nodes
+  if cluster.claim(id):
+    ... poll the train
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import socket
+from datetime import timedelta
+
+import redis
+
+from hotstate import decode_time, encode_time
+from records import BoardEntry
+
+
+def _hash(key):
+  return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def _text(value):
+  return value.decode() if isinstance(value, bytes) else value
+
+
+def encode_entry(train):
+  """BoardEntry -> json document (times as epoch seconds, like hotstate.py)."""
+  return {
+    "planedTime": encode_time(train.planed_time),
+    "trainName": train.train_name,
+    "trainUrl": train.train_url,
+    "transportationType": train.transportation_type,
+    "endstation": train.endstation,
+    "platformNumber": train.platform_number,
+    "partialRoute": [[stop, encode_time(planed_time)] for stop, planed_time in train.partial_route],
+    "delayedTime": encode_time(train.delayed_time),
+    "delayedBy": train.delayed_by.total_seconds() if train.delayed_by is not None else None,
+    "cause": train.cause,
+    "canceled": train.canceled,
+  }
+
+
+def decode_entry(document):
+  """json document -> BoardEntry."""
+  return BoardEntry(
+    planed_time=decode_time(document["planedTime"]), train_name=document["trainName"], train_url=document["trainUrl"],
+    transportation_type=document["transportationType"], endstation=document["endstation"],
+    platform_number=document["platformNumber"],
+    partial_route=[(stop, decode_time(planed_time)) for stop, planed_time in document["partialRoute"]],
+    delayed_time=decode_time(document["delayedTime"]),
+    delayed_by=timedelta(seconds=document["delayedBy"]) if document["delayedBy"] is not None else None,
+    cause=document["cause"], canceled=document["canceled"])
+
+
+class HashRing:
+  """Consistent hashing with replicas virtual nodes per node."""
+
+  def __init__(self, nodes=(), replicas=64):
+    self.replicas = replicas
+    self.nodes = frozenset(nodes)
+    self._points = sorted((_hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(replicas))
+    self._hashes = [point for point, _ in self._points]
+
+  def owner(self, key):
+    """The node of key (None without nodes)."""
+    if not self._points:
+      return None
+    index = bisect.bisect(self._hashes, _hash(key)) % len(self._points)
+    return self._points[index][1]
+
+
+class Cluster:
+  """Membership, hash ring, leases and the train registry of one node (see module doc)."""
+
+  def __init__(self, client, node_id=None, prefix="collector", ttl=15, lease_ttl=120, replicas=64):
+    self.client = client
+    self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}"
+    self.prefix = prefix
+    self.ttl = ttl
+    self.lease_ttl = lease_ttl
+    self.replicas = replicas
+    self.ring = HashRing([self.node_id], replicas)
+
+  @property
+  def _nodes(self):
+    return f"{self.prefix}:nodes"
+
+  @property
+  def _trains(self):
+    return f"{self.prefix}:trains"
+
+  def _inbox(self, node):
+    return f"{self.prefix}:inbox:{node}"
+
+  def _lease(self, key):
+    return f"{self.prefix}:lease:{key}"
+
+  def _now(self):
+    seconds, microseconds = self.client.time()
+    return seconds + microseconds / 1e6
+
+  def heartbeat(self, now=None):
+    """Announce this node, drop the dead ones; returns True if the members changed."""
+    now = self._now() if now is None else now
+    pipeline = self.client.pipeline()
+    pipeline.zadd(self._nodes, {self.node_id: now})
+    pipeline.zremrangebyscore(self._nodes, "-inf", now - self.ttl)
+    pipeline.zrange(self._nodes, 0, -1)
+    members = frozenset(_text(node) for node in pipeline.execute()[-1])
+    if members == self.ring.nodes:
+      return False
+    self.ring = HashRing(members, self.replicas)
+    return True
+
+  def members(self):
+    return self.ring.nodes
+
+  def owns(self, key):
+    return self.ring.owner(key) == self.node_id
+
+  def claim(self, key):
+    """Take or renew the lease of key; False if the key isn't ours or another node holds it."""
+    if not self.owns(key):
+      return False
+    lease = self._lease(key)
+    milliseconds = int(self.lease_ttl * 1000)
+    if self.client.set(lease, self.node_id, nx=True, px=milliseconds):
+      return True
+    with self.client.pipeline() as pipeline:
+      try:
+        pipeline.watch(lease)
+        if _text(pipeline.get(lease)) != self.node_id:
+          return False
+        pipeline.multi()
+        pipeline.set(lease, self.node_id, px=milliseconds)
+        pipeline.execute()
+        return True
+      except redis.WatchError:  # changed in between: someone else has it now
+        return False
+
+  def release(self, *keys):
+    """Give up the leases of keys (only the ones this node holds)."""
+    if not keys:
+      return
+    leases = [self._lease(key) for key in keys]
+    with self.client.pipeline() as pipeline:
+      try:
+        pipeline.watch(*leases)
+        holders = pipeline.mget(leases)
+        pipeline.multi()
+        for lease, holder in zip(leases, holders):
+          if _text(holder) == self.node_id:
+            pipeline.delete(lease)
+        pipeline.execute()
+      except redis.WatchError:  # a lease changed owner, i.e. it isn't ours anymore
+        pass
+
+  def register(self, id, train):
+    """Add a new train to the registry of all nodes, tell its owner if that's another node."""
+    if not self.client.hsetnx(self._trains, id, json.dumps(encode_entry(train))):
+      return  # known already (called on every poll of every board)
+    owner = self.ring.owner(id)
+    if owner != self.node_id:
+      self.client.rpush(self._inbox(owner), id)
+
+  def unregister(self, *ids):
+    if ids:
+      self.client.hdel(self._trains, *ids)
+
+  def trains(self):
+    """The registered trains owned by this node, {id: train}."""
+    owned = dict()
+    for id, value in self.client.hscan_iter(self._trains):
+      id = _text(id)
+      if self.owns(id):
+        owned[id] = decode_entry(json.loads(value))
+    return owned
+
+  def inbox(self):
+    """The trains other nodes found for this node since the last call, {id: train}."""
+    pipeline = self.client.pipeline()
+    pipeline.lrange(self._inbox(self.node_id), 0, -1)
+    pipeline.delete(self._inbox(self.node_id))
+    ids = list(dict.fromkeys(_text(id) for id in pipeline.execute()[0]))
+    if not ids:
+      return dict()
+    values = self.client.hmget(self._trains, ids)
+    # finished trains are unregistered meanwhile, lost ones are picked up by the new owner
+    return {id: decode_entry(json.loads(value)) for id, value in zip(ids, values)
+            if value is not None and self.owns(id)}
+
+  def leave(self):
+    """Leave the cluster now (instead of after ttl), e.g. on shutdown."""
+    self.client.zrem(self._nodes, self.node_id)
+    self.client.delete(self._inbox(self.node_id))
+    self.ring = HashRing([self.node_id], self.replicas)
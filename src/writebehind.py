@@ -0,0 +1,183 @@
+"""
+Write-behind of finished trains into the permanent sqlite database.
+
+processTrain hands a finished train (last snapshot + its events) to
+WriteBehind.put(). A background thread writes the queued trains in large
+transactions (executemany), when max_runs trains are queued or the oldest
+one waited max_delay seconds. The database runs in WAL mode.
+
+At-least-once: a train stays queued until its transaction is committed;
+then on_flushed(ids) is called, which removes it from the redis hot state.
+If the database is locked, the flush is retried (with backoff). Other errors
+(e.g. a full disk) are logged, the batch stays queued and the thread tries
+again later, backing off up to MAX_BACKOFF. The inserts are idempotent
+(primary keys), so writing a train twice doesn't hurt.
+
+tables:
+  trainRuns (id, trainName, trainDate, company, finishedAt)
+  stops     (runId, stopIndex, station, planed/delayed arr/dep times, platform, canceled, cause)
+  events    (runId, seq, observed, stopIndex, field, value)  -- see diff.encode
+Times are epoch seconds.
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import diff
+import metrics
+import profiling
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trainRuns (
+  id TEXT PRIMARY KEY,
+  trainName TEXT NOT NULL,
+  trainDate INTEGER,
+  company TEXT,
+  finishedAt INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stops (
+  runId TEXT NOT NULL,
+  stopIndex INTEGER NOT NULL,
+  station TEXT NOT NULL,
+  planedArrTime INTEGER,
+  delayedArrTime INTEGER,
+  planedDepTime INTEGER,
+  delayedDepTime INTEGER,
+  platform TEXT,
+  canceled INTEGER NOT NULL,
+  cause TEXT,
+  PRIMARY KEY (runId, stopIndex)
+);
+CREATE TABLE IF NOT EXISTS events (
+  runId TEXT NOT NULL,
+  seq INTEGER NOT NULL,
+  observed INTEGER NOT NULL,
+  stopIndex INTEGER NOT NULL,
+  field TEXT NOT NULL,
+  value,
+  PRIMARY KEY (runId, seq)
+);
+"""
+MAX_BACKOFF = 5*60  # seconds between two flushes after repeated errors
+INSERT_RUN = "INSERT OR REPLACE INTO trainRuns VALUES (?, ?, ?, ?, ?)"
+INSERT_STOP = "INSERT OR REPLACE INTO stops VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_EVENT = "INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def _timestamp(value):
+  return int(value.timestamp()) if value is not None else None
+
+
+def rows(id, run, events, finished_at):
+  """(run row, stop rows, event rows) of a finished train."""
+  run_row = (id, run.train_name, _timestamp(run.train_date), run.company, _timestamp(finished_at))
+  stop_rows = [(id, index, stop.station, _timestamp(stop.planed_arr_time), _timestamp(stop.delayed_arr_time),
+                _timestamp(stop.planed_dep_time), _timestamp(stop.delayed_dep_time), stop.platform,
+                int(stop.canceled), stop.cause)
+               for index, stop in enumerate(run.route)]
+  event_rows = [(id, seq, *event) for seq, event in enumerate(diff.encode(events))]
+  return run_row, stop_rows, event_rows
+
+
+class WriteBehind:
+  """Queue finished trains and write them in batches (see module doc)."""
+
+  def __init__(self, path, max_runs=1000, max_delay=10.0, retries=5, on_flushed=None):
+    self.path = path
+    self.max_runs = max_runs
+    self.max_delay = max_delay
+    self.retries = retries
+    self.on_flushed = on_flushed
+    self.written = 0
+    self.connection = sqlite3.connect(path, timeout=1.0, check_same_thread=False)
+    self.connection.execute("PRAGMA journal_mode=WAL")
+    self.connection.execute("PRAGMA synchronous=NORMAL")
+    self.connection.executescript(SCHEMA)
+    self._queue = list()  # (id, rows)
+    self._oldest = None  # time.monotonic() of the oldest queued train
+    self._condition = threading.Condition()
+    self._flush_lock = threading.Lock()
+    self._closed = False
+    self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+    self._thread.start()
+
+  def put(self, id, run, events, finished_at=None):
+    """Queue a finished train (snapshot + all its events)."""
+    run_rows = rows(id, run, events, finished_at or datetime.now())
+    with self._condition:
+      if not self._queue:
+        self._oldest = time.monotonic()
+      self._queue.append((id, run_rows))
+      if len(self._queue) >= self.max_runs:
+        self._condition.notify()
+
+  def __len__(self):
+    return len(self._queue)
+
+  def _run(self):
+    failures = 0
+    while True:
+      with self._condition:
+        while not self._closed and not self._due():
+          timeout = self.max_delay if self._oldest is None else self._oldest + self.max_delay - time.monotonic()
+          self._condition.wait(timeout=max(timeout, 0.01))
+        if self._closed:
+          return
+      try:
+        written = self.flush()
+      except Exception as error:  # the thread must survive, otherwise put() queues forever
+        print(datetime.now(), "write-behind: flush failed, trains stay queued:", repr(error))
+        written = 0
+      failures = 0 if written else failures + 1
+      if not written:
+        with self._condition:  # still locked or failing: try again later
+          self._condition.wait(timeout=min(self.max_delay * 2 ** (failures - 1), MAX_BACKOFF))
+
+  def _due(self):
+    if not self._queue:
+      return False
+    return len(self._queue) >= self.max_runs or time.monotonic() - self._oldest >= self.max_delay
+
+  def flush(self):
+    """Write everything that is queued now; returns the number of trains written."""
+    with self._flush_lock:
+      with self._condition:
+        batch = list(self._queue)
+      if not batch:
+        return 0
+      run_rows = [run_row for _, (run_row, _, _) in batch]
+      stop_rows = [row for _, (_, stops, _) in batch for row in stops]
+      event_rows = [row for _, (_, _, events) in batch for row in events]
+      for attempt in range(self.retries + 1):
+        try:
+          with metrics.WRITE_LATENCY.time(store="sqlite"), profiling.stage("store"), self.connection:
+            self.connection.executemany(INSERT_RUN, run_rows)
+            self.connection.executemany(INSERT_STOP, stop_rows)
+            self.connection.executemany(INSERT_EVENT, event_rows)
+          break
+        except sqlite3.OperationalError as error:
+          if "locked" not in str(error) and "busy" not in str(error):
+            raise
+          if attempt == self.retries:
+            return 0  # stays queued, next flush tries again
+          time.sleep(0.05 * 2 ** attempt)
+
+      with self._condition:
+        del self._queue[:len(batch)]
+        self._oldest = time.monotonic() if self._queue else None
+      self.written += len(batch)
+    if self.on_flushed is not None:
+      self.on_flushed([id for id, _ in batch])
+    return len(batch)
+
+  def close(self):
+    """Stop the background thread and write the rest."""
+    with self._condition:
+      self._closed = True
+      self._condition.notify()
+    self._thread.join()
+    self.flush()
+    self.connection.close()
@@ -0,0 +1,113 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+import api
+import archive
+import cache
+from records import BoardEntry
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class CountingTrain(api.Train):
+  def __init__(self, url):
+    super().__init__(url)
+    self.requests = 0
+
+  def get_data(self, url):
+    self.requests += 1
+    with open(os.path.join(FIXTURES, "traininfo_s6.html"), encoding="utf-8") as file:
+      return file.read()
+
+
+class Test_lazy_fetch:
+  def test_nothing_is_fetched_on_construction(self):
+    train = CountingTrain("https://reiseauskunft.bahn.de/bin/traininfo.exe/dn/1?rt=0")
+    assert train.requests == 0
+
+  def test_fetched_once(self):
+    train = CountingTrain("https://reiseauskunft.bahn.de/bin/traininfo.exe/dn/1?rt=0")
+    assert train.init() is train.data_package
+    assert train.data_package.train_name == "S 6"
+    assert train.requests == 1
+
+  def test_refresh(self):
+    train = CountingTrain("https://reiseauskunft.bahn.de/bin/traininfo.exe/dn/1?rt=0")
+    first = train.data_package
+    second = train.refresh()
+    assert train.requests == 2
+    assert second is first  # unchanged page, not parsed again
+
+
+class TimetableStation(api.Station):
+  """A board with a departure every 3 minutes; fetch returns max_journeys rows from the request time."""
+
+  def __init__(self, departures):
+    super().__init__("timetable")
+    self.departures = departures
+
+  def fetch(self):
+    request_time = datetime.strptime(f"{self.request_date} {self.request_time}", "%d.%m.%y %H:%M")
+    rows = [(index, departure) for index, departure in enumerate(self.departures)
+            if departure >= request_time][:self.max_journeys or 20]
+    return [BoardEntry(planed_time=departure, train_name=f"S {index}", train_url="", transportation_type="s",
+                       endstation="Hannover Hbf") for index, departure in rows]
+
+
+class Test_service_day:
+  def departures(self, first, count):
+    return [first + timedelta(minutes=3 * index) for index in range(count)]
+
+  def test_whole_day_in_few_requests(self):
+    departures = self.departures(datetime(2026, 10, 18, 5, 0), 500)  # until the next morning
+    station = TimetableStation(departures)
+    entries = station.service_day(start=datetime(2026, 10, 18, 4, 0))
+    assert [entry.planed_time for entry in entries] == [d for d in departures if d.day == 18]
+    assert station.page_requests <= 4
+    assert station.max_journeys is None
+
+  def test_across_midnight(self):
+    departures = self.departures(datetime(2026, 10, 18, 23, 0), 60)
+    station = TimetableStation(departures)
+    entries = station.service_day(start=datetime(2026, 10, 18, 23, 0), end=datetime(2026, 10, 19, 1, 0))
+    assert [entry.planed_time for entry in entries] == departures[:40]
+
+  def test_full_minute(self):
+    departures = [datetime(2026, 10, 18, 8, 0)] * 30 + [datetime(2026, 10, 18, 8, 5)]
+    station = TimetableStation(departures)
+    station.MIN_JOURNEYS = 10
+    entries = station.service_day(start=datetime(2026, 10, 18, 8, 0), end=datetime(2026, 10, 18, 9, 0))
+    assert sorted(entry.train_name for entry in entries) == sorted(f"S {index}" for index in range(31))
+    assert station.page_requests <= 4
+
+  def test_minute_over_max_journeys(self):
+    departures = [datetime(2026, 10, 18, 8, 0)] * 30 + [datetime(2026, 10, 18, 8, 5)]
+    station = TimetableStation(departures)
+    station.MIN_JOURNEYS, station.MAX_JOURNEYS = 10, 20
+    entries = station.service_day(start=datetime(2026, 10, 18, 8, 0), end=datetime(2026, 10, 18, 9, 0))
+    assert [entry.planed_time.minute for entry in entries] == [0] * 20 + [5]
+
+
+class Test_error_pages:
+  def response(self, status, text):
+    response = requests.Response()
+    response.status_code = status
+    response._content = text.encode("utf-8")
+    return response
+
+  def test_error_page_is_neither_cached_nor_archived(self, tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    responses = [self.response(503, "<html>Service Unavailable</html>"), self.response(200, "<html>board</html>")]
+    monkeypatch.setattr(api.http_client, "request", lambda method, url, data=None: responses.pop(0))
+    monkeypatch.setattr(cache, "RESPONSE_CACHE", cache.ResponseCache())
+    monkeypatch.setattr(archive, "ARCHIVE", archive.Archive(str(tmp_path)))
+    station = api.Station("Isernhagen")
+    with pytest.raises(requests.HTTPError):
+      station.get_data()
+    assert archive.ARCHIVE.fetches() == []
+    assert station.get_data() == "<html>board</html>"
+    assert [url for _, url, _ in archive.ARCHIVE.fetches()] == [api.Station.URL]
+    archive.ARCHIVE.close()
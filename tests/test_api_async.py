@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+import api_async
+import archive
+import cache
+import fingerprint
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def run_with_server(handler, client_coroutine):
+  """Start a local server with handler on /train and run client_coroutine(base_url)."""
+  async def main():
+    app = web.Application()
+    app.router.add_route("*", "/train", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+      return await client_coroutine(f"http://127.0.0.1:{port}/train")
+    finally:
+      await runner.cleanup()
+  return asyncio.run(main())
+
+
+class Test_async_client:
+  def test_concurrency_limit(self):
+    with open(os.path.join(FIXTURES, "traininfo_s6.html"), encoding="utf-8") as file:
+      page = file.read()
+    in_flight = {"now": 0, "max": 0}
+
+    async def handler(request):
+      in_flight["now"] += 1
+      in_flight["max"] = max(in_flight["max"], in_flight["now"])
+      await asyncio.sleep(0.02)
+      in_flight["now"] -= 1
+      assert request.query["rt"] == "1"
+      return web.Response(text=page, content_type="text/html")
+
+    async def client(url):
+      async with api_async.AsyncClient(concurrency=3) as client:
+        return await client.trains([f"{url}?rt=0&n={i}" for i in range(12)])
+
+    trains = run_with_server(handler, client)
+    assert len(trains) == 12
+    assert all(train.data_package.train_name == "S 6" for train in trains)
+    assert in_flight["max"] == 3
+
+  def test_timeout(self):
+    async def handler(request):
+      await asyncio.sleep(1)
+      return web.Response(text="")
+
+    async def client(url):
+      async with api_async.AsyncClient(timeout=0.1) as client:
+        return await client.trains([url])
+
+    result, = run_with_server(handler, client)
+    assert isinstance(result, asyncio.TimeoutError)
+
+  def test_error_page_is_neither_cached_nor_archived(self, tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    with open(os.path.join(FIXTURES, "traininfo_s6.html"), encoding="utf-8") as file:
+      page = file.read()
+    statuses = [503, 200]
+
+    async def handler(request):
+      status = statuses.pop(0)
+      return web.Response(text=page if status == 200 else "<html>Service Unavailable</html>", status=status,
+                          content_type="text/html")
+
+    async def client(url):
+      async with api_async.AsyncClient() as client:
+        return await client.trains([url]) + await client.trains([url])
+
+    monkeypatch.setattr(cache, "RESPONSE_CACHE", cache.ResponseCache())
+    monkeypatch.setattr(archive, "ARCHIVE", archive.Archive(str(tmp_path)))
+    failed, train = run_with_server(handler, client)
+    assert isinstance(failed, aiohttp.ClientResponseError) and failed.status == 503
+    assert train.data_package.train_name == "S 6"
+    assert len(archive.ARCHIVE.fetches()) == 1
+    archive.ARCHIVE.close()
+
+  def test_parse_in_a_process_pool(self):
+    with open(os.path.join(FIXTURES, "bhftafel_isernhagen.html"), encoding="utf-8") as file:
+      page = file.read()
+
+    async def handler(request):
+      return web.Response(text=page, content_type="text/html")
+
+    async def client(url):
+      executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+      stations = [api_async.AsyncStation("async-pool", check_version=True) for _ in range(2)]
+      try:
+        async with api_async.AsyncClient(executor=executor, use_cache=False) as client:
+          for station in stations:
+            station.URL = url
+            await client.fetch(station)
+      finally:
+        executor.shutdown()
+      return stations
+
+    fingerprint.STATION_MEMO.clear()
+    first, second = run_with_server(handler, client)
+    for station in (first, second):
+      assert [row.train_name for row in station.data_package] == ["S 6", "S 7", "RE 30", "S 6"]
+      assert station.bhftafel_version == "5.45.DB.R23.12.a"
+      assert "Isernhagen Bahnhof" in station.excess_stations
+    assert fingerprint.STATION_MEMO.hits == 1
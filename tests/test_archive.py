@@ -0,0 +1,67 @@
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("zstandard")
+
+import archive
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_pages():
+  pages = list()
+  for filename in sorted(os.listdir(FIXTURES)):
+    with open(os.path.join(FIXTURES, filename), encoding="utf-8") as file:
+      pages.append((filename, file.read()))
+  return pages
+
+
+class Test_archive:
+  def test_deduplication(self, tmp_path):
+    page_archive = archive.Archive(str(tmp_path))
+    filename, page = read_pages()[0]
+    first = page_archive.put(filename, page, datetime(2026, 10, 18, 14, 0))
+    second = page_archive.put(filename, page, datetime(2026, 10, 18, 14, 5))
+    assert first == second
+    assert len(list(page_archive.iter_segment("2026-10-18.seg"))) == 1
+    assert len(page_archive.fetches()) == 2
+    assert page_archive.get(first) == page
+
+  def test_daily_segments(self, tmp_path):
+    page_archive = archive.Archive(str(tmp_path))
+    (_, first), (_, second) = read_pages()[:2]
+    page_archive.put("a", first, datetime(2026, 10, 18, 23, 59))
+    page_archive.put("b", second, datetime(2026, 10, 19, 0, 1))
+    assert page_archive.segments() == ["2026-10-18.seg", "2026-10-19.seg"]
+    assert [page for _, page in page_archive.iter_segment("2026-10-19.seg")] == [second]
+
+  def test_dictionary(self, tmp_path):
+    page_archive = archive.Archive(str(tmp_path))
+    pages = read_pages()
+    # enough distinct samples for the dictionary trainer
+    digests = [page_archive.put(f"{filename}/{index}", page.replace("18.10.26", f"{index % 28 + 1:02}.10.26") + f"<!-- {index} -->")
+               for index in range(60) for filename, page in pages]
+    page_archive.train_dictionary(size=16384)
+    new_digest = page_archive.put("new", pages[0][1] + "<!-- new -->")
+    page_archive.close()
+
+    page_archive = archive.Archive(str(tmp_path))  # dictionaries are loaded again
+    assert page_archive.get(new_digest) == pages[0][1] + "<!-- new -->"
+    assert page_archive.get(digests[0]).startswith("<!DOCTYPE html>")
+
+  def test_dictionary_is_trained_automatically(self, tmp_path):
+    page_archive = archive.Archive(str(tmp_path), train_after=100)
+    pages = read_pages()
+    day = datetime(2026, 10, 18, 14, 0)
+    digests = [page_archive.put(f"{filename}/{index}", page.replace("18.10.26", f"{index % 28 + 1:02}.10.26") + f"<!-- {index} -->", day)
+               for index in range(60) for filename, page in pages]
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".zdict")]) == 1
+    assert page_archive._dict_id != 0
+    page_archive.put("next day", pages[0][1] + "<!-- next day -->", datetime(2026, 10, 19, 0, 1))
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".zdict")]) == 2
+    page_archive.close()
+
+    page_archive = archive.Archive(str(tmp_path), train_after=100)
+    assert all(page_archive.get(digest) is not None for digest in digests)
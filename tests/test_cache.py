@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+import cache
+
+
+class Test_key:
+  def test_query_order_does_not_matter(self):
+    first = cache.ResponseCache.key("get", "https://Reiseauskunft.bahn.de/bin/traininfo.exe/dn/1?rt=1&date=18.10.26")
+    second = cache.ResponseCache.key("GET", "https://reiseauskunft.bahn.de/bin/traininfo.exe/dn/1?date=18.10.26&rt=1")
+    assert first == second
+
+  def test_payload_is_part_of_the_key(self):
+    url = "https://reiseauskunft.bahn.de/bin/bhftafel.exe/dn?rt=1&"
+    assert cache.ResponseCache.key("POST", url, {"input": "a"}) != cache.ResponseCache.key("POST", url, {"input": "b"})
+
+  def test_endpoint(self):
+    assert cache.ResponseCache.endpoint("https://reiseauskunft.bahn.de/bin/traininfo.exe/dn/1") == "traininfo"
+
+
+class Test_response_cache:
+  URL = "https://reiseauskunft.bahn.de/bin/traininfo.exe/dn/1?rt=1"
+
+  def test_ttl(self, monkeypatch):
+    response_cache = cache.ResponseCache(ttls={"traininfo": 10})
+    assert response_cache.get_or_fetch("GET", self.URL, None, lambda: "first") == "first"
+    assert response_cache.get_or_fetch("GET", self.URL, None, lambda: "second") == "first"
+    now = time.time()
+    monkeypatch.setattr(cache.time, "time", lambda: now + 11)
+    assert response_cache.get_or_fetch("GET", self.URL, None, lambda: "third") == "third"
+
+  def test_lru_bound(self):
+    response_cache = cache.ResponseCache(max_entries=2)
+    for index in range(3):
+      response_cache.get_or_fetch("GET", f"{self.URL}&n={index}", None, lambda: "page")
+    response_cache.get_or_fetch("GET", f"{self.URL}&n=0", None, lambda: "new")
+    assert response_cache.misses == 4
+
+  def test_disk_tier(self, tmp_path):
+    path = str(tmp_path / "responses.db")
+    response_cache = cache.ResponseCache(disk_path=path)
+    response_cache.get_or_fetch("GET", self.URL, None, lambda: "page")
+    response_cache.close()
+    response_cache = cache.ResponseCache(disk_path=path)
+    assert response_cache.get_or_fetch("GET", self.URL, None, lambda: "refetched") == "page"
+
+  def test_coalescing(self):
+    response_cache = cache.ResponseCache(ttls={"traininfo": 0})
+    calls = list()
+    release = threading.Event()
+
+    def fetch():
+      calls.append(1)
+      release.wait(2)
+      return "page"
+
+    results = list()
+    threads = [threading.Thread(target=lambda: results.append(response_cache.get_or_fetch("GET", self.URL, None, fetch))) for _ in range(5)]
+    for thread in threads:
+      thread.start()
+    while response_cache.misses + response_cache.coalesced < 5:
+      time.sleep(0.001)
+    release.set()
+    for thread in threads:
+      thread.join()
+    assert calls == [1]
+    assert results == ["page"] * 5
+
+  def test_errors_are_shared_and_not_cached(self):
+    response_cache = cache.ResponseCache()
+
+    def fetch():
+      raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+      response_cache.get_or_fetch("GET", self.URL, None, fetch)
+    assert response_cache.get_or_fetch("GET", self.URL, None, lambda: "page") == "page"
@@ -0,0 +1,89 @@
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import diff
+from records import BoardEntry, Stop, TrainRun
+
+pyarrow = pytest.importorskip("pyarrow")
+import columnar  # noqa: E402
+from writebehind import WriteBehind  # noqa: E402
+
+
+def run(day, delay):
+  departure = datetime(2026, 10, day, 14, 0)
+  route = [Stop(station=station, planed_arr_time=departure + timedelta(minutes=10 * index),
+                delayed_arr_time=departure + timedelta(minutes=10 * index + delay), cause="Bauarbeiten" if delay else None)
+           for index, station in enumerate(["Isernhagen", "Langenhagen", "Hannover Hbf"])]
+  return TrainRun(train_name="S 6", train_date=departure, company="DB Regio AG", route=route)
+
+
+class Test_columnar_archive:
+  def test_write_and_read(self, tmp_path):
+    archive = columnar.ColumnarArchive(str(tmp_path))
+    archive.write_runs([("a", run(17, 0)), ("b", run(18, 5))])
+    archive.write_runs([("c", run(18, 2))])
+    assert archive.days(columnar.STOPS) == ["2026-10-17", "2026-10-18"]
+
+    table = archive.read(start=date(2026, 10, 18), columns=["runId", "station", "arrDelay"])
+    assert table.column_names == ["runId", "station", "arrDelay"]
+    assert sorted(set(table.column("runId").to_pylist())) == ["b", "c"]
+    assert pyarrow.types.is_dictionary(table.schema.field("station").type)
+    assert max(table.column("arrDelay").to_pylist()) == timedelta(minutes=5)
+
+    archive.compact()
+    assert len(os.listdir(tmp_path / "stops" / "day=2026-10-18")) == 1
+    assert archive.read(end=date(2026, 10, 18)).num_rows == 3
+
+  def test_board(self, tmp_path):
+    archive = columnar.ColumnarArchive(str(tmp_path))
+    planed = datetime(2026, 10, 18, 23, 59)
+    archive.write_board("Isernhagen", [
+      BoardEntry(planed_time=planed, train_name="S 6", train_url="", transportation_type="s", endstation="Celle",
+                 delayed_time=planed + timedelta(minutes=3), delayed_by=timedelta(minutes=3), cause="Reparatur"),
+      BoardEntry(planed_time=planed + timedelta(minutes=2), train_name="S 7", train_url="", transportation_type="s",
+                 endstation="Celle", canceled=True),
+    ])
+    assert archive.days(columnar.DEPARTURES) == ["2026-10-18", "2026-10-19"]
+    table = archive.read(columnar.DEPARTURES, columns=["trainName", "delay", "canceled"])
+    assert table.to_pylist() == [
+      {"trainName": "S 6", "delay": timedelta(minutes=3), "canceled": False},
+      {"trainName": "S 7", "delay": None, "canceled": True},
+    ]
+
+  def test_import_sqlite(self, tmp_path):
+    path = str(tmp_path / "connections.sql")
+    writer = WriteBehind(path)
+    writer.put("a", run(17, 0), diff.diff(None, run(17, 0)))
+    writer.put("b", run(18, 4), diff.diff(None, run(18, 4)))
+    writer.close()
+
+    archive = columnar.ColumnarArchive(str(tmp_path / "analytics"))
+    assert archive.import_sqlite(path, start=date(2026, 10, 18)) == 1
+    table = archive.read(columns=["runId", "stopIndex", "cause"])
+    assert table.column("runId").to_pylist() == ["b", "b", "b"]
+    assert table.column("cause").to_pylist() == ["Bauarbeiten"] * 3
+
+  def test_export_again(self, tmp_path):
+    path = str(tmp_path / "connections.sql")
+    writer = WriteBehind(path)
+    for number in range(5):
+      writer.put(f"run{number}", run(18, number), [])
+    writer.close()
+
+    archive = columnar.ColumnarArchive(str(tmp_path / "analytics"))
+    assert archive.import_sqlite(path, batch=2) == 5
+    assert archive.import_sqlite(path) == 5
+    assert archive.read().num_rows == 2 * 5 * 3
+    archive.compact()
+    table = archive.read(columns=["runId", "stopIndex"])
+    assert sorted(zip(table.column("runId").to_pylist(), table.column("stopIndex").to_pylist())) == \
+      [(f"run{number}", index) for number in range(5) for index in range(3)]
+
+  def test_compact_keeps_the_last_row(self, tmp_path):
+    archive = columnar.ColumnarArchive(str(tmp_path))
+    archive.write_runs([("c", run(18, 2))])
+    archive.write_runs([("c", run(18, 5))])
+    archive.compact()
+    assert archive.read(columns=["arrDelay"]).column("arrDelay").to_pylist() == [timedelta(minutes=5)] * 3
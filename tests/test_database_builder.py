@@ -20,3 +20,28 @@ class Test_next_partial_city:
     last = "hrb"
     next = database_builder.DatabaseBuilder._next_partial_city(last)
     assert next == "hrc"
+
+
+class Response:
+  status_code = 200
+
+  def __init__(self, document):
+    self.document = document
+
+  def json(self):
+    return self.document
+
+
+class Test_openstreetmap:
+  def country_code(self, monkeypatch, document):
+    monkeypatch.setattr(database_builder.http_client, "get", lambda url, headers=None: Response(document))
+    builder = database_builder.DatabaseBuilder.__new__(database_builder.DatabaseBuilder)
+    return builder._get_country_code_openstreetmap("52.520008", "13.404954", {"Deutschland": "DE"})
+
+  def test_geocodejson(self, monkeypatch):
+    document = {"type": "FeatureCollection", "features": [
+      {"type": "Feature", "properties": {"geocoding": {"label": "Berlin, Deutschland"}}}]}
+    assert self.country_code(monkeypatch, document) == "DE"
+
+  def test_nothing_found(self, monkeypatch):
+    assert self.country_code(monkeypatch, {"type": "FeatureCollection", "features": []}) is None
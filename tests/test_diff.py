@@ -0,0 +1,52 @@
+import os
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+import api
+import diff
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def parse_train(filename):
+  with open(os.path.join(FIXTURES, filename), encoding="utf-8") as file:
+    return api.Train("recorded").extract_relevant_data(file.read())
+
+
+class Test_diff:
+  def test_no_changes(self):
+    assert diff.diff(parse_train("traininfo_s6.html"), parse_train("traininfo_s6.html")) == []
+
+  def test_delay_and_platform(self):
+    old = parse_train("traininfo_ice578.html")
+    new = parse_train("traininfo_ice578.html")
+    new.route[3].delayed_arr_time += timedelta(minutes=4)
+    new.route[3].platform = "13"
+    events = diff.diff(old, new)
+    assert [(event.stop, event.field) for event in events] == [(3, "delayed_arr_time"), (3, "platform")]
+    assert diff.apply(old, events) == new
+
+  def test_first_snapshot(self):
+    new = parse_train("traininfo_s6.html")
+    events = diff.diff(None, new)
+    assert events[0].field == diff.ADDED
+    assert diff.apply(replace(new, route=[]), events) == new
+
+  def test_stops_added_and_removed(self):
+    old = parse_train("traininfo_ice578.html")
+    new = parse_train("traininfo_ice578.html")
+    del new.route[1]
+    new.route.insert(2, replace(new.route[1], station="Celle"))
+    new.route[3].cause = "Signalstörung"
+    assert diff.apply(old, diff.diff(old, new)) == new
+
+  def test_encode_decode(self):
+    old = parse_train("traininfo_ice578.html")
+    new = parse_train("traininfo_ice578.html")
+    new.route[0].canceled = True
+    new.route[2].delayed_dep_time = None
+    events = diff.diff(old, new, observed=datetime(2026, 10, 18, 22, 40))
+    encoded = diff.encode(events)
+    assert encoded == [[int(datetime(2026, 10, 18, 22, 40).timestamp()), 0, "c", True],
+                       [int(datetime(2026, 10, 18, 22, 40).timestamp()), 2, "dd", None]]
+    assert diff.decode(encoded) == events
@@ -0,0 +1,57 @@
+import os
+
+import api
+import fingerprint
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(filename):
+  with open(os.path.join(FIXTURES, filename), encoding="utf-8") as file:
+    return file.read()
+
+
+class PagedStation(api.Station):
+  def __init__(self, name, pages):
+    self.pages = pages
+    super().__init__(name, check_version=True)
+
+  def get_data(self):
+    return self.pages.pop(0)
+
+
+class Test_section:
+  def test_markers(self):
+    html_document = "<head>x</head><div id=\"a\"><p class=\"b\">1</p><p class=\"b\">2</p></div><footer>"
+    assert fingerprint.section(html_document, 'id="a"', 'class="b"', "</p>") == 'id="a"><p class="b">1</p><p class="b">2</p>'
+
+  def test_missing_markers(self):
+    assert fingerprint.section("<html></html>", 'id="a"', 'class="b"', "</p>") == "<html></html>"
+
+
+class Test_parse_memo:
+  def test_unchanged_board_is_not_parsed_again(self):
+    html_document = read_fixture("bhftafel_isernhagen.html")
+    fingerprint.STATION_MEMO.clear()
+    station = PagedStation("memo-station", [html_document, html_document.replace("</html>", "<!-- 42 --></html>")])
+    first = station.data_package
+    second = station.refresh()
+    assert second is first
+    assert station.bhftafel_version == "5.45.DB.R23.12.a"
+    assert fingerprint.STATION_MEMO.stats()["hits"] == 1
+
+  def test_changed_board_is_parsed(self):
+    html_document = read_fixture("bhftafel_isernhagen.html")
+    fingerprint.STATION_MEMO.clear()
+    station = PagedStation("memo-station", [html_document, html_document.replace('<td class="time">14:07</td>', '<td class="time">14:08</td>')])
+    first = station.data_package
+    second = station.refresh()
+    assert second != first
+    assert [row.planed_time.strftime("%H:%M") for row in second] != [row.planed_time.strftime("%H:%M") for row in first]
+    assert fingerprint.STATION_MEMO.stats()["misses"] == 2
+
+  def test_request_date_is_part_of_the_fingerprint(self):
+    memo = fingerprint.ParseMemo()
+    memo.parse("a", fingerprint.fingerprint("page", "18.10.26"), lambda: 1)
+    assert memo.parse("a", fingerprint.fingerprint("page", "19.10.26"), lambda: 2) == 2
+    assert memo.parse("a", fingerprint.fingerprint("page", "19.10.26"), lambda: 3) == 2
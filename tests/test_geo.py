@@ -0,0 +1,73 @@
+import random
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip("scipy")
+
+from geo import StationIndex, distance
+
+
+STATIONS = [
+  ("Hannover Hbf", "008000152", "52.376763", "9.741021"),
+  ("Isernhagen", "008003034", "52.460563", "9.861563"),
+  ("Lehrte", "008000226", "52.371945", "9.977054"),
+  ("Celle", "008000064", "52.621084", "10.061850"),
+  ("Hamburg Hbf", "008002549", "53.552736", "10.006909"),
+  ("München Hbf", "008000261", "48.140232", "11.558335"),
+  ("Kilometer 0", "000000001", None, None),
+]
+
+
+def stations_db(path, rows):
+  connection = sqlite3.connect(path)
+  connection.execute("CREATE TABLE stations(stationName,stationId,lat,lng,country)")
+  connection.executemany("INSERT INTO stations VALUES(?,?,?,?,NULL)", rows)
+  connection.commit()
+  connection.close()
+  return path
+
+
+@pytest.fixture
+def index(tmp_path):
+  return StationIndex(stations_db(str(tmp_path / "stations.db"), STATIONS))
+
+
+class Test_station_index:
+  def test_rows_without_coordinates_are_skipped(self, index):
+    assert len(index) == 6
+
+  def test_within_radius_nearest_first(self, index):
+    assert index.within_radius(52.376763, 9.741021, km=20) == ["Hannover Hbf", "Isernhagen", "Lehrte"]
+    assert index.within_radius(52.376763, 9.741021, km=1) == ["Hannover Hbf"]
+    assert "Hamburg Hbf" in index.within_radius(52.376763, 9.741021, km=160)
+
+  def test_within_bbox(self, index):
+    assert sorted(index.within_bbox(south=52.3, west=9.7, north=52.5, east=10.0)) == ["Hannover Hbf", "Isernhagen", "Lehrte"]
+    assert index.within_bbox(south=52.3, west=9.8, north=52.4, east=9.9) == []
+
+  def test_within_polygon(self, index):
+    # triangle around Hannover and Isernhagen, Lehrte outside
+    triangle = [(52.3, 9.6), (52.55, 9.9), (52.3, 9.9)]
+    assert sorted(index.within_polygon(triangle)) == ["Hannover Hbf", "Isernhagen"]
+
+  def test_select(self, index):
+    assert index.select({"center": (48.14, 11.56), "radius": 5}) == ["München Hbf"]
+    assert index.select({"bbox": (53, 9, 54, 11)}) == ["Hamburg Hbf"]
+    with pytest.raises(ValueError):
+      index.select({"city": "Hannover"})
+
+  def test_distance(self):
+    assert distance(52.376763, 9.741021, 53.552736, 10.006909) == pytest.approx(132, abs=2)
+
+  def test_queries_take_milliseconds(self, tmp_path):
+    random.seed(1)
+    rows = [(f"Station {n}", str(n), str(random.uniform(47, 55)), str(random.uniform(6, 15))) for n in range(60000)]
+    index = StationIndex(stations_db(str(tmp_path / "many.db"), rows))
+    start = time.perf_counter()
+    for _ in range(10):
+      stations = index.within_radius(52.37, 9.73, km=50)
+      index.within_bbox(52.0, 9.0, 53.0, 10.5)
+    assert stations
+    assert (time.perf_counter() - start) / 10 < 0.05
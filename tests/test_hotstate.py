@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import diff
+import hotstate
+from records import Stop, TrainRun
+
+fakeredis = pytest.importorskip("fakeredis")
+
+DEPARTURE = datetime(2026, 10, 18, 14, 0)
+
+
+def run(delay=None, stations=("Isernhagen", "Langenhagen", "Hannover Hbf")):
+  route = [Stop(station=station, planed_arr_time=DEPARTURE + timedelta(minutes=10 * index),
+                delayed_arr_time=DEPARTURE + timedelta(minutes=10 * index) + delay if delay else None)
+           for index, station in enumerate(stations)]
+  return TrainRun(train_name="S 6", train_date=DEPARTURE, company="DB Regio AG", route=route)
+
+
+@pytest.fixture
+def state():
+  return hotstate.HotState(fakeredis.FakeRedis(decode_responses=True))
+
+
+class Test_hot_state:
+  def test_roundtrip(self):
+    assert hotstate.decode_run(hotstate.encode_run(run(timedelta(minutes=3)))) == run(timedelta(minutes=3))
+
+  def test_path_updates(self, state):
+    first = run()
+    state.update("S6", None, first, diff.diff(None, first))
+    second = run(timedelta(minutes=4))
+    events = diff.diff(first, second)
+    state.update("S6", first, second, events)
+    assert state.snapshot("S6") == second
+    assert len(state.events("S6")) == len(diff.diff(None, first)) + len(events)
+    assert diff.apply(TrainRun(train_name="S 6", train_date=DEPARTURE, company="DB Regio AG"), state.events("S6")) == second
+
+  def test_changed_route(self, state):
+    first = run()
+    state.update("S6", None, first, diff.diff(None, first))
+    second = run(stations=("Isernhagen", "Hannover Hbf"))
+    state.update("S6", first, second, diff.diff(first, second))
+    assert state.snapshot("S6") == second
+
+  def test_index_and_remove(self, state):
+    for id in ("S6", "S7"):
+      state.update(id, None, run(), diff.diff(None, run()))
+    assert state.active() == {"S6", "S7"}
+    assert set(state.load()) == {"S6", "S7"}
+    state.remove("S6")
+    assert state.active() == {"S7"}
+    assert state.snapshot("S6") is None and state.events("S6") == []
@@ -0,0 +1,103 @@
+import threading
+
+from id_scanner import IdScanner, RangeSet
+
+
+class Ids:
+  """Answers like ajax-getstop in "id" mode: the station of a valid id, else nothing."""
+
+  def __init__(self, valid, fail=()):
+    self.valid = set(valid)
+    self.fail = set(fail)
+    self.requested = list()
+    self._lock = threading.Lock()
+
+  def __call__(self, id):
+    with self._lock:
+      self.requested.append(id)
+      if id in self.fail:
+        self.fail.discard(id)
+        raise ConnectionError(id)
+    if int(id) in self.valid:
+      return [{"stationName": f"Station {int(id)}", "stationId": id}]
+    return []
+
+
+class Test_range_set:
+  def test_merge(self):
+    ranges = RangeSet()
+    for value in [5, 7, 6, 1, 2, 10]:
+      ranges.add(value)
+    assert ranges.ranges() == [(1, 3), (5, 8), (10, 11)]
+    ranges.add_range(3, 5)
+    assert ranges.ranges() == [(1, 8), (10, 11)]
+    assert 7 in ranges and 8 not in ranges and 0 not in ranges
+    assert len(ranges) == 8
+
+  def test_missing(self):
+    ranges = RangeSet([(1, 3), (5, 8), (10, 11)])
+    assert list(ranges.missing(0, 12)) == [0, 3, 4, 8, 9, 11]
+    assert list(ranges.missing(5, 8)) == []
+    assert list(ranges.missing(0, 12, reverse=True)) == [11, 9, 8, 4, 3, 0]
+    assert list(ranges.missing(2, 10, reverse=True)) == [9, 8, 4, 3]
+
+  def test_persistence(self, tmp_path):
+    path = str(tmp_path / "invalid_ids.json")
+    RangeSet([(102570, 102573), (102574, 102587)]).save(path)
+    assert RangeSet.load(path).ranges() == [(102570, 102573), (102574, 102587)]
+    assert RangeSet.load(str(tmp_path / "none.json")).ranges() == []
+
+
+class Test_id_scanner:
+  def test_finds_the_overlooked_ids(self, tmp_path):
+    known = ["000102569", "000102587", "000102600"]
+    ids, stored = Ids(valid=[102573, 102574, 102590]), list()
+    scanner = IdScanner(ids, stored.extend, str(tmp_path / "invalid_ids.json"), workers=4)
+    assert scanner.run(known)
+    assert sorted(station["stationId"] for station in stored) == ["000102573", "000102574", "000102590"]
+    assert len(ids.requested) == (102587 - 102569 - 1) + (102600 - 102587 - 1)
+    assert all(len(id) == 9 for id in ids.requested)
+    assert len(scanner.invalid) == len(ids.requested) - 3
+
+  def test_invalid_ids_are_never_requested_again(self, tmp_path):
+    path = str(tmp_path / "invalid_ids.json")
+    known = [100, 200]
+    IdScanner(Ids(valid=[150]), list().extend, path).run(known)
+    again = Ids(valid=[150])
+    scanner = IdScanner(again, list().extend, path)
+    assert scanner.run(known + [150])
+    assert again.requested == []
+    assert RangeSet.load(path).ranges() == [(101, 150), (151, 200)]
+
+  def test_failed_ids_are_probed_next_time(self, tmp_path):
+    path = str(tmp_path / "invalid_ids.json")
+    scanner = IdScanner(Ids(valid=[], fail=["000000015"]), list().extend, path)
+    scanner.run([10, 20])
+    assert scanner.failed == 1 and 15 not in scanner.invalid
+    again = Ids(valid=[])
+    IdScanner(again, list().extend, path).run([10, 20])
+    assert again.requested == ["000000015"]
+
+  def test_large_gaps_only_at_the_edges(self, tmp_path):
+    ids = Ids(valid=[])
+    scanner = IdScanner(ids, list().extend, str(tmp_path / "invalid_ids.json"), max_gap=100, edge=10)
+    scanner.run([1000, 8000000])
+    assert sorted(int(id) for id in ids.requested) == list(range(1001, 1011)) + list(range(7999990, 8000000))
+
+  def test_large_gaps_move_inwards(self, tmp_path):
+    path = str(tmp_path / "invalid_ids.json")
+    ids, stored = Ids(valid=[2500]), list()
+    runs = 0
+    while not stored and runs < 50:
+      IdScanner(ids, stored.extend, path, max_gap=1000, edge=50).run([100, 5000])
+      runs += 1
+    assert [station["stationId"] for station in stored] == ["000002500"]
+    # 50 new ids at each edge a run: 101-150 and 4950-4999, then 151-200 and 4900-4949, ...
+    assert runs == (2500 - 100) // 50
+    assert len(ids.requested) == len(set(ids.requested)) == runs * 100
+
+  def test_bounded_run(self, tmp_path):
+    ids = Ids(valid=[])
+    scanner = IdScanner(ids, list().extend, str(tmp_path / "invalid_ids.json"), workers=2)
+    assert not scanner.run([0, 1000], max_requests=16)
+    assert scanner.requests == 16
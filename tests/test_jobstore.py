@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from jobstore import FINISHED, OVERDUE, JobStore
+from records import BoardEntry
+
+NOW = datetime(2026, 10, 18, 14, 0)
+
+
+def train(name, arrival):
+  return BoardEntry(planed_time=arrival - timedelta(minutes=30), train_name=name, train_url=f"https://example/{name}",
+                    transportation_type="s", endstation="Hannover Hbf", partial_route=[("Hannover Hbf", arrival)])
+
+
+class Test_job_store:
+  def test_save_and_load(self, tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.save("S6", train("S 6", NOW), NOW)
+    store.save("S6", train("S 6", NOW), NOW + timedelta(minutes=5))  # reschedule
+    store.save("S7", train("S 7", NOW), NOW)
+    store.delete("S7")
+    store.close()
+
+    store = JobStore(str(tmp_path / "jobs.db"))
+    [(id, loaded_train, next_run)] = store.load()
+    assert (id, loaded_train, next_run) == ("S6", train("S 6", NOW), NOW + timedelta(minutes=5))
+
+  def test_resume(self, tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.save("finished", train("S 1", NOW - timedelta(hours=2)), NOW - timedelta(hours=2))
+    store.save("late", train("S 2", NOW + timedelta(hours=1)), NOW - timedelta(minutes=10))
+    store.save("urgent", train("S 3", NOW + timedelta(minutes=5)), NOW - timedelta(minutes=10))
+    store.save("future", train("S 4", NOW + timedelta(hours=1)), NOW + timedelta(minutes=10))
+
+    plan = store.resume(now=NOW, catch_up_rate=2)
+    assert [(id, run_at) for id, _, run_at in plan] == [
+      ("future", NOW + timedelta(minutes=10)),
+      ("urgent", NOW),
+      ("late", NOW + timedelta(seconds=0.5)),
+    ]
+    assert len(store) == 3
+    assert sorted((id, reason) for id, _, _, reason in store.missed()) == [
+      ("finished", FINISHED), ("late", OVERDUE), ("urgent", OVERDUE)]
+    # a second restart right away doesn't count the caught up polls again
+    store.resume(now=NOW)
+    assert len(store.missed()) == 3
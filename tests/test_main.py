@@ -0,0 +1,150 @@
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import columnar
+import main
+from hotstate import HotState
+from jobstore import JobStore
+from polling import PollingPolicy
+from records import BoardEntry, Stop, TrainRun
+from scheduler import Scheduler
+from sharding import Cluster
+
+fakeredis = pytest.importorskip("fakeredis")
+
+START = datetime.now().replace(second=0, microsecond=0) + timedelta(hours=1)
+
+
+def board(count=60):
+  return [BoardEntry(planed_time=START, train_name=f"RE {number}", train_url=f"https://example.org/{number}",
+                     transportation_type="RE", endstation="Hamburg Hbf",
+                     partial_route=[("Hamburg Hbf", START + timedelta(minutes=number))]) for number in range(count)]
+
+
+def run(number):
+  return TrainRun(train_name=f"RE {number}", train_date=START, route=[Stop(station="Hamburg Hbf", planed_arr_time=START)])
+
+
+class Pipeline:
+  def __init__(self, data):
+    self.data = data
+
+  def fetch(self, api):
+    return self.data
+
+
+class WriteBehind:
+  def __init__(self):
+    self.written = list()
+
+  def put(self, id, run, events):
+    self.written.append(id)
+
+
+def collector(server, name, tmp_path, data=()):
+  """A Management without the run loop."""
+  client = fakeredis.FakeRedis(server=server, decode_responses=True)
+  management = main.Management.__new__(main.Management)
+  management.snapshots = dict()
+  management.stations = list()
+  management.cluster = Cluster(client, node_id=name)
+  management.hotState = HotState(client)
+  management.writeBehind = WriteBehind()
+  management.scheduler = Scheduler(max_workers=1)
+  management.jobStore = JobStore(str(tmp_path / f"jobs-{name}.db"))
+  management.pollingPolicy = PollingPolicy()
+  management.pipeline = Pipeline(list(data))
+  management.columnar = None
+  management.boards = list()
+  management.boardsLock = threading.Lock()
+  return management
+
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+  monkeypatch.setattr(main, "Station", lambda station, check_version: SimpleNamespace(bhftafel_version=None))
+  monkeypatch.setattr(main, "_track_bhftafel_version", lambda version: None)
+  server = fakeredis.FakeServer()
+  a, b = collector(server, "a", tmp_path, board()), collector(server, "b", tmp_path)
+  for management in (a, b, a):
+    management.heartbeat()
+  yield a, b
+  for management in (a, b):
+    management.scheduler.executor.shutdown()
+    management.jobStore.close()
+
+
+def polled(management):
+  return set(job.id for job in management.scheduler.jobs() if job.func == management.processTrain)
+
+
+class Test_management:
+  def test_trains_found_by_another_collector_are_polled(self, cluster):
+    a, b = cluster
+    assert a.cluster.members() == b.cluster.members() == {"a", "b"}
+    a.callStation("Hamburg Hbf")
+    b.heartbeat()  # no member joined or died
+    ids = set(main.trainId(train) for train in board())
+    assert polled(a) | polled(b) == ids
+    assert polled(a) and polled(b) and not polled(a) & polled(b)
+    assert all(b.cluster.owns(id) for id in polled(b))
+    b.heartbeat()
+    assert len(polled(b)) == len(ids - polled(a))
+
+  def test_restart_archives_only_its_own_trains(self, cluster):
+    a, b = cluster
+    ids = [main.trainId(train) for train in board()]
+    for number, id in enumerate(ids):
+      a.hotState.update(id, None, run(number), [])
+    b.resumeTrains()  # no jobs: all of b's trains are finished
+    assert set(b.writeBehind.written) == set(id for id in ids if b.cluster.owns(id)) != set()
+
+  def test_rebalance_forgets_the_lost_trains(self, cluster):
+    a, b = cluster
+    a.cluster.leave()
+    b.heartbeat()
+    b.pipeline = Pipeline(board())
+    b.callStation("Hamburg Hbf")
+    ids = [main.trainId(train) for train in board()]
+    assert polled(b) == set(ids)
+    for number, id in enumerate(ids):
+      b.snapshots[id] = run(number)
+      b.pollingPolicy.observe(id, run(number), START - timedelta(minutes=10))
+    a.heartbeat()  # a is back
+    b.heartbeat()
+    lost = set(ids) - polled(b)
+    assert lost and all(a.cluster.owns(id) for id in lost)
+    assert not lost & set(b.snapshots) and not lost & set(b.pollingPolicy.priorities)
+    assert b.pollingPolicy.stats()["activeTrains"] == len(polled(b))
+
+  def test_boards_go_to_the_departures_dataset(self, cluster, tmp_path):
+    pytest.importorskip("pyarrow")
+    a, _ = cluster
+    a.columnar = columnar.ColumnarArchive(str(tmp_path / "analytics"))
+    a.callStation("Hamburg Hbf")
+    a.callStation("Hamburg Hbf")
+    a.writeBoards()
+    a.callStation("Hamburg Hbf")
+    a.writeBoards()
+    a.writeBoards()  # nothing new
+    assert a.columnar.read(columnar.DEPARTURES).num_rows == 2 * len(board())
+    a.columnar.compact(columnar.DEPARTURES)
+    table = a.columnar.read(columnar.DEPARTURES, columns=["station", "trainName"])
+    assert set(table.column("station").to_pylist()) == {"Hamburg Hbf"} and table.num_rows == len(board())
+
+  def test_one_id_per_train(self, cluster):
+    a, _ = cluster
+    train = next(train for train in board() if a.cluster.owns(main.trainId(train)))
+    id = main.trainId(train)
+    a.scheduler.add(id, a.processTrain, train)
+    # the train page has another name for the last stop than the board
+    a.pipeline = Pipeline(TrainRun(train_name=train.train_name, train_date=START, route=[
+      Stop(station="Hamburg Hbf", planed_arr_time=START), Stop(station="Hamburg-Altona", planed_arr_time=START + timedelta(hours=2))]))
+    a.processTrain(train)
+    assert polled(a) == {id}
+    assert [job_id for job_id, _, _ in a.jobStore.load()] == [id]
+    assert a.hotState.active() == {id} and set(a.pollingPolicy.priorities) == {id}
+    assert a.cluster.claim(id)  # the lease is ours
@@ -0,0 +1,81 @@
+import urllib.request
+
+import pytest
+
+import metrics
+import ratelimit
+from polling import PollingPolicy
+
+
+@pytest.fixture
+def registry():
+  registry = metrics.Registry()
+  yield registry
+  registry.close()
+
+
+class Test_metrics:
+  def test_counter_and_gauge(self, registry):
+    responses = registry.counter("responses_total", "Answers.", labels=("status",))
+    responses.inc(status="200")
+    responses.inc(3, status="429")
+    assert responses.value(status="429") == 3
+    assert responses.value() == 4
+    with pytest.raises(ValueError):
+      responses.inc(code="200")
+    pending = registry.gauge("jobs_pending", "Jobs.")
+    pending.set_function(lambda: 42)
+    assert pending.value() == 42
+    assert registry.counter("responses_total", "Answers.", labels=("status",)) is responses
+
+  def test_histogram_quantiles(self, registry):
+    latency = registry.histogram("latency_seconds", "Latency.", labels=("endpoint",), buckets=(0.1, 0.2, 0.5, 1.0))
+    for _ in range(90):
+      latency.observe(0.05, endpoint="bhftafel")
+    for _ in range(10):
+      latency.observe(0.7, endpoint="traininfo")
+    assert latency.count() == 100
+    assert latency.sum() == pytest.approx(11.5)
+    assert latency.quantile(0.5) <= 0.1
+    assert 0.5 < latency.quantile(0.95) <= 1.0
+    assert latency.quantile(0.5, endpoint="traininfo") > 0.5
+    assert registry.histogram("empty_seconds", "Nothing.").quantile(0.5) is None
+
+  def test_prometheus_format(self, registry):
+    latency = registry.histogram("latency_seconds", "Latency.", labels=("endpoint",), buckets=(0.1, 1.0))
+    latency.observe(0.05, endpoint='bin/"bhftafel"')
+    latency.observe(5, endpoint='bin/"bhftafel"')
+    lines = registry.render().splitlines()
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{endpoint="bin/\\"bhftafel\\"",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="bin/\\"bhftafel\\"",le="+Inf"} 2' in lines
+    assert 'latency_seconds_count{endpoint="bin/\\"bhftafel\\""} 2' in lines
+
+  def test_endpoint(self, registry):
+    registry.counter("polls_total", "Polls.").inc(7)
+    server = registry.serve(port=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    with urllib.request.urlopen(url) as response:
+      assert response.headers["Content-Type"].startswith("text/plain")
+      assert "polls_total 7" in response.read().decode()
+
+  def test_collector_metrics(self):
+    limiter = ratelimit.RateLimiter(budgets={"example.org": (1000, 5)})
+    waits = metrics.RATELIMIT_WAIT.count(host="example.org")
+    limiter.acquire("https://example.org/bin/bhftafel.exe?x=1")
+    assert metrics.RATELIMIT_WAIT.count(host="example.org") == waits + 1
+    assert metrics.endpoint("https://example.org/bin/bhftafel.exe?x=1") == "example.org/bin/bhftafel.exe"
+    line = metrics.summary()
+    assert line.startswith("requests=") and "ratelimit wait=" in line
+
+  def test_polling_gauges(self):
+    policy = PollingPolicy()
+    metrics.POLL_COVERAGE.set_function(lambda: policy.stats()["coverage"])
+    try:
+      assert "collector_poll_coverage_ratio NaN" in metrics.METRICS.render().splitlines()
+      assert "coverage=- " in metrics.summary()
+      policy.covered_stops, policy.finished_stops = 3, 4
+      assert "collector_poll_coverage_ratio 0.75" in metrics.METRICS.render().splitlines()
+      assert "coverage=75% " in metrics.summary()
+    finally:
+      metrics.POLL_COVERAGE.set_function(None)
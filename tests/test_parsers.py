@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+import api
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+STATION_PAGES = sorted(f for f in os.listdir(FIXTURES) if f.startswith("bhftafel_"))
+TRAIN_PAGES = sorted(f for f in os.listdir(FIXTURES) if f.startswith("traininfo_"))
+
+
+def read_fixture(filename):
+  with open(os.path.join(FIXTURES, filename), encoding="utf-8") as file:
+    return file.read()
+
+
+class RecordedStation(api.Station):
+  def __init__(self, html_document, parser):
+    self.recorded = html_document
+    super().__init__(f"recorded-{parser}", check_version=True, parser=parser)  # no shared parse memo
+
+  def get_data(self):
+    return self.recorded
+
+
+class RecordedTrain(api.Train):
+  def __init__(self, html_document, parser):
+    self.recorded = html_document
+    super().__init__(f"recorded-{parser}", parser=parser)
+
+  def get_data(self, url):
+    return self.recorded
+
+
+class Test_parser_equivalence:
+  @pytest.fixture(autouse=True)
+  def needs_lxml(self):
+    pytest.importorskip("lxml")
+
+  @pytest.mark.parametrize("filename", STATION_PAGES)
+  def test_station_pages(self, filename):
+    html_document = read_fixture(filename)
+    reference = RecordedStation(html_document, "html.parser")
+    station = RecordedStation(html_document, "lxml")
+    assert station.data_package == reference.data_package
+    assert station.excess_stations == reference.excess_stations
+    assert station.delayed_causes == reference.delayed_causes
+    assert station.bhftafel_version == reference.bhftafel_version
+
+  @pytest.mark.parametrize("filename", TRAIN_PAGES)
+  def test_train_pages(self, filename):
+    html_document = read_fixture(filename)
+    reference = RecordedTrain(html_document, "html.parser")
+    train = RecordedTrain(html_document, "lxml")
+    assert train.data_package == reference.data_package
+
+
+class Test_station_page:
+  def test_rows_of_other_stations_are_skipped(self):
+    station = RecordedStation(read_fixture("bhftafel_isernhagen.html"), "html.parser")
+    assert [row.train_name for row in station.data_package] == ["S 6", "S 7", "RE 30", "S 6"]
+    assert "Isernhagen Bahnhof" in station.excess_stations
+
+  def test_version(self):
+    station = RecordedStation(read_fixture("bhftafel_isernhagen.html"), "html.parser")
+    station.init()
+    assert station.bhftafel_version == "5.45.DB.R23.12.a"
+
+  def test_two_dates(self):
+    station = RecordedStation(read_fixture("bhftafel_midnight.html"), "html.parser")
+    planed_times = [row.planed_time.strftime("%d.%m.%y %H:%M") for row in station.data_package]
+    assert planed_times == ["18.10.26 23:48", "18.10.26 23:59", "19.10.26 00:12"]
+
+
+def test_unknown_engine():
+  with pytest.raises(ValueError):
+    RecordedTrain("", "regex")
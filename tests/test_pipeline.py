@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import api
+import fingerprint
+from pipeline import ParsePipeline
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(filename):
+  with open(os.path.join(FIXTURES, filename), encoding="utf-8") as file:
+    return file.read()
+
+
+class FixtureStation(api.Station):
+  def get_data(self):
+    return read_fixture("bhftafel_isernhagen.html")
+
+
+class FixtureTrain(api.Train):
+  def get_data(self, url):
+    if url.endswith("missing"):
+      raise ConnectionError("no page")
+    return read_fixture(url.rsplit("/", 1)[-1])
+
+
+@pytest.fixture
+def pipeline():
+  pipeline = ParsePipeline(fetch_workers=4, parse_workers=2, queue_size=2)
+  yield pipeline
+  pipeline.close()
+
+
+class Test_parse_pipeline:
+  def test_same_result_as_parsing_in_process(self, pipeline):
+    fingerprint.TRAIN_MEMO.clear()
+    futures = [pipeline.submit(FixtureTrain(f"pipeline-{index}/{filename}"))
+               for index in range(5) for filename in ("traininfo_s6.html", "traininfo_ice578.html")]
+    reference = api.Train("reference").extract_relevant_data(read_fixture("traininfo_ice578.html"))
+    results = [future.result(timeout=30) for future in futures]
+    assert results[1] == reference
+    assert [run.train_name for run in results[:2]] == ["S 6", "ICE 578"]
+
+  def test_station_side_results(self, pipeline):
+    station = FixtureStation("pipeline-station", check_version=True)
+    board = pipeline.fetch(station)
+    assert [row.train_name for row in board] == ["S 6", "S 7", "RE 30", "S 6"]
+    assert station.data_package is board
+    assert station.bhftafel_version == "5.45.DB.R23.12.a"
+    assert "Isernhagen Bahnhof" in station.excess_stations
+
+  def test_unchanged_page_is_not_parsed_again(self, pipeline):
+    fingerprint.TRAIN_MEMO.clear()
+    first = pipeline.fetch(FixtureTrain("memo/traininfo_s6.html"))
+    assert pipeline.fetch(FixtureTrain("memo/traininfo_s6.html")) is first
+    assert fingerprint.TRAIN_MEMO.hits == 1
+
+  def test_errors(self, pipeline):
+    with pytest.raises(ConnectionError):
+      pipeline.fetch(FixtureTrain("missing"))
+
+  def test_parsers_are_not_forked(self, pipeline):
+    assert pipeline.parsers._mp_context.get_start_method() in ("forkserver", "spawn")
+    station = FixtureStation("pipeline-forkserver", check_version=True)
+    assert len(pipeline.fetch(station)) == 4 and station.bhftafel_version is not None
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from polling import PollingPolicy
+from records import Stop, TrainRun
+
+NOW = datetime(2026, 10, 18, 14, 0)
+
+
+def run(delay=0, stops=6, every=10, canceled=False):
+  route = list()
+  for index in range(stops):
+    planed = NOW + timedelta(minutes=every * index - 5)
+    route.append(Stop(station=f"Station {index}", planed_arr_time=planed, planed_dep_time=planed,
+                      delayed_arr_time=planed + timedelta(minutes=delay) if delay else None,
+                      delayed_dep_time=planed + timedelta(minutes=delay) if delay else None,
+                      canceled=canceled and index == stops - 1))
+  return TrainRun(train_name="ICE 578", train_date=NOW, company="DB Fernverkehr AG", route=route)
+
+
+class Test_polling_policy:
+  def test_priority(self):
+    policy = PollingPolicy()
+    punctual = policy.priority(run(), NOW, NOW - timedelta(minutes=1))
+    assert policy.priority(run(delay=20), NOW, NOW - timedelta(minutes=1)) > punctual
+    assert policy.priority(run(canceled=True), NOW, NOW - timedelta(minutes=1)) > punctual
+    assert policy.priority(run(), NOW, NOW - timedelta(minutes=20)) > punctual
+    assert policy.priority(run(every=60), NOW, NOW - timedelta(minutes=1)) < punctual
+    assert policy.priority(run(), NOW + timedelta(hours=2)) == 0
+
+  def test_budget_is_split_by_priority(self):
+    policy = PollingPolicy(requests_per_hour=120, min_interval=10, max_interval=3600)
+    for _ in range(3):  # the priorities settle once all trains are known and observed
+      for index in range(20):
+        policy.observe(f"regional{index}", run(every=60), NOW)
+      policy.observe("late ICE", run(delay=25, every=60, canceled=True), NOW)
+    assert policy.intervals["late ICE"] < policy.intervals["regional0"] / 2
+    assert abs(policy.stats()["allocatedPerHour"] - 120) < 1
+
+  def test_next_stop_comes_first(self):
+    policy = PollingPolicy(requests_per_hour=1, min_interval=60, max_interval=3600)
+    assert policy.observe("S6", run(), NOW) == NOW + timedelta(minutes=5)
+    assert policy.observe("S6", run(), NOW + timedelta(hours=2)) is None
+
+  def test_coverage(self):
+    policy = PollingPolicy()
+    train = run(stops=4)  # stops at 13:55, 14:05, 14:15, 14:25
+    for minute in (-4, 6, 31):
+      policy.observe("S6", train, NOW + timedelta(minutes=minute))
+    policy.finish("S6", train)
+    stats = policy.stats()
+    assert stats["coverage"] == 0.5 and stats["activeTrains"] == 0 and stats["polls"] == 3
+
+  def test_forget(self):
+    policy = PollingPolicy()
+    policy.observe("S6", run(), NOW)
+    policy.forget("S6")
+    assert policy.stats()["activeTrains"] == 0 and policy.stats()["allocatedPerHour"] == 0
+    assert "S6" not in policy.observations
+    policy.forget("S6")
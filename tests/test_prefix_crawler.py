@@ -0,0 +1,89 @@
+import bisect
+import random
+import threading
+
+from prefix_crawler import ALPHABET, PrefixCrawler
+
+CAP = 12  # suggestions per answer
+
+
+def station_names(count=3000):
+  random.seed(7)
+  syllables = ["ber", "lin", "han", "no", "ver", "isern", "ha", "gen", "dorf", "hau", "sen", "bach", "burg", "heim", "stadt"]
+  names = set()
+  while len(names) < count:
+    name = "".join(random.choice(syllables) for _ in range(random.randint(2, 4)))
+    if random.random() < 0.3:
+      name += random.choice([" hbf", " bf", " süd", " nord"])
+    names.add(name)
+  return sorted(names)
+
+
+class Suggestions:
+  """Answers like ajax-getstop: at most CAP stations starting with the prefix."""
+
+  def __init__(self, names, fail=()):
+    self.names = names
+    self.fail = set(fail)
+    self.requests = 0
+    self._lock = threading.Lock()
+
+  def __call__(self, prefix):
+    with self._lock:
+      self.requests += 1
+      if prefix in self.fail:
+        self.fail.discard(prefix)
+        raise ConnectionError(prefix)
+    start = bisect.bisect_left(self.names, prefix)
+    matches = [index for index in range(start, min(start + CAP, len(self.names))) if self.names[index].startswith(prefix)]
+    return [{"stationName": self.names[index], "stationId": str(index)} for index in matches]
+
+
+class Store:
+  def __init__(self):
+    self.stations = dict()
+
+  def __call__(self, stations):
+    for station in stations:
+      self.stations[station["stationId"]] = station["stationName"]
+
+
+class Test_prefix_crawler:
+  def test_finds_every_station_with_few_requests(self, tmp_path):
+    names = station_names()
+    suggestions, store = Suggestions(names), Store()
+    crawler = PrefixCrawler(suggestions, store, str(tmp_path / "frontier.json"), workers=4)
+    assert crawler.run()
+    assert sorted(store.stations.values()) == names
+    assert crawler.cap == CAP
+    # the old walk needs 28 ** 4 = 614656 requests to get to the prefixes of length 4 alone
+    assert suggestions.requests == crawler.requests < 10 * len(names)
+
+  def test_resumes_from_the_frontier(self, tmp_path):
+    names = station_names(1000)
+    path = str(tmp_path / "frontier.json")
+    store = Store()
+    first = PrefixCrawler(Suggestions(names), store, path, workers=2)
+    assert not first.run(max_requests=100)
+    assert first.pending
+    second = PrefixCrawler(Suggestions(names), store, path, workers=2)
+    assert second.pending == first.pending and second.requests == first.requests
+    assert second.run()
+    assert sorted(store.stations.values()) == names
+    whole = PrefixCrawler(Suggestions(names), Store(), str(tmp_path / "whole.json"), workers=2)
+    whole.run()
+    assert second.requests == whole.requests
+
+  def test_failed_prefixes_are_retried(self, tmp_path):
+    names = station_names(500)
+    store = Store()
+    crawler = PrefixCrawler(Suggestions(names, fail=["b", "ha"]), store, str(tmp_path / "frontier.json"))
+    assert crawler.run()
+    assert crawler.failed == 2
+    assert sorted(store.stations.values()) == names
+
+  def test_children(self, tmp_path):
+    crawler = PrefixCrawler(None, None, str(tmp_path / "frontier.json"), max_depth=3)
+    assert len(crawler.children("ab")) == len(ALPHABET)
+    assert not any(child.endswith((" ", "_")) for child in crawler.children("ab "))
+    assert crawler.children("abc") == []
@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+import time
+
+import profiling
+
+
+def busy_fetch(seconds):
+  end = time.perf_counter() + seconds
+  while time.perf_counter() < end:
+    pass
+
+
+class Test_profiling:
+  def test_stages_are_free_without_profiler(self):
+    assert profiling.PROFILER is None
+    assert profiling.stage("fetch") is profiling.stage("parse")
+    with profiling.stage("fetch"):
+      pass
+    profiling.record("parse", 0.1)  # ignored
+
+  def test_profile_window(self, tmp_path):
+    profiler = profiling.configure(str(tmp_path), duration=30, interval=0.002)
+    try:
+      def worker():
+        for _ in range(5):
+          with profiling.stage("fetch"):
+            busy_fetch(0.02)
+          with profiling.stage("store"):
+            time.sleep(0.005)
+      thread = threading.Thread(target=worker, name="fetch-0")
+      thread.start()
+      thread.join()
+      profiling.record("parse", 0.25)
+    finally:
+      paths = profiling.stop()
+    assert profiling.PROFILER is None
+    assert profiler.stages["fetch"][0] == 5 and profiler.stages["fetch"][1] >= 0.1
+    assert profiler.stages["parse"] == [1, 0.25, 0.25]
+    assert profiler.samples > 0
+    assert sorted(os.path.basename(path).split(".", 1)[1] for path in paths) == ["folded", "speedscope.json", "stages.txt"]
+
+    folded = open(next(path for path in paths if path.endswith(".folded"))).read()
+    assert any(line.startswith("fetch-0;stage:fetch;") and "busy_fetch" in line for line in folded.splitlines())
+    speedscope = json.load(open(next(path for path in paths if path.endswith(".json"))))
+    profile = speedscope["profiles"][0]
+    assert len(profile["samples"]) == len(profile["weights"]) > 0
+    assert all(index < len(speedscope["shared"]["frames"]) for sample in profile["samples"] for index in sample)
+    assert "fetch" in open(next(path for path in paths if path.endswith(".stages.txt"))).read()
+
+  def test_window_ends_by_itself(self, tmp_path):
+    profiler = profiling.configure(str(tmp_path), duration=0.05, sample=False)
+    profiler._thread.join(timeout=5)
+    assert profiling.PROFILER is None
+    assert [os.path.basename(path).endswith(".stages.txt") for path in profiler.paths] == [True]
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import ratelimit
+
+
+class Test_token_bucket:
+  def test_burst_then_rate(self):
+    bucket = ratelimit.TokenBucket(rate=20, burst=5)
+    assert [bucket.reserve() for _ in range(5)] == [0.0] * 5
+    assert abs(bucket.reserve() - 1 / 20) < 0.01
+
+  def test_backoff_and_recovery(self):
+    bucket = ratelimit.TokenBucket(rate=10, burst=10)
+    bucket.feedback(False)
+    bucket.feedback(False)
+    assert bucket.rate == 2.5 and bucket.throttled == 2
+    for _ in range(100):
+      bucket.feedback(True)
+    assert bucket.rate == 10
+
+  def test_retry_after_pauses_the_host(self):
+    bucket = ratelimit.TokenBucket(rate=10, burst=10)
+    bucket.feedback(False, retry_after=2)
+    assert bucket.reserve() > 1.9
+
+  def test_async_callers_dont_block_the_loop(self):
+    bucket = ratelimit.TokenBucket(rate=20, burst=1)
+    ticks = list()
+
+    async def ticker():
+      for _ in range(5):
+        ticks.append(time.monotonic())
+        await asyncio.sleep(0.01)
+
+    async def requests():
+      for _ in range(4):
+        await bucket.acquire_async()
+
+    async def main():
+      start = time.monotonic()
+      await asyncio.gather(ticker(), requests())
+      return time.monotonic() - start
+
+    assert 0.14 < asyncio.run(main()) < 0.5
+    assert len(ticks) == 5
+
+
+class Test_rate_limiter:
+  def test_buckets_per_host(self):
+    limiter = ratelimit.RateLimiter(budgets={"a.example": (1, 1)}, default=(100, 100))
+    assert limiter.bucket("https://a.example/x").budget == 1
+    assert limiter.bucket("https://b.example/y?z=1").budget == 100
+    assert limiter.bucket("https://a.example/other") is limiter.bucket("https://a.example/x")
+
+  def test_feedback(self):
+    limiter = ratelimit.RateLimiter(default=(8, 8))
+    limiter.feedback("https://a.example", 200)
+    limiter.feedback("https://a.example", 429)
+    limiter.feedback("https://a.example", 503)
+    limiter.feedback("https://a.example", 200, empty=True)
+    limiter.feedback("https://a.example")  # connection error
+    assert limiter.stats()["a.example"]["throttled"] == 4
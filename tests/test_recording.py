@@ -0,0 +1,61 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+import api
+import cache
+import http_client
+import recording
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+  monkeypatch.setattr(cache, "RESPONSE_CACHE", cache.ResponseCache(default_ttl=0, ttls={}))
+  yield
+  recording.stop()
+
+
+class Test_replay:
+  def test_station_and_trains_offline(self, no_cache):
+    recording.replay(FIXTURES)
+    station = api.Station("Isernhagen")
+    assert [row.train_name for row in station.data_package] == ["S 6", "S 7", "RE 30", "S 6"]
+    train = api.Train(station.data_package[0].train_url.replace("rt=1", "rt=0"))
+    assert train.data_package.train_name == "S 6"
+
+  def test_unknown_request(self, no_cache):
+    recording.replay(FIXTURES)
+    with pytest.raises(requests.ConnectionError):
+      api.Station("Celle").init()
+
+
+class Test_record:
+  def test_record_then_replay(self, no_cache, tmp_path):
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        body = f"<html>{self.path}</html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/bin/traininfo.exe/dn/1?rt=1"
+    try:
+      recording.record(str(tmp_path))
+      assert http_client.get(url).text == "<html>/bin/traininfo.exe/dn/1?rt=1</html>"
+    finally:
+      server.shutdown()
+
+    recording.replay(str(tmp_path))
+    assert http_client.get(url).text == "<html>/bin/traininfo.exe/dn/1?rt=1</html>"
@@ -0,0 +1,36 @@
+import os
+import pickle
+
+import api
+import records
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def parse_train(filename):
+  with open(os.path.join(FIXTURES, filename), encoding="utf-8") as file:
+    return api.Train("recorded").extract_relevant_data(file.read())
+
+
+class Test_records:
+  def test_to_dict_keeps_the_old_layout(self):
+    train_run = parse_train("traininfo_s6.html")
+    data = train_run.to_dict()
+    assert list(data) == ["company", "trainName", "trainDate", "route"]
+    assert list(data["route"]) == [0, 1, 2, 3]
+    assert data["route"][2]["issues"] == {"canceled": True, "cause": None}
+
+  def test_slots(self):
+    train_run = parse_train("traininfo_s6.html")
+    assert not hasattr(train_run, "__dict__")
+    assert not hasattr(train_run.route[0], "__dict__")
+
+  def test_pickle_roundtrip_is_smaller(self):
+    train_run = parse_train("traininfo_ice578.html")
+    assert pickle.loads(pickle.dumps(train_run)) == train_run
+    assert len(pickle.dumps(train_run)) < len(pickle.dumps(train_run.to_dict()))
+
+  def test_names_are_interned(self):
+    first = records.Stop(station="".join(["Hannover ", "Hbf"]))
+    second = records.Stop(station="".join(["Hannover", " Hbf"]))
+    assert first.station is second.station
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from scheduler import Scheduler
+
+
+def run_for(scheduler, seconds):
+  async def main():
+    asyncio.get_running_loop().call_later(seconds, scheduler.stop)
+    await scheduler.run()
+  asyncio.run(main())
+
+
+class Test_scheduler:
+  def test_order_and_reschedule(self):
+    scheduler = Scheduler()
+    calls = list()
+
+    async def job(name):
+      calls.append(name)
+
+    now = datetime.now()
+    scheduler.add("a", job, "a", run_at=now + timedelta(seconds=0.2))
+    scheduler.add("b", job, "b", run_at=now + timedelta(seconds=0.1))
+    scheduler.add("c", job, "c", run_at=now + timedelta(seconds=0.05))
+    scheduler.add("a", job, "a", run_at=now)  # reschedule
+    scheduler.remove("c")
+    run_for(scheduler, 0.4)
+    assert calls == ["a", "b"]
+    assert len(scheduler) == 0
+
+  def test_recurring_and_blocking_jobs(self):
+    scheduler = Scheduler()
+    threads = list()
+    scheduler.add("station", lambda: threads.append(threading.get_ident()), interval=0.1)
+    run_for(scheduler, 0.55)
+    scheduler.shutdown()
+    assert 4 <= len(threads) <= 6
+    assert threading.get_ident() not in threads
+    assert "station" in scheduler
+
+  def test_job_reschedules_itself_from_a_thread(self):
+    scheduler = Scheduler()
+    calls = list()
+
+    def train():
+      calls.append(datetime.now())
+      if len(calls) < 3:
+        scheduler.add("train", train, run_at=datetime.now() + timedelta(seconds=0.05))
+
+    scheduler.add("train", train)
+    run_for(scheduler, 0.5)
+    scheduler.shutdown()
+    assert len(calls) == 3
+
+  def test_slippage_with_many_jobs(self):
+    scheduler = Scheduler()
+    runs = [0]
+
+    async def job():
+      runs[0] += 1
+
+    start = datetime.now() + timedelta(seconds=0.5)
+    for index in range(50000):
+      scheduler.add(f"train{index}", job, run_at=start + timedelta(seconds=index / 50000), jitter=0.1)
+    run_for(scheduler, 2.5)
+    assert runs[0] == 50000
+    assert scheduler.max_slippage < 1.0
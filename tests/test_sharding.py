@@ -0,0 +1,136 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from records import BoardEntry
+from sharding import Cluster, HashRing, decode_entry, encode_entry
+
+fakeredis = pytest.importorskip("fakeredis")
+
+KEYS = [f"ICE{number}Hamburg-Altona2026-10-1814:{number % 60:02}:00" for number in range(3000)]
+
+
+@pytest.fixture
+def server():
+  return fakeredis.FakeServer()
+
+
+def node(server, name, **options):
+  return Cluster(fakeredis.FakeRedis(server=server, decode_responses=True), node_id=name, **options)
+
+
+class Test_hash_ring:
+  def test_balanced(self):
+    ring = HashRing(["a", "b", "c"])
+    counts = {name: 0 for name in "abc"}
+    for key in KEYS:
+      counts[ring.owner(key)] += 1
+    assert all(700 < count < 1300 for count in counts.values())
+
+  def test_join_moves_only_the_new_share(self):
+    before, after = HashRing(["a", "b", "c"]), HashRing(["a", "b", "c", "d"])
+    moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+    assert all(after.owner(key) == "d" for key in moved)
+    assert len(moved) < len(KEYS) / 3
+
+  def test_empty(self):
+    assert HashRing().owner("S 6") is None
+
+
+class Test_cluster:
+  def test_every_key_has_one_owner(self, server):
+    nodes = [node(server, name) for name in "abc"]
+    for cluster in nodes:
+      cluster.heartbeat(now=100)
+    assert nodes[0].heartbeat(now=101) is True
+    assert nodes[0].members() == {"a", "b", "c"}
+    for key in KEYS[:300]:
+      assert sum(cluster.claim(key) for cluster in nodes) == 1
+
+  def test_dead_node_is_taken_over(self, server):
+    a, b = node(server, "a", ttl=15), node(server, "b", ttl=15)
+    a.heartbeat(now=100)
+    b.heartbeat(now=100)
+    a.heartbeat(now=100)
+    b_keys = [key for key in KEYS if b.owns(key)]
+    assert b_keys and not any(a.owns(key) for key in b_keys)
+    assert a.heartbeat(now=110) is False  # b is still alive
+    assert a.heartbeat(now=120) is True
+    assert a.members() == {"a"}
+    assert all(a.owns(key) for key in b_keys)
+
+  def test_lease_prevents_double_polls(self, server):
+    a, b = node(server, "a"), node(server, "b")
+    a.heartbeat(now=100)
+    key = KEYS[0]
+    assert a.claim(key)
+    assert a.claim(key)  # renewed
+    b.heartbeat(now=100)  # b sees both nodes, a doesn't know about b yet
+    b.ring = HashRing(["b"])  # b thinks it owns the key
+    assert not b.claim(key)
+    a.release(key)
+    assert b.claim(key)
+    a.release(key)  # not a's lease anymore
+    assert not a.claim(key)
+
+  def test_registry(self, server):
+    a, b = node(server, "a"), node(server, "b")
+    a.heartbeat(now=100)
+    b.heartbeat(now=100)
+    a.heartbeat(now=100)
+    for number, key in enumerate(KEYS[:50]):
+      a.register(key, BoardEntry(planed_time=None, train_name=f"ICE {number}", train_url=f"https://example.org/{number}",
+                                 transportation_type="ICE", endstation="Hamburg-Altona"))
+    owned_a, owned_b = a.trains(), b.trains()
+    assert set(owned_a) | set(owned_b) == set(KEYS[:50])
+    assert not set(owned_a) & set(owned_b)
+    assert owned_a[next(iter(owned_a))].train_url.startswith("https://example.org/")
+    a.unregister(*KEYS[:50])
+    assert a.trains() == {}
+
+  def test_leave(self, server):
+    a, b = node(server, "a"), node(server, "b")
+    a.heartbeat(now=100)
+    b.heartbeat(now=100)
+    a.heartbeat(now=100)
+    b.leave()
+    assert a.heartbeat(now=101) is True
+    assert a.members() == {"a"}
+
+  def test_inbox(self, server):
+    a, b = node(server, "a"), node(server, "b")
+    a.heartbeat(now=100)
+    b.heartbeat(now=100)
+    a.heartbeat(now=100)
+    for number, key in enumerate(KEYS[:50]):
+      a.register(key, BoardEntry(planed_time=None, train_name=f"ICE {number}", train_url=f"https://example.org/{number}",
+                                 transportation_type="ICE", endstation="Hamburg-Altona"))
+    assert a.inbox() == {}  # a knows its trains already
+    found = b.inbox()
+    assert set(found) == set(key for key in KEYS[:50] if b.owns(key)) != set()
+    assert b.inbox() == {}
+    id = next(iter(found))
+    a.register(id, found[id])
+    a.unregister(*KEYS[:50])
+    assert b.inbox() == {}  # finished meanwhile
+
+  def test_registered_once(self, server):
+    a, b = node(server, "a"), node(server, "b")
+    a.heartbeat(now=100)
+    b.heartbeat(now=100)
+    a.heartbeat(now=100)
+    key = next(key for key in KEYS if b.owns(key))
+    train = BoardEntry(planed_time=datetime(2026, 10, 18, 14, 0), train_name="ICE 578", train_url="https://example.org/578",
+                       transportation_type="ICE", endstation="Hamburg-Altona", platform_number="4",
+                       partial_route=[("Hannover Hbf", datetime(2026, 10, 18, 14, 0)), ("Hamburg-Altona", datetime(2026, 10, 18, 15, 30))],
+                       delayed_time=datetime(2026, 10, 18, 14, 5), delayed_by=timedelta(minutes=5), cause="Bauarbeiten")
+    for _ in range(5):  # every poll of the board
+      a.register(key, train)
+    assert a.client.llen("collector:inbox:b") == 1
+    assert b.inbox() == {key: train}
+    assert json.loads(a.client.hget("collector:trains", key))["trainName"] == "ICE 578"  # no pickle
+
+  def test_entry_encoding(self):
+    train = BoardEntry(planed_time=None, train_name="S 6", train_url="", transportation_type="s", endstation="Celle", canceled=True)
+    assert decode_entry(json.loads(json.dumps(encode_entry(train)))) == train
@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import diff
+from records import Stop, TrainRun
+from writebehind import WriteBehind
+
+DEPARTURE = datetime(2026, 10, 18, 14, 0)
+
+
+def run(name):
+  route = [Stop(station=station, planed_arr_time=DEPARTURE + timedelta(minutes=10 * index))
+           for index, station in enumerate(["Isernhagen", "Langenhagen", "Hannover Hbf"])]
+  return TrainRun(train_name=name, train_date=DEPARTURE, company="DB Regio AG", route=route)
+
+
+def count(path, table):
+  with sqlite3.connect(path) as connection:
+    return connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+class Test_write_behind:
+  def test_flush_on_size(self, tmp_path):
+    path = str(tmp_path / "connections.sql")
+    flushed = list()
+    writer = WriteBehind(path, max_runs=10, max_delay=60, on_flushed=flushed.extend)
+    for index in range(25):
+      writer.put(f"S{index}", run(f"S {index}"), diff.diff(None, run(f"S {index}")))
+    deadline = time.monotonic() + 2
+    while len(flushed) < 20 and time.monotonic() < deadline:
+      time.sleep(0.01)
+    assert len(flushed) >= 20 and len(writer) <= 5
+    writer.close()
+    assert sorted(flushed) == sorted(f"S{index}" for index in range(25))
+    assert count(path, "trainRuns") == 25
+    assert count(path, "stops") == 75
+    assert count(path, "events") == 25 * len(diff.diff(None, run("S 1")))
+
+  def test_flush_on_time(self, tmp_path):
+    path = str(tmp_path / "connections.sql")
+    writer = WriteBehind(path, max_runs=1000, max_delay=0.1)
+    writer.put("S6", run("S 6"), [])
+    time.sleep(0.4)
+    assert len(writer) == 0 and writer.written == 1
+    writer.close()
+
+  def test_locked_database_and_idempotence(self, tmp_path):
+    path = str(tmp_path / "connections.sql")
+    writer = WriteBehind(path, max_runs=1000, max_delay=60)
+    writer.put("S6", run("S 6"), diff.diff(None, run("S 6")))
+
+    blocker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.2, blocker.rollback).start()
+    assert writer.flush() == 1  # retried until the lock is gone
+
+    writer.put("S6", run("S 6"), diff.diff(None, run("S 6")))  # the same train again
+    writer.close()
+    assert count(path, "trainRuns") == 1
+    assert count(path, "events") == len(diff.diff(None, run("S 6")))
+
+  def test_errors_dont_stop_the_thread(self, tmp_path):
+    path = str(tmp_path / "connections.sql")
+    writer = WriteBehind(path, max_runs=1000, max_delay=0.05)
+    connection = writer.connection
+
+    class FailingConnection:
+      """The database of the writer, the first two writes fail like a full disk."""
+      failures = 2
+
+      def __enter__(self):
+        return connection.__enter__()
+
+      def __exit__(self, *exc_info):
+        return connection.__exit__(*exc_info)
+
+      def executemany(self, *args):
+        if FailingConnection.failures:
+          FailingConnection.failures -= 1
+          raise sqlite3.OperationalError("database or disk is full")
+        return connection.executemany(*args)
+
+      def close(self):
+        connection.close()
+
+    writer.connection = FailingConnection()
+    writer.put("S6", run("S 6"), [])
+    deadline = time.monotonic() + 5
+    while writer.written == 0 and time.monotonic() < deadline:
+      time.sleep(0.01)
+    assert FailingConnection.failures == 0 and writer._thread.is_alive()
+    assert writer.written == 1 and len(writer) == 0
+    writer.put("S7", run("S 7"), [])
+    writer.close()
+    assert count(path, "trainRuns") == 2